@@ -21,14 +21,25 @@ from flask import Flask
 from flask.json.provider import DefaultJSONProvider
 
 from backend_config.settings import ProdConfig, DevConfig, Config, LOGGING_CONFIG
+from backend_src.compact_storage import register_storage_layout
 from backend_src.errorhandlers import handle_invalid_usage, unauthorized_response
 from backend_src.exceptions import APIError
+from backend_src.executor.pool import register_executor
+from backend_src.executor.routes import executor_blueprint
 from backend_src.extensions import db, ma, flask_bcrypt, jwt
+from backend_src.job.routes import job_blueprint
+from backend_src.metrics.instrumentation import register_metrics
+from backend_src.metrics.routes import metrics_blueprint, slow_query_blueprint
+from backend_src.metrics.slow_queries import register_slow_query_log
 from backend_src.models import prepare_database
+from backend_src.read_replicas import register_read_replicas
+from backend_src.sharding import register_shards
 from backend_src.sensor.routes import sensor_blueprint
 from backend_src.station.routes import station_blueprint
 from backend_src.temp_humidity_sensor.routes import temp_humidity_sensor_blueprint
 from backend_src.user.routes import user_blueprint
+from backend_src.weatherdata.admission import register_query_admission
+from backend_src.weatherdata.backpressure import register_ingest_monitor
 from backend_src.weatherdata.routes import weatherdata_blueprint
 
 
@@ -50,7 +61,15 @@ def create_app(config_object: Config = ProdConfig()):
     dictConfig(LOGGING_CONFIG)
     app.config.from_object(config_object)
 
+    register_metrics(app)
+    register_read_replicas(app)
+    register_shards(app)
+    register_executor(app)
+    register_query_admission(app)
+    register_ingest_monitor(app)
     register_extensions(app)
+    register_storage_layout(app)
+    register_slow_query_log(app)
     register_blueprints(app)
     register_errorhandlers(app)
 
@@ -70,6 +89,10 @@ def register_blueprints(app):
     app.register_blueprint(sensor_blueprint)
     app.register_blueprint(temp_humidity_sensor_blueprint)
     app.register_blueprint(station_blueprint)
+    app.register_blueprint(job_blueprint)
+    app.register_blueprint(executor_blueprint)
+    app.register_blueprint(metrics_blueprint)
+    app.register_blueprint(slow_query_blueprint)
 
 
 def register_errorhandlers(app):
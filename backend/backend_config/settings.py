@@ -25,6 +25,71 @@ class Config(object):
     DB_PORT = os.environ.get('DB_PORT', 5432)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     BCRYPT_LOG_ROUNDS = 13
+    # number of (station, month) work units of a data query running concurrently, needs to fit into the connection pool
+    QUERY_PARALLELISM = int(os.environ.get('QUERY_PARALLELISM', 4))
+    # shorter data queries (after clipping to the available data) are not split into work units but run as one statement
+    QUERY_SPLIT_MIN_PERIOD_IN_DAYS = int(os.environ.get('QUERY_SPLIT_MIN_PERIOD_IN_DAYS', 62))
+    # pause between the (monthly) slices of a deletion job to leave room for the ingest and query requests
+    DELETION_SLICE_PAUSE_IN_SEC = float(os.environ.get('DELETION_SLICE_PAUSE_IN_SEC', 0.5))
+    # running jobs without any progress within this period are marked as failed on startup as their instance has stopped
+    JOB_ORPHAN_PERIOD_IN_SEC = int(os.environ.get('JOB_ORPHAN_PERIOD_IN_SEC', 900))
+    # stores the weather data as scaled integers, existing databases are migrated on startup
+    COMPACT_STORAGE = os.environ.get('COMPACT_STORAGE', 'false').lower() == 'true'
+    # local directory or object store URI (such as `gs://bucket/archive`) of the Parquet archive of the old data,
+    # archiving into files is disabled if not set
+    ARCHIVE_PATH = os.environ.get('ARCHIVE_PATH', '')
+    # `parquet` for files within the archive path or `blocks` for compressed time-series blocks within the database
+    ARCHIVE_FORMAT = os.environ.get('ARCHIVE_FORMAT', 'parquet')
+    # closed months older than this are moved into the archive
+    ARCHIVE_AGE_IN_MONTHS = int(os.environ.get('ARCHIVE_AGE_IN_MONTHS', 24))
+    # `duckdb` runs long-range queries on a columnar snapshot of the data within the local directory of the snapshots,
+    # all queries are running on PostgreSQL if not set
+    ANALYTICS_ENGINE = os.environ.get('ANALYTICS_ENGINE', '')
+    ANALYTICS_SNAPSHOT_PATH = os.environ.get('ANALYTICS_SNAPSHOT_PATH', '')
+    # queries of shorter time periods are always running on PostgreSQL
+    ANALYTICS_MIN_PERIOD_IN_DAYS = int(os.environ.get('ANALYTICS_MIN_PERIOD_IN_DAYS', 90))
+    # comma-separated database URIs of the read replicas of the weather database, the read requests are distributed
+    # round-robin over the healthy replicas (or are served by the primary database if no replica is available)
+    READ_REPLICA_URIS = [uri for uri in os.environ.get('READ_REPLICA_URIS', '').split(',') if uri]
+    # a replica is checked again after this period, an unavailable replica is skipped during this period
+    READ_REPLICA_HEALTH_CHECK_PERIOD_IN_SEC = float(os.environ.get('READ_REPLICA_HEALTH_CHECK_PERIOD_IN_SEC', 10))
+    # the reads of a client following its own write within this period are only served by replicas that have replayed
+    # the write
+    READ_YOUR_WRITES_PERIOD_IN_SEC = int(os.environ.get('READ_YOUR_WRITES_PERIOD_IN_SEC', 300))
+    # comma-separated database URIs of the additional shards of the weather data, the data of each station is stored
+    # within the shard assigned to it (the weather database itself is the first shard and contains all other data)
+    SHARD_URIS = [uri for uri in os.environ.get('SHARD_URIS', '').split(',') if uri]
+    # `thread` or `process` pool running the CPU-bound steps of the requests (password hashing, decompression, reshaping
+    # of the queried data) outside of the event loop of the single gevent worker, they are blocking it if not set
+    OFFLOAD_EXECUTOR = os.environ.get('OFFLOAD_EXECUTOR', 'thread')
+    OFFLOAD_NUM_WORKERS = int(os.environ.get('OFFLOAD_NUM_WORKERS', 2))
+    # the cost of a data query is estimated as number of read values (datasets times sensors), assuming datasets
+    # recorded continuously with this interval
+    DATASET_INTERVAL_IN_SEC = int(os.environ.get('DATASET_INTERVAL_IN_SEC', 600))
+    # queries above the budget are routed to the analytics snapshot or are rejected if there is none, 0 for no budget
+    # (the frontend is not retrying rejected queries, enable only for backends serving other clients)
+    QUERY_COST_BUDGET = int(os.environ.get('QUERY_COST_BUDGET', 0))
+    # queries above this cost are expensive, only a limited number of them are running concurrently in each worker
+    EXPENSIVE_QUERY_COST = int(os.environ.get('EXPENSIVE_QUERY_COST', 500000))
+    MAX_CONCURRENT_EXPENSIVE_QUERIES = int(os.environ.get('MAX_CONCURRENT_EXPENSIVE_QUERIES', 2))
+    # an expensive query is rejected if no slot is available within this time
+    EXPENSIVE_QUERY_WAIT_IN_SEC = float(os.environ.get('EXPENSIVE_QUERY_WAIT_IN_SEC', 10))
+    # proposed waiting time of the clients for rejected queries
+    QUERY_RETRY_AFTER_IN_SEC = int(os.environ.get('QUERY_RETRY_AFTER_IN_SEC', 30))
+    # new datasets are rejected while this number of ingest requests is pending in the worker or while the commits of
+    # the datasets are taking longer on average (only a single ingest is admitted at a time then)
+    MAX_PENDING_INGESTS = int(os.environ.get('MAX_PENDING_INGESTS', 20))
+    MAX_INGEST_COMMIT_LATENCY_IN_SEC = float(os.environ.get('MAX_INGEST_COMMIT_LATENCY_IN_SEC', 5))
+    # proposed waiting time of the stations for rejected ingests
+    INGEST_RETRY_AFTER_IN_SEC = int(os.environ.get('INGEST_RETRY_AFTER_IN_SEC', 30))
+    # statements on the weather databases running longer are kept in the slow query log (the latest entries up to the
+    # size of the log), 0 for no slow query log
+    SLOW_QUERY_THRESHOLD_IN_SEC = float(os.environ.get('SLOW_QUERY_THRESHOLD_IN_SEC', 1.0))
+    SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', 100))
+    # fraction of the slow `SELECT` statements executed again with `EXPLAIN (ANALYZE, BUFFERS)` to capture their plan
+    SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_SAMPLE_RATE', 0.1))
+    # bearer token Prometheus has to send for scraping `/metrics`, the endpoint is disabled if none is configured
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
     TIMEZONE = os.environ.get('TIMEZONE', 'Europe/Berlin')
     SQLALCHEMY_ENGINE_OPTIONS = {
         'connect_args': {
@@ -51,6 +116,8 @@ class ProdConfig(Config):
         'weather-data': ''
     }
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=1)
+    # the stations are logging in again with the password only after the refresh token has expired
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
 
     def __init__(self):
         if 'RUNNING_ON_SERVER' in os.environ:
@@ -199,6 +266,8 @@ class TestConfig(Config):
     JWT_HEADER_TYPE = 'Bearer'
     JWT_BLACKLIST_ENABLED = False
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=1)
+    DELETION_SLICE_PAUSE_IN_SEC = 0
+    METRICS_TOKEN = 'METRICS-TOKEN'
 
 
 LOGGING_CONFIG = {
@@ -0,0 +1,201 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from typing import Dict, List
+
+from flask import current_app
+from sqlalchemy import TypeDecorator
+
+from .extensions import db
+
+# number of decimals stored for each quantity in the compact storage layout, the stations provide at most this precision
+COMPACT_STORAGE_DECIMALS = {
+    'pressure': 1,
+    'uv': 1,
+    'rain_counter': 1,
+    'direction': 1,
+    'speed': 1,
+    'wind_temperature': 2,
+    'gusts': 1,
+    'temperature': 2,
+    'humidity': 1
+}
+
+# quantities whose scaled values can exceed the range of a `smallint`
+COMPACT_STORAGE_LARGE_QUANTITIES = ['rain_counter']
+
+COMPACT_COLUMN_SUFFIX = '_compact'
+MIGRATION_BATCH_SIZE = 10000
+
+
+def is_compact_storage_enabled() -> bool:
+    return current_app.config.get('COMPACT_STORAGE', False)
+
+
+def register_storage_layout(app) -> None:
+    """
+    Binds the configured storage layout to the engines of the weather data (the bind, the read replicas and the
+    shards), the values are therefore converted the same way in all threads, greenlets and scripts
+    """
+    with app.app_context():
+        engines = [db.engines['weather-data']]
+    engines += [replica.engine for replica in app.extensions['read_replicas'].replicas]
+    engines += app.extensions['weather_data_shards']
+
+    for engine in engines:
+        bind_storage_layout(engine, app.config.get('COMPACT_STORAGE', False))
+
+
+def bind_storage_layout(engine, is_compact_storage: bool) -> None:
+    """
+    Binds the storage layout to an engine which is created outside of the app
+    """
+    engine.dialect.is_compact_storage = is_compact_storage
+
+
+class CompactFloat(TypeDecorator):
+    """
+    Floating point value stored as integer scaled by the precision of the quantity if the compact storage layout is
+    bound to the engine, otherwise as double precision
+    """
+    impl = db.Float
+    cache_ok = True
+
+    def __init__(self, quantity: str):
+        super().__init__()
+        self.quantity = quantity
+        self.scale = 10 ** COMPACT_STORAGE_DECIMALS[quantity]
+
+    def load_dialect_impl(self, dialect):
+        if not _is_compact_storage(dialect):
+            return dialect.type_descriptor(db.Float())
+        return dialect.type_descriptor(get_compact_type(self.quantity))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or not _is_compact_storage(dialect):
+            return value
+        return round(value * self.scale)
+
+    def process_result_value(self, value, dialect):
+        if value is None or not _is_compact_storage(dialect):
+            return value
+        return value / self.scale
+
+
+def get_compact_type(quantity: str):
+    return db.Integer() if quantity in COMPACT_STORAGE_LARGE_QUANTITIES else db.SmallInteger()
+
+
+def migrate_to_compact_storage(engine, table: db.Table) -> None:
+    """
+    Converts the double precision columns of the table into the compact storage layout while the table stays available
+    for reading and writing: the new columns are kept in sync by a trigger during the backfill in small batches and are
+    finally swapped in within a short transaction
+    """
+    columns_to_migrate = _get_columns_to_migrate(engine, table)
+    if not columns_to_migrate:
+        return
+
+    current_app.logger.info('Migrating the columns [{}] of table \'{}\' to the compact storage layout'
+                            .format(', '.join(columns_to_migrate.keys()), table.name))
+
+    sync_function = '{}_compact_storage_sync'.format(table.name)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(db.text('ALTER TABLE {} {}'.format(table.name, ', '.join(
+            'ADD COLUMN IF NOT EXISTS "{}{}" {}'
+            .format(name, COMPACT_COLUMN_SUFFIX, get_compact_type(quantity).compile(engine.dialect))
+            for name, quantity in columns_to_migrate.items()))))
+
+        connection.execute(db.text('CREATE OR REPLACE FUNCTION {}() RETURNS trigger AS $$ BEGIN {} RETURN NEW; END $$ '
+                                   'LANGUAGE plpgsql'.format(sync_function, ' '.join(
+                                       'NEW."{0}{1}" := round(NEW."{0}" * {2});'
+                                       .format(name, COMPACT_COLUMN_SUFFIX, 10 ** COMPACT_STORAGE_DECIMALS[quantity])
+                                       for name, quantity in columns_to_migrate.items()))))
+        connection.execute(db.text('DROP TRIGGER IF EXISTS {0} ON {1}'.format(sync_function, table.name)))
+        connection.execute(db.text('CREATE TRIGGER {0} BEFORE INSERT OR UPDATE ON {1} FOR EACH ROW '
+                                   'EXECUTE FUNCTION {0}()'.format(sync_function, table.name)))
+
+        _backfill_in_batches(connection, table, columns_to_migrate)
+
+    with engine.begin() as connection:
+        connection.execute(db.text('DROP TRIGGER {} ON {}'.format(sync_function, table.name)))
+        connection.execute(db.text('ALTER TABLE {} {}'.format(table.name, ', '.join(
+            'DROP COLUMN "{}"'.format(name) for name in columns_to_migrate))))
+        for name in columns_to_migrate:
+            connection.execute(db.text('ALTER TABLE {0} RENAME COLUMN "{1}{2}" TO "{1}"'
+                                       .format(table.name, name, COMPACT_COLUMN_SUFFIX)))
+        connection.execute(db.text('DROP FUNCTION {}()'.format(sync_function)))
+
+
+def verify_storage_layout(engine, table: db.Table) -> None:
+    """
+    Raises if the table is stored in the compact layout although it is not enabled, the values would be misinterpreted
+    """
+    column_types = _get_column_types(engine, table)
+    compact_columns = [column.name for column in table.c
+                       if isinstance(column.type, CompactFloat) and column_types.get(column.name) != 'double precision']
+    if compact_columns:
+        raise RuntimeError('The table \'{}\' is stored in the compact storage layout, set `COMPACT_STORAGE` to read it'
+                           .format(table.name))
+
+
+def _is_compact_storage(dialect):
+    # guessing the layout would silently read and write scaled values as if they were real ones
+    is_compact_storage = getattr(dialect, 'is_compact_storage', None)
+    if is_compact_storage is None:
+        raise RuntimeError('No storage layout is bound to the engine, it needs to be registered for the app')
+
+    return is_compact_storage
+
+
+def _get_columns_to_migrate(engine, table) -> Dict[str, str]:
+    column_types = _get_column_types(engine, table)
+    return {column.name: column.type.quantity for column in table.c
+            if isinstance(column.type, CompactFloat) and column_types.get(column.name) == 'double precision'}
+
+
+def _get_column_types(engine, table) -> Dict[str, str]:
+    with engine.connect() as connection:
+        column_types = connection.execute(db.text('SELECT column_name, data_type FROM information_schema.columns '
+                                                  'WHERE table_name = :table_name'),
+                                          {'table_name': table.name}).all()
+    return {column_name: data_type for column_name, data_type in column_types}
+
+
+def _backfill_in_batches(connection, table, columns_to_migrate):
+    primary_key = [column.name for column in table.primary_key.columns]
+    primary_key_str = ', '.join('"{}"'.format(name) for name in primary_key)
+    set_str = ', '.join('"{0}{1}" = round("{0}" * {2})'.format(name, COMPACT_COLUMN_SUFFIX,
+                                                               10 ** COMPACT_STORAGE_DECIMALS[quantity])
+                        for name, quantity in columns_to_migrate.items())
+
+    last_key: List = []
+    while True:
+        key_condition = ''
+        parameters = {'batch_size': MIGRATION_BATCH_SIZE}
+        if last_key:
+            key_condition = 'WHERE ({}) > ({})'.format(primary_key_str, ', '.join(
+                ':key_{}'.format(index) for index in range(len(last_key))))
+            parameters.update({'key_{}'.format(index): value for index, value in enumerate(last_key)})
+
+        # each batch is committed separately to keep the row locks short
+        updated_keys = connection.execute(db.text(
+            'UPDATE {0} SET {1} WHERE ({2}) IN (SELECT {2} FROM {0} {3} ORDER BY {2} LIMIT :batch_size) '
+            'RETURNING {2}'.format(table.name, set_str, primary_key_str, key_condition)), parameters).all()
+        if not updated_keys:
+            break
+
+        last_key = list(max(tuple(key) for key in updated_keys))
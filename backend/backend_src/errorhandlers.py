@@ -26,6 +26,8 @@ def handle_invalid_usage(error):
     response.status_code = error.status_code
     if error.location:
         response.headers['location'] = error.location
+    if error.retry_after is not None:
+        response.headers['Retry-After'] = str(error.retry_after)
     current_app.logger.error('HTTP-Statuscode {}: {}'.format(error.status_code, error.to_dict(hide_details=False)))
 
     return response
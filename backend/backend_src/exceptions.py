@@ -17,13 +17,14 @@
 class APIError(Exception):
     status_code = 400
 
-    def __init__(self, message, status_code=None, payload=None, location=None):
+    def __init__(self, message, status_code=None, payload=None, location=None, retry_after=None):
         Exception.__init__(self)
         self.message = message
         if status_code is not None:
             self.status_code = status_code
         self.payload = payload
         self.location = location
+        self.retry_after = retry_after
 
     def to_dict(self, hide_details=True):
         if hide_details and 500 <= self.status_code < 600:
@@ -0,0 +1,119 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+from typing import Callable, Optional
+
+from flask import current_app, has_app_context
+from gevent import get_hub
+from gevent.threadpool import ThreadPool
+
+
+class ExecutorKind(Enum):
+    # the work is running within the greenlet, blocking all other requests of the worker
+    INLINE = ''
+    # native threads, suited for work releasing the GIL (such as `bcrypt`, `zlib` and most of `pandas`)
+    THREAD = 'thread'
+    # separate processes, the arguments and results are required to be picklable
+    PROCESS = 'process'
+
+
+class OffloadExecutor(object):
+    """
+    Pool running CPU-bound work outside of the event loop, the calling greenlet waits while the other greenlets keep
+    running
+    """
+
+    def __init__(self, kind: ExecutorKind, num_workers: int):
+        self.kind = kind
+        self.num_workers = num_workers
+        self.num_pending = 0
+        self.num_completed = 0
+        self._hub = None
+        self._thread_pool = None
+        self._process_pool = None
+
+    @property
+    def queue_depth(self) -> int:
+        return max(self.num_pending - self.num_workers, 0)
+
+    def run(self, function: Callable, *args):
+        if self.kind == ExecutorKind.INLINE or not self._is_in_pool_thread():
+            return function(*args)
+
+        self.num_pending += 1
+        try:
+            if self.kind == ExecutorKind.THREAD:
+                return self._get_thread_pool().apply(function, args)
+
+            future = self._get_process_pool().submit(function, *args)
+            # waiting for the result on a native thread keeps the event loop running
+            return get_hub().threadpool.apply(future.result)
+        finally:
+            self.num_pending -= 1
+            self.num_completed += 1
+
+    def get_stats(self) -> dict:
+        return {
+            'kind': self.kind.value or 'inline',
+            'num_workers': self.num_workers,
+            'num_pending': self.num_pending,
+            'queue_depth': self.queue_depth,
+            'num_completed': self.num_completed
+        }
+
+    def _is_in_pool_thread(self):
+        # the pools can only be used from the thread of the event loop that has created them
+        if self._hub is None:
+            self._hub = get_hub()
+        return self._hub is get_hub()
+
+    def _get_thread_pool(self):
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPool(self.num_workers)
+        return self._thread_pool
+
+    def _get_process_pool(self):
+        if self._process_pool is None:
+            # forking a process with a running event loop (and monkey-patched modules) is unsafe
+            self._process_pool = ProcessPoolExecutor(self.num_workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._process_pool
+
+
+def register_executor(app) -> None:
+    app.extensions['offload_executor'] = OffloadExecutor(ExecutorKind(app.config.get('OFFLOAD_EXECUTOR', '')),
+                                                         app.config.get('OFFLOAD_NUM_WORKERS', 1))
+
+
+def get_executor() -> Optional[OffloadExecutor]:
+    if not has_app_context():
+        return None
+
+    return current_app.extensions.get('offload_executor')
+
+
+def run_offloaded(function: Callable, *args):
+    """
+    Runs `function(*args)` on the worker pool of the app (or directly without app), the calling greenlet is waiting
+    for the result
+    """
+    executor = get_executor()
+    if executor is None:
+        return function(*args)
+
+    return executor.run(function, *args)
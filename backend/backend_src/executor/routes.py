@@ -0,0 +1,37 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from http import HTTPStatus
+
+from flask import Blueprint, jsonify, current_app
+
+from .pool import get_executor
+from ..utils import with_rollback_and_raise_exception, access_level_required, Role
+
+executor_blueprint = Blueprint('executor', __name__, url_prefix='/api/v1/executor')
+
+
+@executor_blueprint.route('', methods=['GET'])
+@access_level_required(Role.ADMIN)
+@with_rollback_and_raise_exception
+def get_executor_stats():
+    stats = get_executor().get_stats()
+
+    response = jsonify(stats)
+    response.status_code = HTTPStatus.OK
+    current_app.logger.info('Provided the statistics of the worker pool ({} pending)'.format(stats['num_pending']))
+
+    return response
@@ -14,13 +14,53 @@
 #   You should have received a copy of the GNU Affero General Public License
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from flask import g, has_app_context
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
 from flask_marshmallow import Marshmallow
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import inspect
+from sqlalchemy.sql.util import find_tables
 
 
-db = SQLAlchemy()
+# tables containing the data of a station, they are stored within the shard of the station
+SHARDED_TABLE_NAMES = {'weather_dataset', 'temp_humidity_sensor_data', 'wide_temp_humidity_sensor_data',
+                       'latest_weather_dataset', 'archived_file', 'compressed_block'}
+
+
+class WeatherDataSession(Session):
+    """
+    Session writing and reading the data of the stations within the shard chosen for the current operation and reading
+    the weather data from the read replica chosen for the current request (if any)
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or not has_app_context() or engine is not self._db.engines['weather-data']:
+            return engine
+
+        if g.get('weather_data_shard_engine') is not None and _is_sharded(mapper, clause):
+            return g.weather_data_shard_engine
+
+        if g.get('weather_data_read_engine') is not None:
+            return g.weather_data_read_engine
+
+        return engine
+
+
+def _is_sharded(mapper, clause):
+    if mapper is not None:
+        tables = [inspect(mapper).local_table]
+    elif clause is not None:
+        tables = find_tables(clause, include_joins=True, include_crud=True)
+    else:
+        return False
+
+    return any(getattr(table, 'name', None) in SHARDED_TABLE_NAMES for table in tables)
+
+
+db = SQLAlchemy(session_options={'class_': WeatherDataSession})
 ma = Marshmallow()
 flask_bcrypt = Bcrypt()
 jwt = JWTManager()
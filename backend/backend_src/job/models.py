@@ -0,0 +1,45 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from dataclasses import dataclass
+from datetime import datetime
+from enum import Enum
+
+from sqlalchemy.orm import Mapped
+
+from ..extensions import db
+
+
+class JobStatus(Enum):
+    RUNNING = 0
+    FINISHED = 1
+    FAILED = 2
+
+
+@dataclass
+class Job(db.Model):
+    __bind_key__ = 'weather-data'
+
+    id: Mapped[int] = db.Column(db.Integer, primary_key=True)
+
+    description: Mapped[str] = db.Column(db.String(255), nullable=False)
+    status: Mapped[str] = db.Column(db.String(10), nullable=False)
+    progress_in_percent: Mapped[float] = db.Column(db.Float, nullable=False, default=0)
+    num_deleted_datasets: Mapped[int] = db.Column(db.Integer, nullable=False, default=0)
+    error: Mapped[str] = db.Column(db.String(255), nullable=True)
+    created_at: Mapped[datetime] = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
+    updated_at: Mapped[datetime] = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now(),
+                                             onupdate=db.func.now())
@@ -0,0 +1,41 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from http import HTTPStatus
+
+from flask import Blueprint, jsonify, current_app
+
+from .models import Job
+from ..exceptions import APIError
+from ..extensions import db
+from ..utils import with_rollback_and_raise_exception, access_level_required, Role, convert_to_int
+
+job_blueprint = Blueprint('job', __name__, url_prefix='/api/v1/job')
+
+
+@job_blueprint.route('/<job_id>', methods=['GET'])
+@access_level_required(Role.ADMIN)
+@with_rollback_and_raise_exception
+def get_job_status(job_id):
+    job = db.session.get(Job, convert_to_int(job_id))
+    if not job:
+        raise APIError('No job with id \'{}\''.format(job_id), status_code=HTTPStatus.NOT_FOUND)
+
+    response = jsonify(job)
+    response.status_code = HTTPStatus.OK
+    current_app.logger.info('Provided status of job {} ({})'.format(job.id, job.status))
+
+    return response
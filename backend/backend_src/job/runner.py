@@ -0,0 +1,94 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+from datetime import timedelta
+from typing import Callable
+
+from flask import current_app
+
+from .models import Job, JobStatus
+from ..exceptions import formatted_exception_str
+from ..extensions import db
+
+
+def start_job(description: str, job_function: Callable, *args) -> Job:
+    """
+    Runs `job_function(job_id, *args)` in the background, the status of the job can be polled in the meantime
+
+    The thread is a greenlet if running with the patched `gevent`-worker, the job function is therefore required to
+    commit its work in small transactions to keep the other requests responsive.
+    """
+    job = Job(description=description, status=JobStatus.RUNNING.name)
+    db.session.add(job)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    job_thread = threading.Thread(target=_run_job, args=(app, job.id, job_function, args), daemon=True)
+    job_thread.start()
+    app.logger.info('Started job {}: {}'.format(job.id, description))
+
+    return job
+
+
+def update_job_progress(job_id: int, progress_in_percent: float, num_deleted_datasets: int) -> None:
+    """
+    Updates the progress of the job within the current transaction of the job
+    """
+    job = db.session.get(Job, job_id)
+    job.progress_in_percent = progress_in_percent
+    job.num_deleted_datasets = num_deleted_datasets
+
+
+def fail_orphaned_jobs() -> None:
+    """
+    Marks the running jobs without any progress within the orphan period as failed, their instance has been stopped
+    (the interrupted deletions are idempotent and can be simply started again)
+    """
+    orphan_period = timedelta(seconds=current_app.config['JOB_ORPHAN_PERIOD_IN_SEC'])
+    orphaned_jobs = Job.query.filter(Job.status == JobStatus.RUNNING.name,
+                                     Job.updated_at < db.func.now() - orphan_period).all()
+    for job in orphaned_jobs:
+        job.status = JobStatus.FAILED.name
+        job.error = 'Interrupted, needs to be started again'
+        current_app.logger.warning('Job {} has been interrupted at {:.0f}%: {}'.format(job.id, job.progress_in_percent,
+                                                                                       job.description))
+    db.session.commit()
+
+
+def _run_job(app, job_id, job_function, args):
+    with app.app_context():
+        try:
+            job_function(job_id, *args)
+            _finish_job(job_id, JobStatus.FINISHED)
+            app.logger.info('Finished job {}'.format(job_id))
+        except Exception as e:
+            db.session.rollback()
+            error = formatted_exception_str(e)
+            _finish_job(job_id, JobStatus.FAILED, error)
+            app.logger.error('Job {} failed: {}'.format(job_id, error))
+        finally:
+            db.session.close()
+
+
+def _finish_job(job_id, status, error=None):
+    job = db.session.get(Job, job_id)
+    job.status = status.name
+    if status == JobStatus.FINISHED:
+        job.progress_in_percent = 100
+    if error:
+        job.error = error[:255]
+    db.session.commit()
@@ -0,0 +1,166 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import time
+from contextlib import contextmanager
+
+from flask import g, request, has_app_context, current_app
+from prometheus_client import Counter, Histogram, REGISTRY
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+from sqlalchemy.pool import QueuePool
+
+# all metrics are updated in the process of the worker, they are cheap enough to be always enabled
+REQUESTS = Counter('weather_http_requests_total', 'Number of handled HTTP requests', ['method', 'route', 'status'])
+REQUEST_DURATION = Histogram('weather_http_request_duration_seconds', 'Duration of the HTTP requests',
+                             ['method', 'route'])
+REQUEST_BYTES = Counter('weather_http_request_bytes_total', 'Size of the received request payloads', ['route'])
+RESPONSE_BYTES = Counter('weather_http_response_bytes_total', 'Size of the sent response payloads', ['route'])
+STAGE_DURATION = Histogram('weather_request_stage_duration_seconds',
+                           'Duration of the stages of the data requests (sql, reshape, dewpoint, serialization)',
+                           ['stage'])
+DATASETS_RETURNED = Counter('weather_datasets_returned_total', 'Number of datasets returned by the data queries')
+DATASETS_INGESTED = Counter('weather_datasets_ingested_total', 'Number of new datasets stored by the ingests')
+POOL_CHECKOUT_DURATION = Histogram('weather_db_pool_checkout_duration_seconds',
+                                   'Time waited for a database connection from the pool (including new connections)',
+                                   buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0))
+CACHE_LOOKUPS = Counter('weather_cache_lookups_total', 'Lookups of the caches of the backend', ['cache', 'result'])
+
+UNMATCHED_ROUTE = 'unmatched'
+
+
+class MeasuredQueuePool(QueuePool):
+    """
+    Connection pool measuring the waiting time of each checkout, used for all engines of the app
+    """
+
+    def connect(self):
+        start_time = time.perf_counter()
+        connection = super().connect()
+        POOL_CHECKOUT_DURATION.observe(time.perf_counter() - start_time)
+        return connection
+
+
+class AppStatsCollector(object):
+    """
+    Provides the current state of the worker pool, the query admission and the ingest of the app serving the scrape
+    """
+
+    def collect(self):
+        if not has_app_context():
+            return
+
+        executor_stats = current_app.extensions['offload_executor'].get_stats()
+        admission_stats = current_app.extensions['query_admission'].get_stats()
+        ingest_stats = current_app.extensions['ingest_monitor'].get_stats()
+        yield _gauge('weather_executor_pending_tasks', 'Tasks pending in the worker pool',
+                     executor_stats['num_pending'])
+        yield _gauge('weather_executor_queue_depth', 'Tasks waiting for a free worker', executor_stats['queue_depth'])
+        yield _counter('weather_executor_completed_tasks', 'Tasks completed by the worker pool',
+                       executor_stats['num_completed'])
+        yield _gauge('weather_running_expensive_queries', 'Expensive data queries currently running',
+                     admission_stats['num_running_expensive_queries'])
+        yield _counter('weather_routed_queries', 'Data queries above the budget routed to the snapshot',
+                       admission_stats['num_routed_queries'])
+        yield _counter('weather_rejected_queries', 'Data queries rejected by the admission control',
+                       admission_stats['num_rejected_queries'])
+        yield _gauge('weather_pending_ingests', 'Ingest requests pending in the worker',
+                     ingest_stats['num_pending_ingests'])
+        yield _gauge('weather_ingest_commit_latency_seconds', 'Moving average of the commit latency of the ingests',
+                     ingest_stats['commit_latency_in_sec'])
+        yield _counter('weather_rejected_ingests', 'Ingest requests rejected due to backpressure',
+                       ingest_stats['num_rejected_ingests'])
+
+
+def _gauge(name, documentation, value):
+    return GaugeMetricFamily(name, documentation, value=value)
+
+
+def _counter(name, documentation, value):
+    return CounterMetricFamily(name, documentation, value=value)
+
+
+REGISTRY.register(AppStatsCollector())
+
+
+def register_metrics(app) -> None:
+    # needs to be called before any engine is created
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}),
+                                                   poolclass=MeasuredQueuePool)
+    app.config['SQLALCHEMY_BINDS'] = {key: _with_measured_pool(options)
+                                      for key, options in app.config.get('SQLALCHEMY_BINDS', {}).items()}
+    app.before_request(_start_request_measurement)
+    app.after_request(_finish_request_measurement)
+
+
+def _with_measured_pool(bind_options):
+    # the options of the binds can also be provided as plain database URI
+    if isinstance(bind_options, dict):
+        return dict(bind_options, poolclass=MeasuredQueuePool)
+
+    return {'url': bind_options, 'poolclass': MeasuredQueuePool}
+
+
+def _start_request_measurement():
+    g.request_start_time = time.perf_counter()
+
+
+def _finish_request_measurement(response):
+    start_time = g.get('request_start_time')
+    if start_time is None:
+        return response
+
+    duration = time.perf_counter() - start_time
+    route = request.url_rule.rule if request.url_rule else UNMATCHED_ROUTE
+    REQUESTS.labels(request.method, route, response.status_code).inc()
+    REQUEST_DURATION.labels(request.method, route).observe(duration)
+    REQUEST_BYTES.labels(route).inc(request.content_length or 0)
+    if not response.is_streamed:
+        RESPONSE_BYTES.labels(route).inc(response.content_length or 0)
+
+    stage_durations = g.get('stage_durations')
+    if stage_durations:
+        # allows the frontend to show the time spent in each stage of the backend (in milliseconds)
+        response.headers['Server-Timing'] = ', '.join(['{};dur={:.1f}'.format(stage, 1000 * stage_duration)
+                                                       for stage, stage_duration in stage_durations] +
+                                                      ['total;dur={:.1f}'.format(1000 * duration)])
+
+    return response
+
+
+@contextmanager
+def measure_stage(stage: str):
+    start_time = time.perf_counter()
+    yield
+    observe_stage(stage, time.perf_counter() - start_time)
+
+
+def observe_stage(stage: str, duration_in_sec: float) -> None:
+    STAGE_DURATION.labels(stage).observe(duration_in_sec)
+    if has_app_context():
+        g.setdefault('stage_durations', []).append((stage, duration_in_sec))
+
+
+def format_stage_durations() -> str:
+    """
+    The durations of the stages of the current request as `key=value` fields for its log line
+    """
+    return ' '.join('{}_ms={:.1f}'.format(stage, 1000 * stage_duration)
+                    for stage, stage_duration in g.get('stage_durations', []))
+
+
+def count_cache_lookup(cache: str, is_hit: bool) -> None:
+    CACHE_LOOKUPS.labels(cache, 'hit' if is_hit else 'miss').inc()
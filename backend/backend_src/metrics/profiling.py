@@ -0,0 +1,63 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import cProfile
+import io
+import pstats
+from functools import wraps
+
+from flask import request, current_app
+
+from ..utils import access_level_required, Role
+
+PROFILE_PARAMETER = 'profile'
+# number of functions listed in the report
+NUM_PROFILE_ENTRIES = 50
+
+
+def with_profiling(fn):
+    """
+    Returns a cProfile report of the decorated route instead of its response if requested by an admin with
+    `?profile=1`, the work offloaded to the worker pool only appears as time waited for it
+    """
+    profiled_fn = access_level_required(Role.ADMIN)(_profile(fn))
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if request.args.get(PROFILE_PARAMETER) == '1':
+            return profiled_fn(*args, **kwargs)
+
+        return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def _profile(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        profile = cProfile.Profile()
+        response = profile.runcall(fn, *args, **kwargs)
+
+        report = io.StringIO()
+        pstats.Stats(profile, stream=report).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(NUM_PROFILE_ENTRIES)
+        current_app.logger.info('Profiled request of \'{}\''.format(request.path))
+
+        # the status of the profiled response is kept for the report
+        status_code = current_app.make_response(response).status_code
+        return report.getvalue(), status_code, {'Content-Type': 'text/plain'}
+
+    return wrapper
@@ -0,0 +1,80 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import hmac
+from http import HTTPStatus
+
+from flask import Blueprint, jsonify, current_app, request
+from prometheus_client import generate_latest, REGISTRY, CONTENT_TYPE_LATEST
+
+from .slow_queries import get_slow_query_log
+from ..exceptions import APIError
+from ..utils import with_rollback_and_raise_exception, access_level_required, Role
+
+metrics_blueprint = Blueprint('metrics', __name__, url_prefix='/metrics')
+slow_query_blueprint = Blueprint('slow_query', __name__, url_prefix='/api/v1/slow_query')
+
+
+@metrics_blueprint.route('', methods=['GET'])
+@with_rollback_and_raise_exception
+def get_metrics():
+    _verify_scrape_token()
+
+    # the metrics are in the text format of Prometheus
+    return generate_latest(REGISTRY), HTTPStatus.OK, {'Content-Type': CONTENT_TYPE_LATEST}
+
+
+@slow_query_blueprint.route('', methods=['GET'])
+@access_level_required(Role.ADMIN)
+@with_rollback_and_raise_exception
+def get_slow_queries():
+    entries = _get_configured_slow_query_log().get_entries()
+
+    response = jsonify(entries)
+    response.status_code = HTTPStatus.OK
+    current_app.logger.info('Provided {} slow queries'.format(len(entries)))
+
+    return response
+
+
+@slow_query_blueprint.route('', methods=['DELETE'])
+@access_level_required(Role.ADMIN)
+@with_rollback_and_raise_exception
+def clear_slow_queries():
+    _get_configured_slow_query_log().clear()
+    current_app.logger.info('Cleared the slow query log')
+
+    return '', HTTPStatus.NO_CONTENT
+
+
+def _get_configured_slow_query_log():
+    slow_query_log = get_slow_query_log()
+    if not slow_query_log:
+        raise APIError('No slow query log is configured', status_code=HTTPStatus.BAD_REQUEST)
+
+    return slow_query_log
+
+
+def _verify_scrape_token():
+    # a static token instead of the short-lived JWT access tokens as the scraper cannot refresh them
+    metrics_token = current_app.config['METRICS_TOKEN']
+    if not metrics_token:
+        raise APIError('The metrics are disabled', status_code=HTTPStatus.NOT_FOUND)
+
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme != 'Bearer' or not hmac.compare_digest(token.encode(), metrics_token.encode()):
+        raise APIError('A valid metrics token is required', status_code=HTTPStatus.UNAUTHORIZED)
@@ -0,0 +1,140 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from flask import current_app
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+from ..extensions import db
+
+# the statements and parameters stored within the log are truncated, the captured plan is using the full statement
+MAX_STATEMENT_LENGTH = 10000
+MAX_PARAMETERS_LENGTH = 2000
+# the plan is captured by executing the statement again, it must neither block nor change anything
+EXPLAIN_TIMEOUT_IN_MS = 30000
+NOT_EXPLAINED_STATEMENT_PARTS = ['FOR UPDATE', 'FOR SHARE', 'FOR NO KEY UPDATE', 'FOR KEY SHARE', 'PG_ADVISORY']
+# execution option of the connections capturing the plans, their statements are not logged
+PLAN_CAPTURE_OPTION = 'is_slow_query_plan_capture'
+
+
+class SlowQueryLog(object):
+    """
+    Bounded ring buffer of the statements on the weather databases running longer than the threshold, the plans of a
+    sample of the slow `SELECT` statements are captured in the background
+    """
+
+    def __init__(self, size: int, threshold_in_sec: float, explain_sample_rate: float):
+        self.threshold_in_sec = threshold_in_sec
+        self.explain_sample_rate = explain_sample_rate
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def watch(self, engine: Engine, engine_name: str) -> None:
+        event.listen(engine, 'before_cursor_execute', _start_measurement)
+        event.listen(engine, 'after_cursor_execute',
+                     lambda conn, cursor, statement, parameters, context, executemany:
+                     self._finish_measurement(engine, engine_name, context, statement, parameters))
+
+    def get_entries(self) -> List[dict]:
+        with self._lock:
+            # the newest entries first
+            return [dict(entry) for entry in reversed(self._entries)]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _finish_measurement(self, engine, engine_name, context, statement, parameters):
+        start_time = getattr(context, 'slow_query_start_time', None)
+        if start_time is None or context.execution_options.get(PLAN_CAPTURE_OPTION):
+            return
+
+        duration = time.perf_counter() - start_time
+        if duration < self.threshold_in_sec:
+            return
+
+        entry = {
+            'timepoint': datetime.now(timezone.utc),
+            'engine': engine_name,
+            'duration_in_sec': duration,
+            'statement': statement[:MAX_STATEMENT_LENGTH],
+            'parameters': repr(parameters)[:MAX_PARAMETERS_LENGTH],
+            'plan': None
+        }
+        with self._lock:
+            self._entries.append(entry)
+
+        if _is_explainable(statement) and random.random() < self.explain_sample_rate:
+            # the thread is a greenlet within the monkey-patched worker
+            threading.Thread(target=self._capture_plan, args=(engine, entry, statement, parameters),
+                             daemon=True).start()
+
+    def _capture_plan(self, engine, entry, statement, parameters):
+        try:
+            with engine.connect().execution_options(**{PLAN_CAPTURE_OPTION: True}) as connection:
+                connection.execute(text('SET TRANSACTION READ ONLY'))
+                connection.execute(text('SET LOCAL statement_timeout = {}'.format(EXPLAIN_TIMEOUT_IN_MS)))
+                plan_rows = connection.exec_driver_sql('EXPLAIN (ANALYZE, BUFFERS) ' + statement, parameters).all()
+                connection.rollback()
+            plan = '\n'.join(plan_row[0] for plan_row in plan_rows)
+        except Exception as e:
+            plan = 'Capturing the plan failed: {}'.format(e)
+
+        with self._lock:
+            entry['plan'] = plan
+
+
+def _start_measurement(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.slow_query_start_time = time.perf_counter()
+
+
+def _is_explainable(statement: str) -> bool:
+    upper_statement = statement.upper()
+    return upper_statement.lstrip().startswith('SELECT') and \
+        not any(part in upper_statement for part in NOT_EXPLAINED_STATEMENT_PARTS)
+
+
+def register_slow_query_log(app) -> None:
+    """
+    Needs to be called after the engines of the database have been created
+    """
+    threshold_in_sec = app.config['SLOW_QUERY_THRESHOLD_IN_SEC']
+    if not threshold_in_sec:
+        app.extensions['slow_query_log'] = None
+        return
+
+    slow_query_log = SlowQueryLog(app.config['SLOW_QUERY_LOG_SIZE'], threshold_in_sec,
+                                  app.config['SLOW_QUERY_EXPLAIN_SAMPLE_RATE'])
+    with app.app_context():
+        slow_query_log.watch(db.engines['weather-data'], 'weather-data')
+    for replica in app.extensions['read_replicas'].replicas:
+        slow_query_log.watch(replica.engine, replica.name)
+    for i, shard_engine in enumerate(app.extensions['weather_data_shards']):
+        slow_query_log.watch(shard_engine, 'shard-{}'.format(i + 1))
+    app.extensions['slow_query_log'] = slow_query_log
+
+
+def get_slow_query_log() -> Optional[SlowQueryLog]:
+    return current_app.extensions['slow_query_log']
@@ -22,15 +22,25 @@ from http import HTTPStatus
 from typing import List
 
 from sqlalchemy import ForeignKey
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import validates, Mapped
 
+from .compact_storage import CompactFloat, is_compact_storage_enabled, migrate_to_compact_storage, \
+    verify_storage_layout
 from .exceptions import APIError
+from .executor.pool import run_offloaded
 from .extensions import db, flask_bcrypt
 from .sensor.models import generate_sensors, Sensor
 from .utils import Role, ROLES, USER_NAME_REGEX
 
 DEFAULT_ADMIN_USER_NAME = 'default_admin'
 
+# id of the current transaction, it is ordering the ingested data when comparing it against the snapshot horizon
+CURRENT_TRANSACTION_ID_SQL = 'pg_current_xact_id()::text::bigint'
+
+# temperature-humidity sensors with columns in the wide (pivoted) representation of the sensor data
+WIDE_TEMP_HUMIDITY_SENSOR_IDS = ['IN', 'OUT1', 'OUT2', 'OUT3', 'OUT4', 'OUT5']
+
 
 @dataclass
 class WeatherStation(db.Model):
@@ -46,7 +56,8 @@ class WeatherStation(db.Model):
     height: Mapped[float] = db.Column(db.Float, nullable=False)
     rain_calib_factor: Mapped[float] = db.Column(db.Float, nullable=False)
 
-    data: Mapped[List['WeatherDataset']] = db.relationship(cascade='all, delete-orphan')
+    # the data is deleted by the database, loading it into the session would be too expensive
+    data: Mapped[List['WeatherDataset']] = db.relationship(cascade='all, delete-orphan', passive_deletes=True)
 
 
 @dataclass
@@ -68,12 +79,12 @@ class TempHumiditySensorData(db.Model):
     station_id: Mapped[str] = db.Column(db.String(10), primary_key=True)
     sensor_id: Mapped[str] = db.Column(db.String(10), ForeignKey(TempHumiditySensor.sensor_id), primary_key=True)
 
-    temperature: Mapped[float] = db.Column(db.Float, nullable=True)
-    humidity: Mapped[float] = db.Column(db.Float, nullable=True)
+    temperature: Mapped[float] = db.Column(CompactFloat('temperature'), nullable=True)
+    humidity: Mapped[float] = db.Column(CompactFloat('humidity'), nullable=True)
 
     __table_args__ = (db.ForeignKeyConstraint(
         [timepoint, station_id],
-        ['weather_dataset.timepoint', 'weather_dataset.station_id']),
+        ['weather_dataset.timepoint', 'weather_dataset.station_id'], ondelete='CASCADE'),
     )
 
 
@@ -82,18 +93,142 @@ class WeatherDataset(db.Model):
     __bind_key__ = 'weather-data'
 
     timepoint: Mapped[datetime] = db.Column(db.DateTime(timezone=True), primary_key=True)
-    station_id: Mapped[str] = db.Column(db.String(10), ForeignKey(WeatherStation.station_id), primary_key=True)
+    station_id: Mapped[str] = db.Column(db.String(10), ForeignKey(WeatherStation.station_id, ondelete='CASCADE'),
+                                        primary_key=True)
+
+    pressure: Mapped[float] = db.Column(CompactFloat('pressure'), nullable=True)
+    uv: Mapped[float] = db.Column(CompactFloat('uv'), nullable=True)
+    rain_counter: Mapped[float] = db.Column(CompactFloat('rain_counter'), nullable=True)
+
+    direction: Mapped[float] = db.Column(CompactFloat('direction'), nullable=True)
+    speed: Mapped[float] = db.Column(CompactFloat('speed'), nullable=True)
+    wind_temperature: Mapped[float] = db.Column(CompactFloat('wind_temperature'), nullable=True)
+    gusts: Mapped[float] = db.Column(CompactFloat('gusts'), nullable=True)
+
+    # transaction that has ingested or last updated the dataset, serves as the watermark for incremental reads
+    ingest_sequence: Mapped[int] = db.Column(db.BigInteger, nullable=True, index=True,
+                                             server_default=db.text(CURRENT_TRANSACTION_ID_SQL))
+
+    temperature_humidity: Mapped[List[TempHumiditySensorData]] = db.relationship(cascade='all, delete-orphan',
+                                                                                 passive_deletes=True)
+
+
+def get_wide_column_name(quantity: str, sensor_id: str) -> str:
+    return '{}_{}'.format(quantity, sensor_id)
+
+
+# one row per dataset containing the data of all temperature-humidity sensors, maintained on each write of the data
+wide_temp_humidity_sensor_data = db.Table(
+    'wide_temp_humidity_sensor_data',
+    db.Column('timepoint', db.DateTime(timezone=True), primary_key=True),
+    db.Column('station_id', db.String(10), primary_key=True),
+    *[db.Column(get_wide_column_name(quantity, sensor_id), CompactFloat(quantity), nullable=True)
+      for sensor_id in WIDE_TEMP_HUMIDITY_SENSOR_IDS for quantity in ['temperature', 'humidity']],
+    db.ForeignKeyConstraint(['timepoint', 'station_id'], ['weather_dataset.timepoint', 'weather_dataset.station_id'],
+                            ondelete='CASCADE'),
+    bind_key='weather-data'
+)
+
+
+@dataclass
+class LatestWeatherDataset(db.Model):
+    __bind_key__ = 'weather-data'
+
+    station_id: Mapped[str] = db.Column(db.String(10), ForeignKey(WeatherStation.station_id, ondelete='CASCADE'),
+                                        primary_key=True)
+
+    timepoint: Mapped[datetime] = db.Column(db.DateTime(timezone=True), nullable=False)
+    dataset: Mapped[dict] = db.Column(JSONB, nullable=False)
+    # first timepoint of the station including the archived data, the time period is used for estimating query costs
+    first_timepoint: Mapped[datetime] = db.Column(db.DateTime(timezone=True), nullable=True)
+
+
+@dataclass
+class ArchivedFile(db.Model):
+    """
+    Manifest entry of a Parquet file containing the data of a closed month of a station moved out of the database
+    """
+    __bind_key__ = 'weather-data'
+
+    station_id: Mapped[str] = db.Column(db.String(10), ForeignKey(WeatherStation.station_id, ondelete='CASCADE'),
+                                        primary_key=True)
+    month_start: Mapped[datetime] = db.Column(db.DateTime(timezone=True), primary_key=True)
+
+    # `parquet` for a file within the archive path or `blocks` for compressed blocks within the database
+    storage_format: Mapped[str] = db.Column(db.String(10), nullable=False, server_default='parquet')
+    # relative to the root of the archive, not set for compressed blocks
+    path: Mapped[str] = db.Column(db.String(255), nullable=True)
+    first_timepoint: Mapped[datetime] = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
+    last_timepoint: Mapped[datetime] = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
+    num_datasets: Mapped[int] = db.Column(db.Integer, nullable=False)
+    # minimum and maximum of each quantity within the file
+    statistics: Mapped[dict] = db.Column(JSONB, nullable=False)
+
+
+@dataclass
+class AnalyticsSnapshot(db.Model):
+    """
+    Columnar copy of all data of the closed months used by the analytical query engine
+    """
+    __bind_key__ = 'weather-data'
+
+    id: Mapped[int] = db.Column(db.Integer, primary_key=True)
 
-    pressure: Mapped[float] = db.Column(db.Float, nullable=True)
-    uv: Mapped[float] = db.Column(db.Float, nullable=True)
-    rain_counter: Mapped[float] = db.Column(db.Float, nullable=True)
+    # relative to the root of the snapshots
+    path: Mapped[str] = db.Column(db.String(255), nullable=False)
+    # the snapshot is covering all data before this timepoint
+    covered_last: Mapped[datetime] = db.Column(db.DateTime(timezone=True), nullable=False)
+    # the snapshot is outdated if data of the covered time period has been changed by transactions after this watermark
+    watermark: Mapped[int] = db.Column(db.BigInteger, nullable=False)
+    num_datasets: Mapped[int] = db.Column(db.Integer, nullable=False)
+    created_at: Mapped[datetime] = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
 
-    direction: Mapped[float] = db.Column(db.Float, nullable=True)
-    speed: Mapped[float] = db.Column(db.Float, nullable=True)
-    wind_temperature: Mapped[float] = db.Column(db.Float, nullable=True)
-    gusts: Mapped[float] = db.Column(db.Float, nullable=True)
 
-    temperature_humidity: Mapped[List[TempHumiditySensorData]] = db.relationship(cascade='all, delete-orphan')
+@dataclass
+class DeletionGeneration(db.Model):
+    """
+    Counter of the transactions that have deleted weather data (single row), a refreshed analytics snapshot is only
+    published if no deletion has happened since its refresh started
+    """
+    __bind_key__ = 'weather-data'
+
+    id: Mapped[int] = db.Column(db.Integer, primary_key=True)
+
+    generation: Mapped[int] = db.Column(db.BigInteger, nullable=False)
+
+
+@dataclass
+class CompressedBlock(db.Model):
+    """
+    Column of an archived month of a station encoded as compressed time-series block
+    """
+    __bind_key__ = 'weather-data'
+
+    station_id: Mapped[str] = db.Column(db.String(10), primary_key=True)
+    month_start: Mapped[datetime] = db.Column(db.DateTime(timezone=True), primary_key=True)
+    # name of the column of the queried datasets (`timepoint`, `pressure`, `temperature_OUT1`, ...)
+    column_name: Mapped[str] = db.Column(db.String(30), primary_key=True)
+
+    num_values: Mapped[int] = db.Column(db.Integer, nullable=False)
+    data: Mapped[bytes] = db.Column(db.LargeBinary, nullable=False)
+
+    __table_args__ = (db.ForeignKeyConstraint(
+        [station_id, month_start],
+        ['archived_file.station_id', 'archived_file.month_start'], ondelete='CASCADE'),
+    )
+
+
+@dataclass
+class StationShard(db.Model):
+    """
+    Entry of the shard map, the data of stations without entry is stored within the weather database itself
+    """
+    __bind_key__ = 'weather-data'
+
+    station_id: Mapped[str] = db.Column(db.String(10), ForeignKey(WeatherStation.station_id, ondelete='CASCADE'),
+                                        primary_key=True)
+
+    shard: Mapped[int] = db.Column(db.Integer, nullable=False)
 
 
 @dataclass
@@ -104,6 +239,8 @@ class FullUser(db.Model):
     password: Mapped[str] = db.Column(db.String(120), nullable=False)
     role: Mapped[str] = db.Column(db.String(10), nullable=False)
     station_id: Mapped[str] = db.Column(db.String(10), nullable=True)
+    # increasing the version revokes all refresh tokens issued to the user before
+    refresh_token_version: Mapped[int] = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     @validates('role')
     def validate_role(self, _, value):
@@ -123,15 +260,22 @@ class FullUser(db.Model):
             raise APIError('Password does not fulfill constraints (>= 3 characters)',
                            status_code=HTTPStatus.BAD_REQUEST)
 
+    def revoke_refresh_tokens(self):
+        self.refresh_token_version = (self.refresh_token_version or 0) + 1
+
     def save_to_db(self, do_add=True):
         self.validate_password()
-        self.password = flask_bcrypt.generate_password_hash(self.password).decode('utf-8')
+        self.password = run_offloaded(flask_bcrypt.generate_password_hash, self.password).decode('utf-8')
         self.role = self.role.upper()
         if do_add:
             db.session.add(self)
         db.session.commit()
 
 
+def current_transaction_id():
+    return db.literal_column(CURRENT_TRANSACTION_ID_SQL)
+
+
 def generate_temp_humidity_sensors():
     in_sensor = TempHumiditySensor()
     in_sensor.sensor_id = 'IN'
@@ -182,9 +326,85 @@ def create_sensors():
     db.session.commit()
 
 
+def upgrade_user_database():
+    # the columns need to be added explicitly to databases created by previous versions of the application
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(db.text('ALTER TABLE full_user ADD COLUMN IF NOT EXISTS refresh_token_version INTEGER '
+                                   'NOT NULL DEFAULT 0'))
+
+
+def upgrade_weather_database():
+    # the columns need to be added explicitly to databases created by previous versions of the application
+    with db.engines['weather-data'].connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(db.text('ALTER TABLE weather_dataset ADD COLUMN IF NOT EXISTS ingest_sequence BIGINT'))
+        connection.execute(db.text('ALTER TABLE weather_dataset ALTER COLUMN ingest_sequence SET DEFAULT {}'
+                                   .format(CURRENT_TRANSACTION_ID_SQL)))
+        connection.execute(db.text('CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_weather_dataset_ingest_sequence '
+                                   'ON weather_dataset (ingest_sequence)'))
+
+        _ensure_cascading_foreign_key(connection, 'weather_dataset', 'weather_dataset_station_id_fkey',
+                                      'FOREIGN KEY (station_id) REFERENCES weather_station (station_id)')
+        _ensure_cascading_foreign_key(connection, 'temp_humidity_sensor_data',
+                                      'temp_humidity_sensor_data_timepoint_station_id_fkey',
+                                      'FOREIGN KEY (timepoint, station_id) '
+                                      'REFERENCES weather_dataset (timepoint, station_id)')
+
+        # the archive of the previous version only supported Parquet files
+        connection.execute(db.text('ALTER TABLE archived_file ADD COLUMN IF NOT EXISTS storage_format VARCHAR(10) '
+                                   'NOT NULL DEFAULT \'parquet\''))
+        connection.execute(db.text('ALTER TABLE archived_file ALTER COLUMN path DROP NOT NULL'))
+
+        connection.execute(db.text('ALTER TABLE latest_weather_dataset ADD COLUMN IF NOT EXISTS first_timepoint '
+                                   'TIMESTAMP WITH TIME ZONE'))
+        connection.execute(db.text('UPDATE latest_weather_dataset SET first_timepoint = LEAST('
+                                   '(SELECT min(timepoint) FROM weather_dataset '
+                                   'WHERE weather_dataset.station_id = latest_weather_dataset.station_id), '
+                                   '(SELECT min(first_timepoint) FROM archived_file '
+                                   'WHERE archived_file.station_id = latest_weather_dataset.station_id)) '
+                                   'WHERE first_timepoint IS NULL'))
+
+    for table in [WeatherDataset.__table__, TempHumiditySensorData.__table__, wide_temp_humidity_sensor_data]:
+        if is_compact_storage_enabled():
+            migrate_to_compact_storage(db.engines['weather-data'], table)
+        else:
+            verify_storage_layout(db.engines['weather-data'], table)
+
+
+def _ensure_cascading_foreign_key(connection, table, constraint, definition):
+    delete_action = connection.execute(db.text('SELECT confdeltype FROM pg_constraint WHERE conname = :constraint'),
+                                       {'constraint': constraint}).scalar()
+    if delete_action == 'c':
+        return
+
+    # the new constraint is validated separately to avoid locking the table during the check of all existing rows
+    connection.execute(db.text('ALTER TABLE {0} DROP CONSTRAINT IF EXISTS {1}, '
+                               'ADD CONSTRAINT {1} {2} ON DELETE CASCADE NOT VALID'
+                               .format(table, constraint, definition)))
+    connection.execute(db.text('ALTER TABLE {} VALIDATE CONSTRAINT {}'.format(table, constraint)))
+
+
 def prepare_database(app):
     with app.app_context():
         db.create_all()
+        upgrade_user_database()
+        upgrade_weather_database()
+
+        from .job.runner import fail_orphaned_jobs
+        fail_orphaned_jobs()
+
+        is_wide_sensor_data_empty = db.session.query(wide_temp_humidity_sensor_data).first() is None
+        if is_wide_sensor_data_empty:
+            from .weatherdata.wide import refresh_wide_temp_humidity_sensor_data
+            refresh_wide_temp_humidity_sensor_data()
+            db.session.commit()
+
+        num_latest_datasets = db.session.query(LatestWeatherDataset).count()
+        if num_latest_datasets == 0:
+            from .weatherdata.latest import refresh_latest_datasets
+            all_stations = [station[0] for station in
+                            db.session.query(WeatherStation).with_entities(WeatherStation.station_id).all()]
+            refresh_latest_datasets(all_stations)
+            db.session.commit()
 
         num_users = db.session.query(FullUser).count()
         if num_users == 0:
@@ -194,6 +414,16 @@ def prepare_database(app):
         if num_temp_humidity_sensors == 0:
             create_temp_humidity_sensors()
 
+        temp_humidity_sensor_ids = [sensor[0] for sensor in
+                                    db.session.query(TempHumiditySensor).with_entities(TempHumiditySensor.sensor_id)]
+        unsupported_sensor_ids = set(temp_humidity_sensor_ids) - set(WIDE_TEMP_HUMIDITY_SENSOR_IDS)
+        if unsupported_sensor_ids:
+            raise RuntimeError('The temperature-humidity sensors [{}] are not supported by the wide sensor data'
+                               .format(', '.join(sorted(unsupported_sensor_ids))))
+
         num_sensors = db.session.query(Sensor).count()
         if num_sensors == 0:
             create_sensors()
+
+        from .sharding import prepare_shards
+        prepare_shards()
@@ -0,0 +1,172 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import itertools
+import re
+import time
+from functools import wraps
+from typing import List, Optional
+
+from flask import current_app, g, request
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+
+from .extensions import db
+
+WRITE_POSITION_COOKIE = 'weather_data_write_position'
+WRITE_METHODS = ['POST', 'PUT', 'DELETE']
+# blueprints writing into the weather database
+WEATHER_DATA_BLUEPRINTS = ['data', 'station', 'sensor', 'temp_humidity_sensor']
+
+_WAL_POSITION_PATTERN = re.compile('^[0-9A-F]{1,8}/[0-9A-F]{1,8}$')
+
+
+class ReadReplica(object):
+    def __init__(self, name: str, engine: Engine):
+        self.name = name
+        self.engine = engine
+        self.is_available = True
+        self.checked_at = None
+
+    def is_check_required(self, now: float, check_period: float) -> bool:
+        return self.checked_at is None or now - self.checked_at >= check_period
+
+
+class ReadReplicas(object):
+    """
+    The read replicas of the weather database of an app, each request takes the next replica (round-robin)
+    """
+
+    def __init__(self, replicas: List[ReadReplica]):
+        self.replicas = replicas
+        self._counter = itertools.count()
+
+    def get_round_robin_order(self) -> List[ReadReplica]:
+        if not self.replicas:
+            return []
+
+        start = next(self._counter) % len(self.replicas)
+        return self.replicas[start:] + self.replicas[:start]
+
+
+def register_read_replicas(app) -> None:
+    """
+    Creates the engines of the configured read replicas, these are not binds of the database as the models must not be
+    created or dropped within the replicas
+    """
+    engine_options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    replicas = [ReadReplica('replica-{}'.format(i), create_engine(uri, **engine_options))
+                for i, uri in enumerate(app.config.get('READ_REPLICA_URIS', []))]
+
+    app.extensions['read_replicas'] = ReadReplicas(replicas)
+    app.after_request(remember_write_position)
+
+
+def read_from_replica(fn):
+    """
+    Serves the weather data read by the decorated route from a read replica, the data written by the same client is
+    always visible (read-your-writes)
+    """
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if current_app.extensions['read_replicas'].replicas:
+            g.weather_data_read_engine = choose_read_engine(_get_write_position())
+        return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def get_read_engine() -> Engine:
+    """
+    The engine of the weather database chosen for reading within the current request (or the current shard)
+    """
+    shard_engine = g.get('weather_data_shard_engine')
+    if shard_engine is not None:
+        return shard_engine
+
+    read_engine = g.get('weather_data_read_engine')
+    if read_engine is not None:
+        return read_engine
+
+    return db.engines['weather-data']
+
+
+def choose_read_engine(write_position: Optional[str] = None) -> Engine:
+    """
+    Chooses the next available replica that has replayed the write position (if given), falls back to the primary
+    database if there is no such replica
+    """
+    now = time.monotonic()
+    check_period = current_app.config['READ_REPLICA_HEALTH_CHECK_PERIOD_IN_SEC']
+
+    for replica in current_app.extensions['read_replicas'].get_round_robin_order():
+        if not replica.is_available and not replica.is_check_required(now, check_period):
+            continue
+
+        engine = replica.engine
+        if write_position is None and not replica.is_check_required(now, check_period):
+            return engine
+
+        try:
+            with engine.connect() as connection:
+                has_replayed_write = True
+                if write_position is not None:
+                    has_replayed_write = connection.execute(
+                        db.text('SELECT pg_last_wal_replay_lsn() >= CAST(:position AS pg_lsn)'),
+                        {'position': write_position}).scalar()
+        except DBAPIError as e:
+            replica.is_available = False
+            replica.checked_at = now
+            current_app.logger.warning('Read replica \'{}\' is unavailable: {}'.format(replica.name, e))
+            continue
+
+        if not replica.is_available:
+            current_app.logger.info('Read replica \'{}\' is available again'.format(replica.name))
+        replica.is_available = True
+        replica.checked_at = now
+
+        # not being a standby (`NULL`) means that the replay of the write cannot be verified
+        if has_replayed_write:
+            return engine
+
+    return db.engines['weather-data']
+
+
+def remember_write_position(response):
+    """
+    Sends the current WAL position of the primary database to a client that has written weather data, its following
+    reads are only served by replicas that have replayed this position
+    """
+    if not current_app.extensions['read_replicas'].replicas or request.method not in WRITE_METHODS or \
+            request.blueprint not in WEATHER_DATA_BLUEPRINTS or response.status_code >= 400:
+        return response
+
+    write_position = db.session.execute(db.text('SELECT pg_current_wal_lsn()::text'),
+                                        bind_arguments={'bind': db.engines['weather-data']}).scalar()
+    response.set_cookie(WRITE_POSITION_COOKIE, write_position,
+                        max_age=current_app.config['READ_YOUR_WRITES_PERIOD_IN_SEC'], httponly=True)
+
+    return response
+
+
+def _get_write_position() -> Optional[str]:
+    write_position = request.cookies.get(WRITE_POSITION_COOKIE)
+    if write_position is None or not _WAL_POSITION_PATTERN.match(write_position):
+        return None
+
+    return write_position
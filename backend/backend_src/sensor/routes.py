@@ -21,6 +21,7 @@ from flask import Blueprint, jsonify, current_app
 from .models import Sensor
 from ..exceptions import APIError
 from ..extensions import db
+from ..read_replicas import read_from_replica
 from ..utils import with_rollback_and_raise_exception, access_level_required, Role
 
 sensor_blueprint = Blueprint('sensor', __name__, url_prefix='/api/v1/sensor')
@@ -29,6 +30,7 @@ sensor_blueprint = Blueprint('sensor', __name__, url_prefix='/api/v1/sensor')
 @sensor_blueprint.route('', methods=['GET'])
 @access_level_required(Role.GUEST)
 @with_rollback_and_raise_exception
+@read_from_replica
 def get_all_sensors():
     sensor_data = db.session.query(Sensor).all()
 
@@ -41,6 +43,7 @@ def get_all_sensors():
 @sensor_blueprint.route('/<sensor_id>', methods=['GET'])
 @access_level_required(Role.GUEST)
 @with_rollback_and_raise_exception
+@read_from_replica
 def get_a_sensor(sensor_id):
     sensor_id = sensor_id.lower()
     sensor_data = (db.session
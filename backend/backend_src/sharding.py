@@ -0,0 +1,211 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager
+from typing import List, Dict, Iterator, Callable
+
+from flask import current_app, g
+from gevent.pool import Pool
+from sqlalchemy import create_engine, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Engine
+
+from .extensions import db, SHARDED_TABLE_NAMES
+from .models import StationShard, WeatherStation, TempHumiditySensor
+
+# the weather database itself is the first shard
+PRIMARY_SHARD = 0
+# first key of the advisory locks protecting the shard assignment of the stations
+SHARD_LOCK_NAMESPACE = 40
+
+
+def register_shards(app) -> None:
+    """
+    Creates the engines of the additional shards of the weather data, these are not binds of the database as only the
+    tables of the station data are stored within the shards
+    """
+    engine_options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    app.extensions['weather_data_shards'] = [create_engine(uri, **engine_options)
+                                             for uri in app.config.get('SHARD_URIS', [])]
+
+
+def is_sharding_enabled() -> bool:
+    return len(current_app.extensions['weather_data_shards']) > 0
+
+
+def get_num_shards() -> int:
+    return 1 + len(current_app.extensions['weather_data_shards'])
+
+
+def get_shard_engine(shard: int) -> Engine:
+    if shard == PRIMARY_SHARD:
+        return db.engines['weather-data']
+
+    return current_app.extensions['weather_data_shards'][shard - 1]
+
+
+def get_weather_data_engine() -> Engine:
+    """
+    The engine of the station data within the current shard
+    """
+    shard_engine = g.get('weather_data_shard_engine')
+    if shard_engine is not None:
+        return shard_engine
+
+    return db.engines['weather-data']
+
+
+@contextmanager
+def use_shard(shard: int) -> Iterator[None]:
+    """
+    Reads and writes the station data of the session within the shard
+    """
+    previous_shard_engine = g.get('weather_data_shard_engine')
+    g.weather_data_shard_engine = get_shard_engine(shard) if shard != PRIMARY_SHARD else None
+    try:
+        yield
+    finally:
+        g.weather_data_shard_engine = previous_shard_engine
+
+
+def get_station_shards(station_ids: List[str], lock_for_write: bool = False) -> Dict[str, int]:
+    """
+    Returns the shard of each station, `lock_for_write` keeps the assignment of the stations unchanged until the end of
+    the current transaction (required for writing station data)
+    """
+    if not is_sharding_enabled():
+        return {station_id: PRIMARY_SHARD for station_id in station_ids}
+
+    primary_engine = db.engines['weather-data']
+    if lock_for_write:
+        # a sorted locking order prevents deadlocks between concurrent writes
+        for station_id in sorted(set(station_ids)):
+            db.session.execute(db.text('SELECT pg_advisory_xact_lock_shared(:namespace, hashtext(:station_id))'),
+                               {'namespace': SHARD_LOCK_NAMESPACE, 'station_id': station_id},
+                               bind_arguments={'bind': primary_engine})
+
+    assigned_shards = dict(db.session.execute(select(StationShard.station_id, StationShard.shard)
+                                              .where(StationShard.station_id.in_(station_ids)),
+                                              bind_arguments={'bind': primary_engine}).all())
+
+    return {station_id: assigned_shards.get(station_id, PRIMARY_SHARD) for station_id in station_ids}
+
+
+def group_by_shard(station_ids: List[str], lock_for_write: bool = False) -> Dict[int, List[str]]:
+    station_ids_per_shard = {}
+    for station_id, shard in get_station_shards(station_ids, lock_for_write).items():
+        station_ids_per_shard.setdefault(shard, []).append(station_id)
+
+    return station_ids_per_shard
+
+
+def iterate_shards(station_ids: List[str], lock_for_write: bool = False) -> Iterator[List[str]]:
+    """
+    Yields the stations of each shard while the session is using this shard
+    """
+    for shard, shard_station_ids in group_by_shard(station_ids, lock_for_write).items():
+        with use_shard(shard):
+            yield shard_station_ids
+
+
+def run_on_shards(station_ids: List[str], function: Callable, *args) -> List:
+    """
+    Runs `function(shard_station_ids, *args)` concurrently for the stations of each shard, returns the results
+    """
+    station_ids_per_shard = group_by_shard(station_ids)
+    if len(station_ids_per_shard) <= 1:
+        results = []
+        for shard, shard_station_ids in station_ids_per_shard.items():
+            with use_shard(shard):
+                results.append(function(shard_station_ids, *args))
+        return results
+
+    # the greenlets are only cooperative if `psycopg2` is patched for `gevent` (as done in `wsgi.py`)
+    app = current_app._get_current_object()
+    read_engine = g.get('weather_data_read_engine')
+    pool = Pool(len(station_ids_per_shard))
+    return pool.map(lambda shard_item: _run_on_shard_in_app_context(app, read_engine, shard_item[0], function,
+                                                                    shard_item[1], args),
+                    station_ids_per_shard.items())
+
+
+def lock_station_for_move(station_id: str) -> None:
+    """
+    Blocks all writes of the station data until the end of the current transaction
+    """
+    db.session.execute(db.text('SELECT pg_advisory_xact_lock(:namespace, hashtext(:station_id))'),
+                       {'namespace': SHARD_LOCK_NAMESPACE, 'station_id': station_id},
+                       bind_arguments={'bind': db.engines['weather-data']})
+
+
+def assign_station_to_shard(station_id: str, shard: int) -> None:
+    """
+    Updates the shard map within the current transaction
+    """
+    statement = insert(StationShard).values(station_id=station_id, shard=shard)
+    statement = statement.on_conflict_do_update(index_elements=[StationShard.station_id], set_={'shard': shard})
+    db.session.execute(statement, bind_arguments={'bind': db.engines['weather-data']})
+
+
+def prepare_shards() -> None:
+    """
+    Creates the tables of the station data and the referenced tables within the additional shards
+    """
+    sharded_tables = [table for table in db.metadatas['weather-data'].sorted_tables
+                      if table.name in SHARDED_TABLE_NAMES]
+    for shard in range(1, get_num_shards()):
+        engine = get_shard_engine(shard)
+        db.metadatas['weather-data'].create_all(
+            engine, tables=[WeatherStation.__table__, TempHumiditySensor.__table__] + sharded_tables)
+        copy_reference_rows(shard, [])
+
+
+def copy_reference_rows(shard: int, station_ids: List[str]) -> None:
+    """
+    Copies the stations and all temperature-humidity sensors into the shard, they are referenced by the station data
+    """
+    if shard == PRIMARY_SHARD:
+        return
+
+    reference_rows = [(TempHumiditySensor.__table__, select(TempHumiditySensor.__table__))]
+    if station_ids:
+        reference_rows.append((WeatherStation.__table__, select(WeatherStation.__table__)
+                               .where(WeatherStation.station_id.in_(station_ids))))
+
+    with db.engines['weather-data'].connect() as primary_connection, \
+            get_shard_engine(shard).begin() as shard_connection:
+        for table, query in reference_rows:
+            rows = primary_connection.execute(query).mappings().all()
+            if rows:
+                shard_connection.execute(insert(table).on_conflict_do_nothing(), [dict(row) for row in rows])
+
+
+def remove_station_from_shards(station_id: str) -> None:
+    """
+    Removes the copies of the station from the additional shards together with any remaining data of the station
+    """
+    for shard in range(1, get_num_shards()):
+        with get_shard_engine(shard).begin() as shard_connection:
+            shard_connection.execute(WeatherStation.__table__.delete()
+                                     .where(WeatherStation.__table__.c.station_id == station_id))
+
+
+def _run_on_shard_in_app_context(app, read_engine, shard, function, shard_station_ids, args):
+    # the greenlets are not inheriting the context of the request
+    with app.app_context():
+        g.weather_data_read_engine = read_engine
+        with use_shard(shard):
+            return function(shard_station_ids, *args)
@@ -18,10 +18,17 @@ from http import HTTPStatus
 
 from flask import jsonify, request, current_app, Blueprint, Response
 
-from .schemas import weather_station_schema, many_weather_stations_schema
+from .schemas import weather_station_schema, many_weather_stations_schema, shard_assignment_schema
 from ..exceptions import APIError
 from ..extensions import db
-from ..models import WeatherStation
+from ..job.runner import start_job
+from ..models import WeatherStation, WeatherDataset
+from ..read_replicas import read_from_replica
+from ..sharding import use_shard, get_station_shards, remove_station_from_shards, get_num_shards
+from ..weatherdata.archive import delete_archived_station
+from ..weatherdata.deletion import delete_station_in_slices
+from ..weatherdata.invalidation import invalidate_analytics_snapshot
+from ..weatherdata.rebalancing import move_station_to_shard
 from ..utils import json_with_rollback_and_raise_exception, access_level_required, Role, \
     with_rollback_and_raise_exception, convert_to_int
 
@@ -53,6 +60,7 @@ def add_station():
 @station_blueprint.route('', methods=['GET'])
 @access_level_required(Role.GUEST)
 @with_rollback_and_raise_exception
+@read_from_replica
 def get_all_stations():
     all_stations = WeatherStation.query.all()
     response = jsonify(many_weather_stations_schema.dump(all_stations))
@@ -65,6 +73,7 @@ def get_all_stations():
 @station_blueprint.route('/<numeric_station_id>', methods=['GET'])
 @access_level_required(Role.GUEST)
 @with_rollback_and_raise_exception
+@read_from_replica
 def get_station_details(numeric_station_id):
     station = db.session.get(WeatherStation, convert_to_int(numeric_station_id))
     if not station:
@@ -119,8 +128,52 @@ def remove_station(numeric_station_id):
         current_app.logger.info('No station with id \'{}\' '.format(numeric_station_id))
         return '', HTTPStatus.NO_CONTENT
 
-    db.session.delete(existing_station)
-    db.session.commit()
-    current_app.logger.info('Deleted station \'{}\' from the database'.format(existing_station.station_id))
+    with use_shard(get_station_shards([existing_station.station_id])[existing_station.station_id]):
+        station_has_data = db.session.query(WeatherDataset.query
+                                            .filter(WeatherDataset.station_id == existing_station.station_id)
+                                            .exists()).scalar()
+        if not station_has_data:
+            delete_archived_station(existing_station.station_id)
+
+    if not station_has_data:
+        remove_station_from_shards(existing_station.station_id)
+        db.session.delete(existing_station)
+        # any data ingested in the meantime is removed by the cascading foreign keys
+        invalidate_analytics_snapshot()
+        db.session.commit()
+        current_app.logger.info('Deleted station \'{}\' from the database'.format(existing_station.station_id))
+        return '', HTTPStatus.NO_CONTENT
+
+    # deleting years of data takes too long for a single request
+    job = start_job('Deletion of station \'{}\''.format(existing_station.station_id), delete_station_in_slices,
+                    existing_station.station_id)
+
+    response = jsonify(job)
+    response.status_code = HTTPStatus.ACCEPTED
+    response.headers['location'] = '/api/v1/job/{}'.format(job.id)
 
-    return '', HTTPStatus.NO_CONTENT
+    return response
+
+
+@station_blueprint.route('/<numeric_station_id>/shard', methods=['PUT'])
+@access_level_required(Role.ADMIN)
+@json_with_rollback_and_raise_exception
+def update_station_shard(numeric_station_id):
+    shard = shard_assignment_schema.load(request.json)['shard']
+
+    existing_station = db.session.get(WeatherStation, convert_to_int(numeric_station_id))
+    if not existing_station:
+        raise APIError('No station with id \'{}\''.format(numeric_station_id), status_code=HTTPStatus.NOT_FOUND)
+
+    if shard >= get_num_shards():
+        raise APIError('No shard {} is configured'.format(shard), status_code=HTTPStatus.BAD_REQUEST)
+
+    # moving years of data takes too long for a single request, the station keeps ingesting in the meantime
+    job = start_job('Moving of station \'{}\' into shard {}'.format(existing_station.station_id, shard),
+                    move_station_to_shard, existing_station.station_id, shard)
+
+    response = jsonify(job)
+    response.status_code = HTTPStatus.ACCEPTED
+    response.headers['location'] = '/api/v1/job/{}'.format(job.id)
+
+    return response
@@ -14,6 +14,10 @@
 #   You should have received a copy of the GNU Affero General Public License
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import marshmallow
+from marshmallow.schema import Schema
+from marshmallow.validate import Range
+
 from ..extensions import ma
 from ..models import WeatherStation
 
@@ -24,6 +28,11 @@ class WeatherStationSchema(ma.SQLAlchemyAutoSchema):
         load_instance = True
 
 
+class ShardAssignmentSchema(Schema):
+    shard = marshmallow.fields.Integer(required=True, validate=Range(min=0))
+
+
 # initialize the schemas
 weather_station_schema = WeatherStationSchema()
 many_weather_stations_schema = WeatherStationSchema(many=True)
+shard_assignment_schema = ShardAssignmentSchema()
@@ -21,6 +21,7 @@ from flask import Blueprint, jsonify, current_app
 from ..exceptions import APIError
 from ..extensions import db
 from ..models import TempHumiditySensor
+from ..read_replicas import read_from_replica
 from ..utils import with_rollback_and_raise_exception, access_level_required, Role
 
 temp_humidity_sensor_blueprint = Blueprint('temp_humidity_sensor', __name__, url_prefix='/api/v1/temp-humidity-sensor')
@@ -29,6 +30,7 @@ temp_humidity_sensor_blueprint = Blueprint('temp_humidity_sensor', __name__, url
 @temp_humidity_sensor_blueprint.route('', methods=['GET'])
 @access_level_required(Role.GUEST)
 @with_rollback_and_raise_exception
+@read_from_replica
 def get_all_temp_humidity_sensors():
     sensor_data = (db.session
                    .query(TempHumiditySensor)
@@ -44,6 +46,7 @@ def get_all_temp_humidity_sensors():
 @temp_humidity_sensor_blueprint.route('/<sensor_id>', methods=['GET'])
 @access_level_required(Role.GUEST)
 @with_rollback_and_raise_exception
+@read_from_replica
 def get_a_temp_humidity_sensor(sensor_id):
     sensor_id = sensor_id.upper()
     sensor_data = (db.session
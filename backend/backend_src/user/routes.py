@@ -18,11 +18,13 @@ from http import HTTPStatus
 
 import flask_bcrypt
 from flask import jsonify, request, current_app, Blueprint, Response
-from flask_jwt_extended import create_access_token
+from flask_jwt_extended import create_access_token, create_refresh_token, verify_jwt_in_request, get_jwt, \
+    get_jwt_identity
 
 from .schemas import full_user_claims_dump_schema, full_user_login_schema
 from .schemas import full_user_load_schema, full_user_dump_schema, full_many_users_schema
-from ..exceptions import APIError
+from ..exceptions import APIError, raise_api_error
+from ..executor.pool import run_offloaded
 from ..extensions import db, jwt
 from ..models import FullUser, WeatherStation
 from ..utils import json_with_rollback_and_raise_exception, access_level_required, Role, convert_to_int
@@ -93,6 +95,8 @@ def update_user(user_id):
     existing_user.password = updated_user.password
     existing_user.role = updated_user.role
     existing_user.station_id = updated_user.station_id
+    # the refresh tokens are only valid for the old password
+    existing_user.revoke_refresh_tokens()
     existing_user.save_to_db(do_add=False)
     current_app.logger.info('Updated user \'{}\' in the database (new role: \'{}\', new password)'
                             .format(existing_user.name, updated_user.role))
@@ -120,6 +124,21 @@ def remove_user(user_id):
     return '', HTTPStatus.NO_CONTENT
 
 
+@user_blueprint.route('/user/<user_id>/refresh_token', methods=['DELETE'])
+@access_level_required(Role.ADMIN)
+@with_rollback_and_raise_exception
+def revoke_refresh_tokens(user_id):
+    user = db.session.get(FullUser, convert_to_int(user_id))
+    if not user:
+        raise APIError('No user with provided id', status_code=HTTPStatus.NOT_FOUND)
+
+    user.revoke_refresh_tokens()
+    db.session.commit()
+    current_app.logger.info('Revoked all refresh tokens of user \'{}\''.format(user.name))
+
+    return '', HTTPStatus.NO_CONTENT
+
+
 @user_blueprint.route('/user/<user_id>', methods=['GET'])
 @access_level_required(Role.ADMIN)
 @with_rollback_and_raise_exception
@@ -154,18 +173,52 @@ def login():
 
     access_token = None
     if user_from_db:
-        if flask_bcrypt.check_password_hash(user_from_db.password, submitted_user.password):
-            full_user_claims = full_user_claims_dump_schema.dump(user_from_db)
-            identity_claim = {'name': user_from_db.name, 'role': full_user_claims['role']}
-            additional_claims = {'station_id': full_user_claims['station_id']}
-            access_token = create_access_token(identity=identity_claim,
-                                               additional_claims=additional_claims,
-                                               fresh=True)
+        if run_offloaded(flask_bcrypt.check_password_hash, user_from_db.password, submitted_user.password):
+            access_token = _create_access_token(user_from_db, fresh=True)
     else:
-        flask_bcrypt.check_password_hash(INVALID_PASSWORD_SALT, 'something')  # to give always the same runtime
+        # to give always the same runtime
+        run_offloaded(flask_bcrypt.check_password_hash, INVALID_PASSWORD_SALT, 'something')
 
     if access_token:
         current_app.logger.info('User \'{}\' logged in successfully with the password'.format(user_from_db.name))
-        return jsonify({'user': user_from_db.name, 'token': access_token}), HTTPStatus.OK
+        return jsonify({'user': user_from_db.name, 'token': access_token,
+                        'refresh_token': _create_refresh_token(user_from_db)}), HTTPStatus.OK
     else:
         raise APIError('User not existing or password incorrect', status_code=HTTPStatus.UNAUTHORIZED)
+
+
+@user_blueprint.route('/refresh', methods=['POST'])
+@with_rollback_and_raise_exception
+def refresh():
+    # only the signature of the refresh token is checked, avoiding the expensive check of the password hash
+    try:
+        verify_jwt_in_request(refresh=True)
+    except Exception as e:
+        raise_api_error(e, status_code=HTTPStatus.UNAUTHORIZED)
+
+    # a deleted and recreated user with the same name has a new id, the previous refresh tokens remain invalid
+    user_from_db = FullUser.query.filter_by(name=get_jwt_identity()).one_or_none()
+    if not user_from_db or user_from_db.id != get_jwt().get('user_id') or \
+            user_from_db.refresh_token_version != get_jwt().get('refresh_token_version'):
+        raise APIError('User not existing or refresh token revoked', status_code=HTTPStatus.UNAUTHORIZED)
+
+    access_token = _create_access_token(user_from_db, fresh=False)
+    current_app.logger.info('User \'{}\' logged in successfully with the refresh token'.format(user_from_db.name))
+
+    return jsonify({'user': user_from_db.name, 'token': access_token}), HTTPStatus.OK
+
+
+def _create_access_token(user, fresh):
+    # the role and station are always read from the database, changes are therefore effective with the next refresh
+    full_user_claims = full_user_claims_dump_schema.dump(user)
+    identity_claim = {'name': user.name, 'role': full_user_claims['role']}
+    additional_claims = {'station_id': full_user_claims['station_id']}
+
+    return create_access_token(identity=identity_claim, additional_claims=additional_claims, fresh=fresh)
+
+
+def _create_refresh_token(user):
+    identity_claim = {'name': user.name, 'role': user.role}
+    additional_claims = {'user_id': user.id, 'refresh_token_version': user.refresh_token_version}
+
+    return create_refresh_token(identity=identity_claim, additional_claims=additional_claims)
@@ -23,6 +23,7 @@ class FullUserSchema(ma.SQLAlchemyAutoSchema):
         model = FullUser
         include_fk = True
         load_instance = True
+        exclude = ('refresh_token_version', )
 
 
 # initialize the schemas
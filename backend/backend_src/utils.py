@@ -15,6 +15,7 @@
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import re
+import threading
 from enum import Enum
 from functools import wraps
 from http import HTTPStatus
@@ -166,19 +167,23 @@ def convert_to_int(user_id, error_status=HTTPStatus.BAD_REQUEST):
 
 class LocalTimeZone(object):
     _instance = None
+    _lock = threading.Lock()
 
     def __init__(self, app):
         if LocalTimeZone._instance is not None:
             raise AssertionError('This class is a singleton')
-        else:
-            LocalTimeZone._instance = self
 
+        # concurrent requests must not see the instance before it is initialized
         self._local_time_zone = pytz.timezone(app.config['TIMEZONE'])
+        LocalTimeZone._instance = self
 
     @staticmethod
     def get(app):
+        # the lock is only required for the first calls, this is called for every single dataset
         if LocalTimeZone._instance is None:
-            LocalTimeZone(app)
+            with LocalTimeZone._lock:
+                if LocalTimeZone._instance is None:
+                    LocalTimeZone(app)
 
         return LocalTimeZone._instance
 
@@ -0,0 +1,166 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from http import HTTPStatus
+from typing import List, Optional, Tuple
+
+from flask import current_app
+from gevent.lock import BoundedSemaphore
+from sqlalchemy import column
+
+from .analytics import QueryEngine, choose_query_engine
+from .archive import get_archived_time_period
+from .query import plan_query, get_temp_humidity_sensor_ids
+from ..exceptions import APIError
+from ..extensions import db
+from ..models import WeatherDataset, LatestWeatherDataset
+from ..sharding import run_on_shards
+
+
+class QueryAdmission(object):
+    """
+    Limits the number of expensive data queries running concurrently in the worker, the cheap queries are not waiting
+    for them
+    """
+
+    def __init__(self, max_concurrent_expensive_queries: int):
+        self.max_concurrent_expensive_queries = max_concurrent_expensive_queries
+        self.num_running_expensive_queries = 0
+        self.num_routed_queries = 0
+        self.num_rejected_queries = 0
+        # a waiting query needs to yield to the other greenlets of the worker, including the ones holding a slot
+        self._semaphore = BoundedSemaphore(max_concurrent_expensive_queries)
+
+    @contextmanager
+    def admit_expensive_query(self, wait_timeout_in_sec: float):
+        if not self._semaphore.acquire(timeout=wait_timeout_in_sec):
+            self.num_rejected_queries += 1
+            raise APIError('Too many expensive queries are running, retry later',
+                           status_code=HTTPStatus.TOO_MANY_REQUESTS,
+                           retry_after=current_app.config['QUERY_RETRY_AFTER_IN_SEC'])
+
+        self.num_running_expensive_queries += 1
+        try:
+            yield
+        finally:
+            self.num_running_expensive_queries -= 1
+            self._semaphore.release()
+
+    def get_stats(self) -> dict:
+        return {
+            'max_concurrent_expensive_queries': self.max_concurrent_expensive_queries,
+            'num_running_expensive_queries': self.num_running_expensive_queries,
+            'num_routed_queries': self.num_routed_queries,
+            'num_rejected_queries': self.num_rejected_queries
+        }
+
+
+def register_query_admission(app) -> None:
+    app.extensions['query_admission'] = QueryAdmission(app.config['MAX_CONCURRENT_EXPENSIVE_QUERIES'])
+
+
+def get_query_admission() -> QueryAdmission:
+    return current_app.extensions['query_admission']
+
+
+def estimate_query_cost(first: datetime, last: datetime, station_ids: List[str], queried_sensors: List[column],
+                        limit: Optional[int] = None) -> int:
+    """
+    Estimates the number of values read by a query from the time period covered by the data of each station, assuming
+    that the stations are recording continuously with the configured interval (a temperature-humidity quantity is
+    read from the column of each sensor)
+    """
+    dataset_interval = timedelta(seconds=current_app.config['DATASET_INTERVAL_IN_SEC'])
+    num_datasets = 0
+    for shard_summary in run_on_shards(station_ids, _get_station_summary):
+        for first_timepoint, last_timepoint in shard_summary:
+            covered_period = min(last, last_timepoint) - max(first, first_timepoint)
+            if covered_period >= timedelta(0):
+                num_datasets += covered_period // dataset_interval + 1
+
+    if limit is not None:
+        num_datasets = min(num_datasets, limit)
+
+    num_columns = len(plan_query(queried_sensors, get_temp_humidity_sensor_ids()).column_names) - 2
+    return num_datasets * max(num_columns, 1)
+
+
+def admit_query(first: datetime, last: datetime, cost: int, is_paged: bool) -> Tuple[QueryEngine, object]:
+    """
+    Chooses the query engine for a query with the estimated cost, queries above the budget are routed to the
+    analytical engine or are rejected if no valid snapshot is available
+    """
+    if is_paged:
+        # the snapshot is not supporting the cursor of the pages
+        query_engine, snapshot = QueryEngine.POSTGRESQL, None
+    else:
+        query_engine, snapshot = choose_query_engine(first, last)
+
+    cost_budget = current_app.config['QUERY_COST_BUDGET']
+    if not cost_budget or cost <= cost_budget or query_engine == QueryEngine.DUCKDB:
+        return query_engine, snapshot
+
+    if not is_paged:
+        query_engine, snapshot = choose_query_engine(first, last, ignore_min_period=True)
+        if query_engine == QueryEngine.DUCKDB:
+            get_query_admission().num_routed_queries += 1
+            current_app.logger.info('Routed query with estimated cost {} above the budget to the snapshot'.format(cost))
+            return query_engine, snapshot
+
+    get_query_admission().num_rejected_queries += 1
+    raise APIError('The query is too expensive (estimated cost {}, budget {}), request a shorter time period, less '
+                   'stations or sensors or use a limit'.format(cost, cost_budget),
+                   status_code=HTTPStatus.TOO_MANY_REQUESTS,
+                   retry_after=current_app.config['QUERY_RETRY_AFTER_IN_SEC'])
+
+
+@contextmanager
+def limit_concurrency(cost: int):
+    """
+    Runs the block directly for cheap queries, expensive queries are waiting for a free slot
+    """
+    if cost <= current_app.config['EXPENSIVE_QUERY_COST']:
+        yield
+        return
+
+    with get_query_admission().admit_expensive_query(current_app.config['EXPENSIVE_QUERY_WAIT_IN_SEC']):
+        yield
+
+
+def _get_station_summary(station_ids):
+    time_periods = (db.session.query(LatestWeatherDataset)
+                    .filter(LatestWeatherDataset.station_id.in_(station_ids))
+                    .with_entities(LatestWeatherDataset.first_timepoint, LatestWeatherDataset.timepoint)
+                    .all())
+    if all(first_timepoint is not None for first_timepoint, _ in time_periods):
+        return time_periods
+
+    # the first timepoint of all stations together is a conservative fallback if the one of the station is unknown
+    overall_first_timepoint = _get_earliest(db.session.query(db.func.min(WeatherDataset.timepoint)).scalar(),
+                                            get_archived_time_period()[0])
+    return [(first_timepoint if first_timepoint is not None else overall_first_timepoint, latest_timepoint)
+            for first_timepoint, latest_timepoint in time_periods]
+
+
+def _get_earliest(*timepoints):
+    available_timepoints = [timepoint for timepoint in timepoints if timepoint is not None]
+    if not available_timepoints:
+        return None
+
+    return min(available_timepoints)
@@ -0,0 +1,228 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import shutil
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import List, Optional, Tuple
+
+import pandas as pd
+import pyarrow
+import pyarrow.parquet as pq
+from flask import current_app
+from gevent import get_hub
+from sqlalchemy import column
+
+from .archive import ARCHIVE_COMPRESSION
+from .archiving import read_month_datasets, get_archive_end
+from .invalidation import get_deletion_generation, lock_deletion_generation
+from .query import query_weather_datasets, plan_query, get_temp_humidity_sensor_ids, get_ingest_watermark, \
+    get_month_boundaries
+from ..extensions import db
+from ..job.runner import update_job_progress
+from ..metrics.instrumentation import count_cache_lookup
+from ..models import WeatherDataset, ArchivedFile, AnalyticsSnapshot
+from ..sharding import is_sharding_enabled
+from ..utils import LocalTimeZone
+
+DUCKDB_ENGINE = 'duckdb'
+SNAPSHOT_DIRECTORY_PREFIX = 'snapshot-'
+
+
+class QueryEngine(Enum):
+    POSTGRESQL = 0
+    DUCKDB = 1
+
+
+def is_analytics_enabled() -> bool:
+    # the snapshot and its watermark are covering a single database, sharded weather data is always queried directly
+    return current_app.config['ANALYTICS_ENGINE'] == DUCKDB_ENGINE and not is_sharding_enabled()
+
+
+def choose_query_engine(first: datetime, last: datetime,
+                        ignore_min_period: bool = False) -> Tuple[QueryEngine, Optional[AnalyticsSnapshot]]:
+    """
+    Long-range queries are running on the analytical engine if the snapshot is covering a part of the time period and is
+    still valid, all other queries are running on PostgreSQL
+    """
+    is_short_range = last - first < timedelta(days=current_app.config['ANALYTICS_MIN_PERIOD_IN_DAYS'])
+    if not is_analytics_enabled() or (is_short_range and not ignore_min_period):
+        return QueryEngine.POSTGRESQL, None
+
+    snapshot = get_valid_snapshot()
+    # the snapshot files are only available on the instance that has created them
+    is_covered = snapshot is not None and snapshot.num_datasets > 0 and first < snapshot.covered_last and \
+        os.path.isdir(get_snapshot_path(snapshot))
+    count_cache_lookup('analytics_snapshot', is_covered)
+    if not is_covered:
+        return QueryEngine.POSTGRESQL, None
+
+    return QueryEngine.DUCKDB, snapshot
+
+
+def get_valid_snapshot() -> Optional[AnalyticsSnapshot]:
+    """
+    Returns the current snapshot unless data of its time period has been changed since its creation (deletions are
+    invalidating the snapshot explicitly)
+    """
+    snapshot = AnalyticsSnapshot.query.order_by(AnalyticsSnapshot.id.desc()).first()
+    if not snapshot:
+        return None
+
+    # the index of the ingest sequence keeps this cheap as only the recently changed datasets are checked
+    is_changed = db.session.query(WeatherDataset.query
+                                  .filter(WeatherDataset.ingest_sequence >= snapshot.watermark,
+                                          WeatherDataset.timepoint < snapshot.covered_last)
+                                  .exists()).scalar()
+    if is_changed:
+        return None
+
+    return snapshot
+
+
+def get_snapshot_path(snapshot: AnalyticsSnapshot) -> str:
+    return os.path.join(current_app.config['ANALYTICS_SNAPSHOT_PATH'], snapshot.path)
+
+
+def query_weather_datasets_from_snapshot(snapshot: AnalyticsSnapshot, first: datetime, last: datetime,
+                                         stations: List[str], queried_sensors: List[column]) -> pd.DataFrame:
+    """
+    Queries the weather datasets covered by the snapshot with DuckDB, the more recent datasets are queried from
+    PostgreSQL
+    """
+    column_names = plan_query(queried_sensors, get_temp_humidity_sensor_ids()).column_names
+    snapshot_path = get_snapshot_path(snapshot)
+    station_file_patterns = [os.path.join(snapshot_path, station_id, '*.parquet') for station_id in stations
+                             if os.path.isdir(os.path.join(snapshot_path, station_id))]
+
+    datasets = None
+    if station_file_patterns:
+        # the last timepoint of the request is inclusive, the datasets from the end of the snapshot on are recent ones
+        is_last_covered = last < snapshot.covered_last
+        statement = ('SELECT {} FROM read_parquet(?) WHERE timepoint >= ? AND timepoint {} ? ORDER BY timepoint'
+                     .format(', '.join('"{}"'.format(column_name) for column_name in column_names),
+                             '<=' if is_last_covered else '<'))
+        # the query is running in a native thread of the pool to keep the other requests of the worker responsive
+        datasets = get_hub().threadpool.apply(_run_duckdb_query, (statement, [
+            station_file_patterns, first, last if is_last_covered else snapshot.covered_last]))
+
+    if last < snapshot.covered_last:
+        return datasets if datasets is not None else pd.DataFrame(columns=column_names)
+
+    recent_datasets = query_weather_datasets(snapshot.covered_last, last, stations, queried_sensors)
+    if datasets is None or datasets.empty:
+        return recent_datasets
+    if recent_datasets.empty:
+        return datasets
+
+    recent_datasets = recent_datasets.assign(timepoint=pd.to_datetime(recent_datasets['timepoint'], utc=True))
+    return pd.concat([datasets, recent_datasets], ignore_index=True)
+
+
+def refresh_analytics_snapshot(job_id: int, stations: List[str]) -> None:
+    """
+    Writes a new snapshot of all data of the closed months of the stations as Parquet files and replaces the previous
+    snapshot
+    """
+    # all changes of transactions running concurrently to the snapshot are invalidating it
+    deletion_generation = get_deletion_generation()
+    watermark = get_ingest_watermark()
+    covered_last = get_archive_end(datetime.now(tz=LocalTimeZone.get(current_app).get_local_time_zone()), 0)
+
+    months = []
+    for station_id in stations:
+        months.extend([(station_id, month_start, month_end)
+                       for month_start, month_end in _get_months_with_data(station_id, covered_last)])
+
+    snapshot_path = '{}{}'.format(SNAPSHOT_DIRECTORY_PREFIX, job_id)
+    num_datasets = 0
+    num_files = 0
+    for index, (station_id, month_start, month_end) in enumerate(months):
+        datasets = read_month_datasets(station_id, month_start, month_end)
+        if not datasets.empty:
+            _write_snapshot_file(snapshot_path, station_id, month_start, datasets)
+            num_datasets += len(datasets)
+            num_files += 1
+
+        update_job_progress(job_id, 100 * (index + 1) / (len(months) + 1), 0)
+        db.session.commit()
+
+    # waits for the deletions still running, any deletion since the start might have been missed by the snapshot
+    if lock_deletion_generation() != deletion_generation:
+        db.session.commit()
+        shutil.rmtree(os.path.join(current_app.config['ANALYTICS_SNAPSHOT_PATH'], snapshot_path), ignore_errors=True)
+        current_app.logger.info('Discarded the analytics snapshot \'{}\' as data has been deleted during its creation'
+                                .format(snapshot_path))
+        return
+
+    previous_snapshot = AnalyticsSnapshot.query.order_by(AnalyticsSnapshot.id.desc()).first()
+    previous_snapshot_path = previous_snapshot.path if previous_snapshot else None
+    db.session.query(AnalyticsSnapshot).delete(synchronize_session=False)
+    db.session.add(AnalyticsSnapshot(path=snapshot_path, covered_last=covered_last, watermark=watermark,
+                                     num_datasets=num_datasets))
+    db.session.commit()
+
+    # requests started before the replacement might still be reading the previous snapshot
+    _remove_snapshots_except([snapshot_path, previous_snapshot_path])
+    current_app.logger.info('Created the analytics snapshot \'{}\' with {} dataset(s) in {} file(s)'
+                            .format(snapshot_path, num_datasets, num_files))
+
+
+def _get_months_with_data(station_id, covered_last):
+    min_time = db.session.query(db.func.min(WeatherDataset.timepoint)).filter(
+        WeatherDataset.station_id == station_id).scalar()
+    min_archived_time = db.session.query(db.func.min(ArchivedFile.first_timepoint)).filter(
+        ArchivedFile.station_id == station_id).scalar()
+    first = min([timepoint for timepoint in [min_time, min_archived_time] if timepoint is not None], default=None)
+    if first is None:
+        return []
+
+    local_time_zone = LocalTimeZone.get(current_app).get_local_time_zone()
+    local_first = first.astimezone(local_time_zone)
+    first_month_start = local_time_zone.localize(datetime(local_first.year, local_first.month, 1))
+    if first_month_start >= covered_last:
+        return []
+
+    month_boundaries = get_month_boundaries(first_month_start, covered_last)
+    return [(month_boundaries[index], month_boundaries[index + 1]) for index in range(len(month_boundaries) - 1)]
+
+
+def _write_snapshot_file(snapshot_path, station_id, month_start, datasets):
+    station_path = os.path.join(current_app.config['ANALYTICS_SNAPSHOT_PATH'], snapshot_path, station_id)
+    os.makedirs(station_path, exist_ok=True)
+
+    local_month_start = month_start.astimezone(LocalTimeZone.get(current_app).get_local_time_zone())
+    datasets = datasets.assign(timepoint=pd.to_datetime(datasets['timepoint'], utc=True))
+    datasets = datasets.sort_values('timepoint', ignore_index=True)
+    pq.write_table(pyarrow.Table.from_pandas(datasets, preserve_index=False),
+                   os.path.join(station_path, '{}.parquet'.format(local_month_start.strftime('%Y-%m'))),
+                   compression=ARCHIVE_COMPRESSION)
+
+
+def _remove_snapshots_except(kept_snapshot_paths):
+    root_path = current_app.config['ANALYTICS_SNAPSHOT_PATH']
+    for snapshot_path in os.listdir(root_path):
+        if snapshot_path.startswith(SNAPSHOT_DIRECTORY_PREFIX) and snapshot_path not in kept_snapshot_paths:
+            shutil.rmtree(os.path.join(root_path, snapshot_path), ignore_errors=True)
+
+
+def _run_duckdb_query(statement, parameters):
+    import duckdb
+
+    with duckdb.connect() as connection:
+        connection.execute('SET TimeZone = \'UTC\'')
+        return connection.execute(statement, parameters).df()
@@ -0,0 +1,289 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import pandas as pd
+import pyarrow
+import pyarrow.fs
+import pyarrow.parquet as pq
+from flask import current_app
+
+from ..extensions import db
+from .blocks import encode_datasets, decode_datasets, TIMEPOINT_BLOCK
+from .invalidation import invalidate_analytics_snapshot
+from ..models import ArchivedFile, CompressedBlock
+from ..utils import LocalTimeZone
+
+ARCHIVE_COMPRESSION = 'zstd'
+
+PARQUET_FORMAT = 'parquet'
+BLOCKS_FORMAT = 'blocks'
+
+
+def is_archive_enabled() -> bool:
+    return current_app.config['ARCHIVE_FORMAT'] == BLOCKS_FORMAT or bool(current_app.config['ARCHIVE_PATH'])
+
+
+def read_archived_datasets(first: datetime, last: datetime, stations: List[str], column_names: List[str],
+                           limit: Optional[int] = None) -> Optional[pd.DataFrame]:
+    """
+    Reads the columns of the archived datasets of the stations within the time period, only the files overlapping
+    with the time period according to the manifest are read (returns `None` if there are none)
+
+    With a `limit` the reading stops as soon as the remaining files cannot contain any of the first `limit` datasets.
+    """
+    if not is_archive_enabled():
+        return None
+
+    archived_files = (ArchivedFile.query
+                      .filter(ArchivedFile.station_id.in_(stations),
+                              ArchivedFile.first_timepoint <= last,
+                              ArchivedFile.last_timepoint >= first)
+                      .order_by(ArchivedFile.first_timepoint, ArchivedFile.station_id)
+                      .all())
+    if not archived_files:
+        return None
+
+    archived_datasets = []
+    num_datasets = 0
+    for archived_file in archived_files:
+        if limit is not None and num_datasets >= limit:
+            read_timepoints = pd.concat([datasets['timepoint'] for datasets in archived_datasets])
+            if archived_file.first_timepoint > read_timepoints.nsmallest(limit).max():
+                break
+
+        datasets = _read_archived(archived_file, column_names, first, last)
+        archived_datasets.append(datasets)
+        num_datasets += len(datasets)
+
+    return pd.concat(archived_datasets, ignore_index=True)
+
+
+def write_archived_file(station_id: str, month_start: datetime, datasets: pd.DataFrame) -> ArchivedFile:
+    """
+    Writes the datasets of the month of the station into the archive in the configured format and updates the manifest
+    within the current transaction, returns the manifest entry (the previous file of the month needs to be removed
+    after commit)
+    """
+    datasets = datasets.assign(timepoint=pd.to_datetime(datasets['timepoint'], utc=True))
+    datasets = datasets.sort_values('timepoint', ignore_index=True)
+
+    archived_file = db.session.get(ArchivedFile, (station_id, month_start))
+    if not archived_file:
+        archived_file = ArchivedFile(station_id=station_id, month_start=month_start)
+        db.session.add(archived_file)
+
+    archived_file.first_timepoint = datasets['timepoint'].iloc[0].to_pydatetime()
+    archived_file.last_timepoint = datasets['timepoint'].iloc[-1].to_pydatetime()
+    archived_file.num_datasets = len(datasets)
+    archived_file.statistics = _get_statistics(datasets)
+
+    if current_app.config['ARCHIVE_FORMAT'] == BLOCKS_FORMAT:
+        archived_file.storage_format = BLOCKS_FORMAT
+        archived_file.path = None
+        _write_blocks(archived_file, datasets)
+    else:
+        archived_file.storage_format = PARQUET_FORMAT
+        archived_file.path = _write_file(station_id, month_start, datasets)
+
+    return archived_file
+
+
+def read_archived_file(archived_file: ArchivedFile) -> pd.DataFrame:
+    return _read_archived(archived_file, column_names=None, first=None, last=None)
+
+
+def remove_archived_files(paths: List[str]) -> None:
+    """
+    Removes files no longer referenced by the manifest, needs to be called after the commit of the manifest
+    """
+    # compressed blocks are stored within the database and have no path
+    paths = [path for path in paths if path]
+    if not paths:
+        return
+
+    filesystem, root_path = _get_archive_filesystem()
+    for path in paths:
+        try:
+            filesystem.delete_file('{}/{}'.format(root_path, path))
+        except FileNotFoundError:
+            current_app.logger.warning('Archived file \'{}\' has already been removed'.format(path))
+
+
+def delete_archived_datasets(first: datetime, last: datetime, stations: List[str],
+                             is_last_inclusive: bool = False) -> int:
+    """
+    Deletes the archived datasets of the stations within the time period, each affected file is replaced within a
+    separate transaction
+    """
+    if not is_archive_enabled():
+        return 0
+
+    archived_files = _query_archived_files(first, last, stations).all()
+
+    num_deleted_datasets = 0
+    for archived_file in archived_files:
+        datasets = read_archived_file(archived_file)
+        if is_last_inclusive:
+            is_deleted = (datasets['timepoint'] >= first) & (datasets['timepoint'] <= last)
+        else:
+            is_deleted = (datasets['timepoint'] >= first) & (datasets['timepoint'] < last)
+
+        if not is_deleted.any():
+            continue
+
+        previous_path = archived_file.path
+        if is_deleted.all():
+            db.session.delete(archived_file)
+        else:
+            write_archived_file(archived_file.station_id, archived_file.month_start, datasets[~is_deleted])
+        invalidate_analytics_snapshot()
+        db.session.commit()
+        remove_archived_files([previous_path])
+
+        num_deleted_datasets += int(is_deleted.sum())
+
+    return num_deleted_datasets
+
+
+def count_archived_files(first: datetime, last: datetime, stations: List[str]) -> int:
+    """
+    Returns the number of archived files of the stations overlapping the time period
+    """
+    if not is_archive_enabled():
+        return 0
+
+    return _query_archived_files(first, last, stations).count()
+
+
+def _query_archived_files(first, last, stations):
+    return ArchivedFile.query.filter(ArchivedFile.station_id.in_(stations),
+                                     ArchivedFile.first_timepoint <= last,
+                                     ArchivedFile.last_timepoint >= first)
+
+
+def delete_archived_station(station_id: str) -> None:
+    """
+    Deletes all archived data of the station
+    """
+    if not is_archive_enabled():
+        return
+
+    archived_files = ArchivedFile.query.filter(ArchivedFile.station_id == station_id).all()
+    for archived_file in archived_files:
+        db.session.delete(archived_file)
+    if archived_files:
+        invalidate_analytics_snapshot()
+    db.session.commit()
+
+    remove_archived_files([archived_file.path for archived_file in archived_files])
+
+
+def get_archived_time_period() -> Tuple[Optional[datetime], Optional[datetime]]:
+    if not is_archive_enabled():
+        return None, None
+
+    return (db.session.query(db.func.min(ArchivedFile.first_timepoint), db.func.max(ArchivedFile.last_timepoint))
+            .one())
+
+
+def _get_archive_filesystem():
+    # supports local paths as well as object stores (such as `gs://` or `s3://`)
+    filesystem, root_path = pyarrow.fs.FileSystem.from_uri(current_app.config['ARCHIVE_PATH'])
+    return filesystem, root_path.rstrip('/')
+
+
+def _write_file(station_id, month_start, datasets):
+    # each file is written only once, a file referenced by the committed manifest is therefore always complete
+    local_month_start = month_start.astimezone(LocalTimeZone.get(current_app).get_local_time_zone())
+    path = '{}/{}-{}.parquet'.format(station_id, local_month_start.strftime('%Y-%m'), uuid.uuid4().hex)
+    filesystem, root_path = _get_archive_filesystem()
+    filesystem.create_dir('{}/{}'.format(root_path, station_id), recursive=True)
+    pq.write_table(pyarrow.Table.from_pandas(datasets, preserve_index=False), '{}/{}'.format(root_path, path),
+                   filesystem=filesystem, compression=ARCHIVE_COMPRESSION,
+                   sorting_columns=[pq.SortingColumn(datasets.columns.get_loc('timepoint'))])
+
+    return path
+
+
+def _write_blocks(archived_file, datasets):
+    # the blocks are replaced within the transaction updating the manifest
+    db.session.flush()
+    (db.session.query(CompressedBlock)
+     .filter(CompressedBlock.station_id == archived_file.station_id,
+             CompressedBlock.month_start == archived_file.month_start)
+     .delete(synchronize_session=False))
+
+    for column_name, (num_values, data) in encode_datasets(datasets).items():
+        db.session.add(CompressedBlock(station_id=archived_file.station_id, month_start=archived_file.month_start,
+                                       column_name=column_name, num_values=num_values, data=data))
+
+
+def _read_archived(archived_file, column_names, first, last):
+    if archived_file.storage_format != BLOCKS_FORMAT:
+        filters = None
+        if first is not None:
+            filters = [('timepoint', '>=', _to_archived_timepoint(first)),
+                       ('timepoint', '<=', _to_archived_timepoint(last))]
+        return _read_file(archived_file.path, column_names, filters)
+
+    datasets = _read_blocks(archived_file, column_names)
+    if first is not None:
+        datasets = datasets[(datasets['timepoint'] >= first) & (datasets['timepoint'] <= last)]
+
+    return datasets
+
+
+def _read_file(path, column_names, filters):
+    filesystem, root_path = _get_archive_filesystem()
+    datasets = pq.read_table('{}/{}'.format(root_path, path), filesystem=filesystem, columns=column_names,
+                             filters=filters).to_pandas()
+    datasets['timepoint'] = pd.to_datetime(datasets['timepoint'], utc=True)
+
+    return datasets
+
+
+def _read_blocks(archived_file, column_names):
+    # only the blocks of the queried columns are loaded and decoded
+    query = (db.session.query(CompressedBlock.column_name, CompressedBlock.num_values, CompressedBlock.data)
+             .filter(CompressedBlock.station_id == archived_file.station_id,
+                     CompressedBlock.month_start == archived_file.month_start))
+    if column_names is not None:
+        query = query.filter(CompressedBlock.column_name.in_(column_names))
+    blocks = {column_name: (num_values, data) for column_name, num_values, data in query.all()}
+
+    if column_names is None:
+        column_names = [TIMEPOINT_BLOCK, 'station_id'] + [name for name in blocks if name != TIMEPOINT_BLOCK]
+
+    return decode_datasets(archived_file.station_id, blocks, column_names)
+
+
+def _to_archived_timepoint(timepoint):
+    # the comparison within the filters requires the exact type of the archived timepoints
+    return pd.Timestamp(timepoint).tz_convert('UTC').as_unit('ns')
+
+
+def _get_statistics(datasets):
+    statistics = {}
+    for column_name in datasets.columns:
+        if column_name in ['timepoint', 'station_id'] or datasets[column_name].isna().all():
+            continue
+        statistics[column_name] = [float(datasets[column_name].min()), float(datasets[column_name].max())]
+
+    return statistics
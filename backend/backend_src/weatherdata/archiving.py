@@ -0,0 +1,163 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import time
+from datetime import datetime
+from typing import List, Tuple
+
+import pandas as pd
+from flask import current_app
+
+from .archive import write_archived_file, read_archived_file, remove_archived_files
+from .deletion import delete_datasets
+from .query import QueryPlan, QueryPlanType, get_month_boundaries
+from ..extensions import db
+from ..job.runner import update_job_progress
+from ..models import WeatherDataset, ArchivedFile, wide_temp_humidity_sensor_data
+from ..sharding import get_station_shards, use_shard, get_weather_data_engine
+from ..utils import LocalTimeZone
+
+KEY_COLUMN_NAMES = ['timepoint', 'station_id']
+
+
+def archive_closed_months(job_id: int, stations: List[str]) -> None:
+    """
+    Moves the closed months older than `ARCHIVE_AGE_IN_MONTHS` of the stations month by month from the database into
+    the archive, each in a separate transaction
+    """
+    archive_end = get_archive_end(datetime.now(tz=LocalTimeZone.get(current_app).get_local_time_zone()),
+                                  current_app.config['ARCHIVE_AGE_IN_MONTHS'])
+
+    station_shards = get_station_shards(stations)
+    months = []
+    for station_id in stations:
+        with use_shard(station_shards[station_id]):
+            months.extend([(station_id, month_start, month_end)
+                           for month_start, month_end in get_months_to_archive(station_id, archive_end)])
+
+    num_archived_datasets = 0
+    for index, (station_id, month_start, month_end) in enumerate(months):
+        with use_shard(station_shards[station_id]):
+            num_month_datasets, previous_path = _archive_month(station_id, month_start, month_end)
+            num_archived_datasets += num_month_datasets
+            update_job_progress(job_id, 100 * (index + 1) / len(months), num_archived_datasets)
+            db.session.commit()
+
+        if previous_path:
+            remove_archived_files([previous_path])
+
+        pause_in_sec = current_app.config['DELETION_SLICE_PAUSE_IN_SEC']
+        if pause_in_sec > 0 and index < len(months) - 1:
+            time.sleep(pause_in_sec)
+
+    current_app.logger.info('Moved {} dataset(s) of {} month(s) into the archive'.format(num_archived_datasets,
+                                                                                         len(months)))
+
+
+def get_archive_end(now: datetime, archive_age_in_months: int) -> datetime:
+    """
+    Returns the start of the month `archive_age_in_months` before the current month, all earlier months are closed
+    """
+    local_time_zone = LocalTimeZone.get(current_app).get_local_time_zone()
+    local_now = now.astimezone(local_time_zone)
+    year, month = divmod(12 * local_now.year + local_now.month - 1 - archive_age_in_months, 12)
+
+    return local_time_zone.localize(datetime(year, month + 1, 1))
+
+
+def get_months_to_archive(station_id: str, archive_end: datetime) -> List[Tuple[datetime, datetime]]:
+    """
+    Returns the (start, end) of the months of the station with data before the archive end, the month of the latest
+    dataset is always kept in the database as it is required for the snapshot of the latest data
+    """
+    min_max_query_result = (db.session.query(db.func.min(WeatherDataset.timepoint).label('min_time'),
+                                             db.func.max(WeatherDataset.timepoint).label('max_time'))
+                            .filter(WeatherDataset.station_id == station_id)
+                            .one())
+    if min_max_query_result.min_time is None:
+        return []
+
+    first = _get_month_start(min_max_query_result.min_time)
+    last = min(archive_end, _get_month_start(min_max_query_result.max_time))
+    if last <= first:
+        return []
+
+    month_boundaries = get_month_boundaries(first, last)
+    return [(month_boundaries[index], month_boundaries[index + 1]) for index in range(len(month_boundaries) - 1)]
+
+
+def get_archive_plan() -> QueryPlan:
+    """
+    The archive contains all quantities of the datasets and of all supported temperature-humidity sensors
+    """
+    return QueryPlan(QueryPlanType.JOINED,
+                     [table_column for table_column in WeatherDataset.__table__.c
+                      if table_column.name not in KEY_COLUMN_NAMES + ['ingest_sequence']],
+                     [table_column for table_column in wide_temp_humidity_sensor_data.c
+                      if table_column.name not in KEY_COLUMN_NAMES])
+
+
+def read_month_datasets(station_id: str, month_start: datetime, month_end: datetime) -> pd.DataFrame:
+    """
+    Reads all datasets of the month of the station from the database and the archive with all archived columns
+    """
+    datasets = _read_database_month(station_id, month_start, month_end)
+    archived_file = db.session.get(ArchivedFile, (station_id, month_start))
+    if archived_file:
+        datasets = _combine_month(read_archived_file(archived_file), datasets)
+
+    return datasets
+
+
+def _archive_month(station_id, month_start, month_end):
+    datasets = _read_database_month(station_id, month_start, month_end)
+    if datasets.empty:
+        return 0, None
+
+    previous_path = None
+    archived_file = db.session.get(ArchivedFile, (station_id, month_start))
+    if archived_file:
+        previous_path = archived_file.path
+        datasets = _combine_month(read_archived_file(archived_file), datasets)
+
+    write_archived_file(station_id, month_start, datasets)
+    num_deleted_datasets = delete_datasets(month_start, month_end, [station_id])
+
+    return num_deleted_datasets, previous_path
+
+
+def _read_database_month(station_id, month_start, month_end):
+    plan = get_archive_plan()
+    return pd.read_sql(plan.select(plan.timepoint >= month_start, plan.timepoint < month_end,
+                                   plan.station_id == station_id),
+                       get_weather_data_engine())
+
+
+def _combine_month(archived_datasets, datasets):
+    if datasets.empty:
+        return archived_datasets
+
+    # data of an already archived month has been ingested later, the newer data is replacing the archived data
+    datasets = datasets.assign(timepoint=pd.to_datetime(datasets['timepoint'], utc=True))
+    datasets = pd.concat([archived_datasets, datasets], ignore_index=True)
+    return datasets.drop_duplicates(KEY_COLUMN_NAMES, keep='last')
+
+
+def _get_month_start(timepoint):
+    local_time_zone = LocalTimeZone.get(current_app).get_local_time_zone()
+    local_timepoint = timepoint.astimezone(local_time_zone)
+
+    return local_time_zone.localize(datetime(local_timepoint.year, local_timepoint.month, 1))
@@ -0,0 +1,103 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http import HTTPStatus
+
+from flask import current_app
+
+from ..exceptions import APIError
+
+# weight of the latest commit within the moving average of the commit latency
+COMMIT_LATENCY_SMOOTHING = 0.2
+
+
+class IngestMonitor(object):
+    """
+    Tracks the ingest requests waiting in the worker and the latency of their commits, new ingests are rejected while
+    the database is not keeping up
+    """
+
+    def __init__(self, max_pending_ingests: int, max_commit_latency_in_sec: float):
+        self.max_pending_ingests = max_pending_ingests
+        self.max_commit_latency_in_sec = max_commit_latency_in_sec
+        self.num_pending_ingests = 0
+        self.num_rejected_ingests = 0
+        # exponentially weighted moving average, includes the flush of the datasets before the commit
+        self.commit_latency_in_sec = 0.0
+
+    def is_overloaded(self) -> bool:
+        if self.num_pending_ingests >= self.max_pending_ingests:
+            return True
+
+        # a single ingest is always admitted while the commits are slow, its commit is updating the latency
+        return self.commit_latency_in_sec > self.max_commit_latency_in_sec and self.num_pending_ingests > 0
+
+    def record_commit_latency(self, latency_in_sec: float) -> None:
+        self.commit_latency_in_sec += COMMIT_LATENCY_SMOOTHING * (latency_in_sec - self.commit_latency_in_sec)
+
+    def get_stats(self) -> dict:
+        return {
+            'num_pending_ingests': self.num_pending_ingests,
+            'max_pending_ingests': self.max_pending_ingests,
+            'commit_latency_in_sec': self.commit_latency_in_sec,
+            'max_commit_latency_in_sec': self.max_commit_latency_in_sec,
+            'num_rejected_ingests': self.num_rejected_ingests
+        }
+
+
+def register_ingest_monitor(app) -> None:
+    app.extensions['ingest_monitor'] = IngestMonitor(app.config['MAX_PENDING_INGESTS'],
+                                                     app.config['MAX_INGEST_COMMIT_LATENCY_IN_SEC'])
+
+
+def get_ingest_monitor() -> IngestMonitor:
+    return current_app.extensions['ingest_monitor']
+
+
+def with_ingest_backpressure(fn):
+    """
+    Rejects the decorated ingest route with `503` and a `Retry-After` header while the ingest is overloaded, this is
+    done before the payload is read
+    """
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        monitor = get_ingest_monitor()
+        if monitor.is_overloaded():
+            monitor.num_rejected_ingests += 1
+            raise APIError('The ingest is overloaded ({} pending requests, commit latency {:.1f} s), retry later'
+                           .format(monitor.num_pending_ingests, monitor.commit_latency_in_sec),
+                           status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                           retry_after=current_app.config['INGEST_RETRY_AFTER_IN_SEC'])
+
+        monitor.num_pending_ingests += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            monitor.num_pending_ingests -= 1
+
+    return wrapper
+
+
+@contextmanager
+def measure_commit_latency():
+    start_time = time.monotonic()
+    yield
+    get_ingest_monitor().record_commit_latency(time.monotonic() - start_time)
@@ -0,0 +1,190 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import struct
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# number of values sharing the same bit width, smaller chunks are adapting faster to changing data
+CHUNK_SIZE = 64
+
+TIMEPOINT_BLOCK = 'timepoint'
+
+_TIMEPOINT_HEADER_FORMAT = '<q'
+_FLOAT_HEADER_FORMAT = '<Q'
+
+
+def encode_timepoints(timepoints: pd.Series) -> bytes:
+    """
+    Encodes the (sorted) timepoints as delta-of-delta of the microseconds since the epoch, regularly spaced timepoints
+    are encoded with zero bits
+    """
+    microseconds = pd.to_datetime(timepoints, utc=True).dt.as_unit('us').array.asi8
+    if len(microseconds) == 0:
+        return b''
+
+    deltas = np.diff(microseconds)
+    delta_of_deltas = np.diff(deltas, prepend=0)
+    return struct.pack(_TIMEPOINT_HEADER_FORMAT, microseconds[0]) + _encode_chunks(_zigzag_encode(delta_of_deltas))
+
+
+def decode_timepoints(data: bytes, num_values: int) -> pd.Series:
+    if num_values == 0:
+        return pd.Series([], dtype='datetime64[us, UTC]')
+
+    first_microseconds = struct.unpack_from(_TIMEPOINT_HEADER_FORMAT, data)[0]
+    delta_of_deltas = _zigzag_decode(_decode_chunks(data[struct.calcsize(_TIMEPOINT_HEADER_FORMAT):], num_values - 1))
+    offsets = np.concatenate([[0], np.cumsum(np.cumsum(delta_of_deltas))])
+
+    return pd.Series(pd.to_datetime(first_microseconds + offsets, unit='us', utc=True))
+
+
+def encode_floats(values: pd.Series) -> bytes:
+    """
+    Encodes the values as XOR with the previous value, unchanged or slowly changing values are resulting in only a few
+    meaningful bits (missing values are kept as NaN)
+    """
+    bits = values.to_numpy(dtype=np.float64).view(np.uint64)
+    if len(bits) == 0:
+        return b''
+
+    return struct.pack(_FLOAT_HEADER_FORMAT, bits[0]) + _encode_chunks(bits[1:] ^ bits[:-1])
+
+
+def decode_floats(data: bytes, num_values: int) -> np.ndarray:
+    if num_values == 0:
+        return np.array([], dtype=np.float64)
+
+    first_bits = np.uint64(struct.unpack_from(_FLOAT_HEADER_FORMAT, data)[0])
+    xor_values = _decode_chunks(data[struct.calcsize(_FLOAT_HEADER_FORMAT):], num_values - 1)
+
+    return np.bitwise_xor.accumulate(np.concatenate([[first_bits], xor_values])).view(np.float64)
+
+
+def encode_datasets(datasets: pd.DataFrame) -> Dict[str, Tuple[int, bytes]]:
+    """
+    Encodes the datasets of a single station sorted by timepoint into a block per column
+    """
+    blocks = {TIMEPOINT_BLOCK: (len(datasets), encode_timepoints(datasets['timepoint']))}
+    for column_name in datasets.columns:
+        if column_name not in [TIMEPOINT_BLOCK, 'station_id']:
+            blocks[column_name] = (len(datasets), encode_floats(datasets[column_name]))
+
+    return blocks
+
+
+def decode_datasets(station_id: str, blocks: Dict[str, Tuple[int, bytes]], column_names: List[str]) -> pd.DataFrame:
+    """
+    Decodes the blocks into the columns in the format of the queried datasets
+    """
+    datasets = {}
+    for column_name in column_names:
+        if column_name == 'station_id':
+            datasets[column_name] = station_id
+        elif column_name == TIMEPOINT_BLOCK:
+            datasets[column_name] = decode_timepoints(blocks[column_name][1], blocks[column_name][0]).array
+        else:
+            datasets[column_name] = decode_floats(blocks[column_name][1], blocks[column_name][0])
+
+    return pd.DataFrame(datasets, columns=column_names)
+
+
+def _encode_chunks(values):
+    # similar to the control bits of Gorilla a bitmap marks the non-zero values of the chunks, only these are stored
+    # with the bit width of their chunk and without the trailing zero bits common to the chunk, the bit stream is
+    # grouped by the bit width to allow a vectorized decoding
+    num_chunks = (len(values) + CHUNK_SIZE - 1) // CHUNK_SIZE
+    if num_chunks == 0:
+        return b''
+    chunk_starts = np.arange(num_chunks) * CHUNK_SIZE
+
+    is_non_zero = values != 0
+    trailing_zeros = np.where(is_non_zero, _get_bit_lengths(values & (~values + np.uint64(1))) - 1, 64)
+    shifts = np.minimum.reduceat(trailing_zeros, chunk_starts) % 64
+    shifted_values = values >> _expand_to_values(shifts, len(values)).astype(np.uint64)
+    widths = np.maximum.reduceat(_get_bit_lengths(shifted_values), chunk_starts)
+
+    # chunks containing only zeros are completely described by their header
+    is_in_coded_chunk = _expand_to_values(widths, len(values)) > 0
+    value_widths = _expand_to_values(widths, len(values))[is_non_zero]
+    stored_values = shifted_values[is_non_zero]
+
+    value_bits = [np.zeros(0, dtype=np.uint8)]
+    for width in np.unique(value_widths):
+        padded_bits = np.unpackbits(stored_values[value_widths == width].astype('>u8').view(np.uint8).reshape(-1, 8),
+                                    axis=1)
+        value_bits.append(padded_bits[:, 64 - width:].ravel())
+
+    chunk_headers = np.stack([shifts, widths], axis=1).astype(np.uint8)
+    return chunk_headers.tobytes() + np.packbits(is_non_zero[is_in_coded_chunk]).tobytes() + \
+        np.packbits(np.concatenate(value_bits)).tobytes()
+
+
+def _decode_chunks(data, num_values):
+    num_chunks = (num_values + CHUNK_SIZE - 1) // CHUNK_SIZE
+    chunk_headers = np.frombuffer(data, dtype=np.uint8, count=2 * num_chunks).reshape(num_chunks, 2)
+    shifts = _expand_to_values(chunk_headers[:, 0], num_values).astype(np.uint64)
+    widths = _expand_to_values(chunk_headers[:, 1], num_values).astype(np.int64)
+
+    is_in_coded_chunk = widths > 0
+    num_coded_values = int(is_in_coded_chunk.sum())
+    bitmap_size = (num_coded_values + 7) // 8
+    is_non_zero = np.zeros(num_values, dtype=bool)
+    is_non_zero[is_in_coded_chunk] = np.unpackbits(
+        np.frombuffer(data, dtype=np.uint8, count=bitmap_size, offset=2 * num_chunks), count=num_coded_values)
+    value_stream = np.unpackbits(np.frombuffer(data, dtype=np.uint8, offset=2 * num_chunks + bitmap_size))
+
+    value_widths = widths[is_non_zero]
+    stored_values = np.zeros(len(value_widths), dtype=np.uint64)
+    stream_offset = 0
+    for width in np.unique(value_widths):
+        is_width = value_widths == width
+        num_width_values = int(is_width.sum())
+        padded_bits = np.zeros((num_width_values, 64), dtype=np.uint8)
+        padded_bits[:, 64 - width:] = value_stream[stream_offset:stream_offset + num_width_values * width].reshape(
+            num_width_values, width)
+        stored_values[is_width] = np.packbits(padded_bits, axis=1).view('>u8').ravel()
+        stream_offset += num_width_values * width
+
+    values = np.zeros(num_values, dtype=np.uint64)
+    values[is_non_zero] = stored_values << shifts[is_non_zero]
+
+    return values
+
+
+def _expand_to_values(chunk_values, num_values):
+    return np.repeat(chunk_values, CHUNK_SIZE)[:num_values]
+
+
+def _get_bit_lengths(values):
+    bit_lengths = np.zeros(len(values), dtype=np.int64)
+    remaining_values = values.copy()
+    for shift in [32, 16, 8, 4, 2, 1]:
+        is_longer = remaining_values >= np.uint64(1 << shift)
+        bit_lengths[is_longer] += shift
+        remaining_values[is_longer] >>= np.uint64(shift)
+
+    return bit_lengths + (remaining_values > 0)
+
+
+def _zigzag_encode(values):
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+def _zigzag_decode(values):
+    return (values >> np.uint64(1)).view(np.int64) ^ -(values & np.uint64(1)).view(np.int64)
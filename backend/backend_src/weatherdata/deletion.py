@@ -0,0 +1,148 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import time
+from datetime import datetime
+from typing import List
+
+from flask import current_app
+
+from .archive import delete_archived_station, delete_archived_datasets
+from .invalidation import invalidate_analytics_snapshot
+from .latest import refresh_latest_datasets
+from .query import get_month_boundaries, get_available_time_period
+from ..extensions import db
+from ..job.runner import update_job_progress
+from ..models import WeatherDataset, TempHumiditySensorData, WeatherStation
+from ..sharding import use_shard, get_station_shards, group_by_shard, remove_station_from_shards
+
+
+def delete_station_in_slices(job_id: int, station_id: str) -> None:
+    """
+    Deletes all data of the station month by month, each in a separate transaction, and finally the station itself
+    """
+    with use_shard(get_station_shards([station_id])[station_id]):
+        min_max_query_result = (db.session.query(db.func.min(WeatherDataset.timepoint).label('min_time'),
+                                                 db.func.max(WeatherDataset.timepoint).label('max_time'))
+                                .filter(WeatherDataset.station_id == station_id)
+                                .one())
+
+        if min_max_query_result.min_time is not None:
+            _delete_in_slices(job_id,
+                              get_month_boundaries(min_max_query_result.min_time, min_max_query_result.max_time),
+                              [station_id], is_last_inclusive=True, num_final_steps=1)
+
+        delete_archived_station(station_id)
+
+    # any data ingested in the meantime is removed by the cascading foreign keys
+    remove_station_from_shards(station_id)
+    (db.session.query(WeatherStation)
+     .filter(WeatherStation.station_id == station_id)
+     .delete(synchronize_session=False))
+    invalidate_analytics_snapshot()
+    db.session.commit()
+
+
+def delete_datasets_in_slices(job_id: int, first: datetime, last: datetime, stations: List[str]) -> None:
+    """
+    Deletes the datasets of the stations within the time period month by month, each in a separate transaction (the
+    shards of the stations one after the other)
+    """
+    slice_boundaries_per_shard = {}
+    for shard, shard_station_ids in group_by_shard(stations).items():
+        with use_shard(shard):
+            slice_boundaries_per_shard[shard] = shard_station_ids, get_deletion_slices(first, last, shard_station_ids)
+
+    num_slices = sum(max(len(slice_boundaries) - 1, 0) for _, slice_boundaries in slice_boundaries_per_shard.values())
+    # the archived datasets of each shard are deleted in a final step
+    progress = _DeletionProgress(num_slices + len(slice_boundaries_per_shard))
+    for shard, (shard_station_ids, slice_boundaries) in slice_boundaries_per_shard.items():
+        with use_shard(shard):
+            if slice_boundaries:
+                # the end of the time period is exclusive, but the clipped end is the last available timepoint
+                _delete_in_slices(job_id, slice_boundaries, shard_station_ids,
+                                  is_last_inclusive=(slice_boundaries[-1] < last), progress=progress)
+
+            # each affected archived file is replaced within a separate transaction
+            progress.num_deleted_datasets += delete_archived_datasets(first, last, shard_station_ids)
+            # the first timepoint of the stations might have been within the archive
+            refresh_latest_datasets(shard_station_ids)
+            progress.num_deleted_slices += 1
+            update_job_progress(job_id, 100 * progress.num_deleted_slices / progress.num_slices,
+                                progress.num_deleted_datasets)
+            db.session.commit()
+
+
+def get_deletion_slices(first: datetime, last: datetime, stations: List[str]) -> List[datetime]:
+    """
+    Returns the boundaries of the monthly slices required for deleting the data of the stations within the time period
+    """
+    available_first, available_last = get_available_time_period(first, last, stations)
+    if available_first is None:
+        return []
+
+    return get_month_boundaries(available_first, available_last)
+
+
+def delete_datasets(first: datetime, last: datetime, stations: List[str], is_last_inclusive: bool = False) -> int:
+    """
+    Deletes the datasets of the stations (all stations if empty) within the time period as set-based operation
+    """
+    _delete_datasets_from_table(TempHumiditySensorData, first, last, stations, is_last_inclusive)
+    return _delete_datasets_from_table(WeatherDataset, first, last, stations, is_last_inclusive)
+
+
+def _delete_datasets_from_table(table, first_timepoint, last_timepoint, stations, is_last_inclusive):
+    query = db.session.query(table).filter(table.timepoint >= first_timepoint)
+
+    if is_last_inclusive:
+        query = query.filter(table.timepoint <= last_timepoint)
+    else:
+        query = query.filter(table.timepoint < last_timepoint)
+
+    if len(stations) > 0:
+        query = query.filter(table.station_id.in_(stations))
+    return query.delete(synchronize_session=False)
+
+
+class _DeletionProgress(object):
+    def __init__(self, num_slices):
+        self.num_slices = num_slices
+        self.num_deleted_slices = 0
+        self.num_deleted_datasets = 0
+
+
+def _delete_in_slices(job_id, slice_boundaries, stations, is_last_inclusive, num_final_steps=0, progress=None):
+    num_slices = len(slice_boundaries) - 1
+    if progress is None:
+        progress = _DeletionProgress(num_slices)
+
+    for index in range(num_slices):
+        progress.num_deleted_datasets += delete_datasets(
+            slice_boundaries[index], slice_boundaries[index + 1], stations,
+            is_last_inclusive=(is_last_inclusive and index == num_slices - 1))
+        progress.num_deleted_slices += 1
+        # keeps the snapshot of the latest datasets consistent after each committed slice
+        refresh_latest_datasets(stations)
+        # the analytics snapshot might have been refreshed since the previous slice
+        invalidate_analytics_snapshot()
+        update_job_progress(job_id, 100 * progress.num_deleted_slices / (progress.num_slices + num_final_steps),
+                            progress.num_deleted_datasets)
+        db.session.commit()
+
+        pause_in_sec = current_app.config['DELETION_SLICE_PAUSE_IN_SEC']
+        if pause_in_sec > 0 and index < num_slices - 1:
+            time.sleep(pause_in_sec)
@@ -0,0 +1,58 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from sqlalchemy.dialects.postgresql import insert
+
+from ..extensions import db
+from ..models import AnalyticsSnapshot, DeletionGeneration
+
+DELETION_GENERATION_ID = 1
+
+
+def invalidate_analytics_snapshot() -> None:
+    """
+    Needs to be called within every transaction deleting any data, a snapshot refreshed concurrently is then not
+    published either
+    """
+    # locks the counter until the end of the transaction, the publishing of a refreshed snapshot is waiting for it
+    _update_deletion_generation(1)
+    db.session.query(AnalyticsSnapshot).delete(synchronize_session=False)
+
+
+def get_deletion_generation() -> int:
+    """
+    Returns the number of the committed transactions that have deleted data
+    """
+    return db.session.query(DeletionGeneration.generation).filter(
+        DeletionGeneration.id == DELETION_GENERATION_ID).scalar() or 0
+
+
+def lock_deletion_generation() -> int:
+    """
+    Waits for all running transactions deleting data and blocks new ones until the end of the current transaction,
+    returns the number of the committed transactions that have deleted data
+    """
+    return _update_deletion_generation(0)
+
+
+def _update_deletion_generation(increment):
+    # the row is created by the first update, it is locked until the end of the transaction in any case
+    statement = (insert(DeletionGeneration)
+                 .values(id=DELETION_GENERATION_ID, generation=increment)
+                 .on_conflict_do_update(index_elements=[DeletionGeneration.id],
+                                        set_={'generation': DeletionGeneration.generation + increment})
+                 .returning(DeletionGeneration.generation))
+    return db.session.execute(statement).scalar()
@@ -0,0 +1,127 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from typing import List, Dict, Iterable
+
+from flask import current_app
+from sqlalchemy import case
+from sqlalchemy.dialects.postgresql import insert
+
+from ..extensions import db
+from ..models import WeatherDataset, LatestWeatherDataset, ArchivedFile
+from ..utils import calc_dewpoint, LocalTimeZone
+
+LATEST_DATASET_FIELDS = ['pressure', 'uv', 'direction', 'speed', 'wind_temperature', 'gusts']
+
+
+def update_latest_datasets(datasets: Iterable[WeatherDataset]) -> None:
+    """
+    Updates the snapshot of the latest dataset of each station with the newest of the datasets, needs to be called
+    within the ingesting transaction
+    """
+    latest_datasets = {}
+    first_timepoints = {}
+    for dataset in datasets:
+        station_id = dataset.station_id
+        if station_id not in latest_datasets or dataset.timepoint > latest_datasets[station_id].timepoint:
+            latest_datasets[station_id] = dataset
+        if station_id not in first_timepoints or dataset.timepoint < first_timepoints[station_id]:
+            first_timepoints[station_id] = dataset.timepoint
+
+    if latest_datasets:
+        _upsert_latest_datasets(latest_datasets.values(), first_timepoints, only_if_newer=True)
+
+
+def refresh_latest_datasets(station_ids: List[str]) -> None:
+    """
+    Rebuilds the snapshot of the latest dataset of the stations from the stored data, required after deletions
+    """
+    latest_datasets = []
+    first_timepoints = {}
+    for station_id in station_ids:
+        latest_dataset = (WeatherDataset.query
+                          .filter(WeatherDataset.station_id == station_id)
+                          .order_by(WeatherDataset.timepoint.desc())
+                          .first())
+        if latest_dataset:
+            latest_datasets.append(latest_dataset)
+            first_timepoints[station_id] = _get_first_timepoint(station_id)
+        else:
+            (db.session.query(LatestWeatherDataset)
+             .filter(LatestWeatherDataset.station_id == station_id)
+             .delete(synchronize_session=False))
+
+    if latest_datasets:
+        _upsert_latest_datasets(latest_datasets, first_timepoints, only_if_newer=False)
+
+
+def get_latest_datasets(station_ids: List[str]) -> Dict[str, Dict]:
+    latest_datasets = (db.session.query(LatestWeatherDataset)
+                       .filter(LatestWeatherDataset.station_id.in_(station_ids))
+                       .with_entities(LatestWeatherDataset.station_id, LatestWeatherDataset.dataset)
+                       .all())
+
+    return {station_id: dataset for station_id, dataset in latest_datasets}
+
+
+def _get_first_timepoint(station_id):
+    first_timepoint = (db.session.query(db.func.min(WeatherDataset.timepoint))
+                       .filter(WeatherDataset.station_id == station_id)
+                       .scalar_subquery())
+    first_archived_timepoint = (db.session.query(db.func.min(ArchivedFile.first_timepoint))
+                                .filter(ArchivedFile.station_id == station_id)
+                                .scalar_subquery())
+    return db.session.query(db.func.least(first_timepoint, first_archived_timepoint)).scalar()
+
+
+def _upsert_latest_datasets(datasets, first_timepoints, only_if_newer):
+    rows = [{'station_id': dataset.station_id, 'timepoint': dataset.timepoint, 'dataset': _to_dict(dataset),
+             'first_timepoint': first_timepoints[dataset.station_id]} for dataset in datasets]
+
+    statement = insert(LatestWeatherDataset).values(rows)
+    if only_if_newer:
+        # older data sent by a station catching up must not overwrite the snapshot, but might extend the time period
+        is_newer = LatestWeatherDataset.timepoint <= statement.excluded.timepoint
+        updated_columns = {
+            'timepoint': case((is_newer, statement.excluded.timepoint), else_=LatestWeatherDataset.timepoint),
+            'dataset': case((is_newer, statement.excluded.dataset), else_=LatestWeatherDataset.dataset),
+            'first_timepoint': db.func.least(LatestWeatherDataset.first_timepoint, statement.excluded.first_timepoint)
+        }
+    else:
+        updated_columns = {'timepoint': statement.excluded.timepoint, 'dataset': statement.excluded.dataset,
+                           'first_timepoint': statement.excluded.first_timepoint}
+
+    statement = statement.on_conflict_do_update(index_elements=[LatestWeatherDataset.station_id],
+                                                set_=updated_columns)
+    db.session.execute(statement)
+
+
+def _to_dict(dataset):
+    local_time_zone = LocalTimeZone.get(current_app).get_local_time_zone()
+    dataset_dict = {'timepoint': dataset.timepoint.astimezone(local_time_zone).isoformat()}
+    for field in LATEST_DATASET_FIELDS:
+        dataset_dict[field] = getattr(dataset, field)
+
+    dataset_dict['temperature_humidity'] = {}
+    for sensor_data in dataset.temperature_humidity:
+        dew_point = calc_dewpoint([sensor_data.temperature], [sensor_data.humidity])[0]
+        dataset_dict['temperature_humidity'][sensor_data.sensor_id] = {
+            'temperature': sensor_data.temperature,
+            'humidity': sensor_data.humidity,
+            'dewpoint': float(dew_point) if dew_point is not None else None
+        }
+
+    return dataset_dict
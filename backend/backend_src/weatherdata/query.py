@@ -0,0 +1,349 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from enum import Enum
+from http import HTTPStatus
+from typing import List, Optional, Tuple
+
+import pandas as pd
+from flask import current_app
+from gevent.pool import Pool
+from sqlalchemy import column, and_, tuple_, select, Select
+
+from .archive import read_archived_datasets
+from .wide import WIDE_QUANTITIES, get_wide_column_names
+from ..exceptions import APIError
+from ..extensions import db
+from ..models import WeatherDataset, TempHumiditySensor, wide_temp_humidity_sensor_data
+from ..read_replicas import get_read_engine
+from ..sharding import run_on_shards, get_weather_data_engine
+from ..utils import LocalTimeZone
+
+
+class QueryPlanType(Enum):
+    WEATHER_DATA_ONLY = 0
+    TEMP_HUMIDITY_DATA_ONLY = 1
+    JOINED = 2
+
+
+@dataclass
+class QueryPlan:
+    plan_type: QueryPlanType
+    dataset_columns: List[column]
+    wide_columns: List[column]
+
+    @property
+    def timepoint(self):
+        if self.plan_type == QueryPlanType.TEMP_HUMIDITY_DATA_ONLY:
+            return wide_temp_humidity_sensor_data.c.timepoint
+        return WeatherDataset.timepoint
+
+    @property
+    def station_id(self):
+        if self.plan_type == QueryPlanType.TEMP_HUMIDITY_DATA_ONLY:
+            return wide_temp_humidity_sensor_data.c.station_id
+        return WeatherDataset.station_id
+
+    @property
+    def column_names(self) -> List[str]:
+        plan_columns = self.dataset_columns + self.wide_columns
+        return ['timepoint', 'station_id'] + [plan_column.name for plan_column in plan_columns]
+
+    def select(self, *conditions, order_by_station: bool = False) -> Select:
+        statement = select(self.timepoint, self.station_id, *self.dataset_columns, *self.wide_columns)
+        if self.plan_type == QueryPlanType.JOINED:
+            statement = statement.select_from(WeatherDataset).outerjoin(
+                wide_temp_humidity_sensor_data,
+                and_(WeatherDataset.timepoint == wide_temp_humidity_sensor_data.c.timepoint,
+                     WeatherDataset.station_id == wide_temp_humidity_sensor_data.c.station_id))
+
+        order_by = [self.timepoint, self.station_id] if order_by_station else [self.timepoint]
+        return statement.where(*conditions).order_by(*order_by)
+
+
+@dataclass
+class WorkUnit:
+    station_id: str
+    first: datetime
+    last: datetime
+    is_last_inclusive: bool
+
+
+def query_weather_datasets(first: datetime, last: datetime, stations: List[str],
+                           queried_sensors: List[column]) -> pd.DataFrame:
+    """
+    Queries the weather datasets of the stations within the time period combined with the archived datasets,
+    long-range requests are split into (station, month) work units that are running concurrently on pooled connections
+    (the shards of the stations are queried concurrently as well)
+    """
+    plan = plan_query(queried_sensors, get_temp_humidity_sensor_ids())
+    partial_datasets = run_on_shards(stations, _query_shard, plan, first, last)
+    if not partial_datasets:
+        return pd.DataFrame(columns=plan.column_names)
+
+    return _merge_shards(partial_datasets)
+
+
+def query_weather_datasets_page(first: datetime, last: datetime, stations: List[str], queried_sensors: List[column],
+                                limit: int, cursor: Optional[str]) -> Tuple[pd.DataFrame, Optional[str]]:
+    """
+    Queries at most `limit` datasets following the `cursor` using keyset pagination on the primary key ordering
+    (timepoint, station_id), returns the cursor of the next page (`None` if this is the last page)
+    """
+    plan = plan_query(queried_sensors, get_temp_humidity_sensor_ids())
+    cursor_key = decode_cursor(cursor) if cursor else None
+
+    # each shard provides the first `limit` datasets of its stations, the page is the beginning of their merge
+    partial_datasets = run_on_shards(stations, _query_shard_page, plan, first, last, limit, cursor_key)
+    if not partial_datasets:
+        return pd.DataFrame(columns=plan.column_names), None
+    found_datasets = _merge_shards(partial_datasets, order_by_station=True).head(limit)
+
+    if len(found_datasets) < limit:
+        return found_datasets, None
+
+    last_timepoint, last_station_id = found_datasets[['timepoint', 'station_id']].iloc[-1]
+    return found_datasets, encode_cursor(last_timepoint, last_station_id)
+
+
+def query_changed_datasets(since: int, stations: List[str],
+                           queried_sensors: List[column]) -> Tuple[pd.DataFrame, int]:
+    """
+    Queries the weather datasets of the stations ingested or updated since the watermark, returns the new watermark
+    """
+    watermark = get_ingest_watermark()
+
+    # the ingest sequence is only part of the weather datasets
+    plan = plan_query(queried_sensors, get_temp_humidity_sensor_ids(), requires_datasets=True)
+    statement = plan.select(WeatherDataset.ingest_sequence >= since,
+                            WeatherDataset.ingest_sequence < watermark,
+                            WeatherDataset.station_id.in_(stations))
+    found_datasets = pd.read_sql(statement, get_weather_data_engine())
+
+    return found_datasets, watermark
+
+
+def plan_query(queried_sensors: List[column], temp_humidity_sensor_ids: List[str],
+               requires_datasets: bool = False) -> QueryPlan:
+    """
+    Plans the minimal query for the queried sensors: only the weather datasets, only the wide temperature-humidity
+    data of the existing sensors or the join of both (also if the weather datasets are required for filtering)
+    """
+    dataset_columns = [WeatherDataset.__table__.c[sensor.name] for sensor in queried_sensors
+                       if sensor.name not in WIDE_QUANTITIES]
+    wide_columns = [wide_temp_humidity_sensor_data.c[name]
+                    for name in get_wide_column_names(queried_sensors, temp_humidity_sensor_ids)]
+
+    if not wide_columns:
+        plan_type = QueryPlanType.WEATHER_DATA_ONLY
+    elif not dataset_columns and not requires_datasets:
+        plan_type = QueryPlanType.TEMP_HUMIDITY_DATA_ONLY
+    else:
+        plan_type = QueryPlanType.JOINED
+
+    return QueryPlan(plan_type, dataset_columns, wide_columns)
+
+
+def get_temp_humidity_sensor_ids() -> List[str]:
+    return [sensor[0] for sensor in db.session.query(TempHumiditySensor).with_entities(TempHumiditySensor.sensor_id)]
+
+
+def get_ingest_watermark() -> int:
+    """
+    All transactions with an id below the returned watermark are finished, data of concurrently running ingest
+    transactions is therefore returned by the next incremental read with this watermark
+    """
+    return db.session.execute(db.text('SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint'),
+                              bind_arguments={'bind': get_weather_data_engine()}).scalar()
+
+
+def encode_cursor(timepoint: datetime, station_id: str) -> str:
+    cursor_data = json.dumps({'timepoint': pd.Timestamp(timepoint).isoformat(), 'station_id': station_id})
+    return base64.urlsafe_b64encode(cursor_data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        cursor_data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        timepoint = datetime.fromisoformat(cursor_data['timepoint'])
+        station_id = cursor_data['station_id']
+    except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError):
+        raise APIError('Invalid cursor \'{}\''.format(cursor), status_code=HTTPStatus.BAD_REQUEST)
+
+    if not timepoint.tzinfo or not isinstance(station_id, str):
+        raise APIError('Invalid cursor \'{}\''.format(cursor), status_code=HTTPStatus.BAD_REQUEST)
+
+    return timepoint, station_id
+
+
+def split_into_work_units(first: datetime, last: datetime, stations: List[str]) -> List[WorkUnit]:
+    month_boundaries = get_month_boundaries(first, last)
+
+    work_units = []
+    for station_id in stations:
+        for index in range(len(month_boundaries) - 1):
+            is_last_inclusive = index == len(month_boundaries) - 2
+            work_units.append(WorkUnit(station_id, month_boundaries[index], month_boundaries[index + 1],
+                                       is_last_inclusive))
+
+    return work_units
+
+
+def get_available_time_period(first: datetime, last: datetime,
+                              stations: List[str]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """
+    Clips the time period to the data available for the stations, prevents the splitting of very long time periods
+    into (mostly empty) months without any data
+    """
+    min_max_query_result = (db.session.query(db.func.min(WeatherDataset.timepoint).label('min_time'),
+                                             db.func.max(WeatherDataset.timepoint).label('max_time'))
+                            .filter(WeatherDataset.station_id.in_(stations))
+                            .one())
+    if min_max_query_result.min_time is None:
+        return None, None
+
+    available_first = max(first, min_max_query_result.min_time)
+    available_last = min(last, min_max_query_result.max_time)
+    if available_last < available_first:
+        return None, None
+
+    return available_first, available_last
+
+
+def get_month_boundaries(first: datetime, last: datetime) -> List[datetime]:
+    local_time_zone = LocalTimeZone.get(current_app).get_local_time_zone()
+    local_first = first.astimezone(local_time_zone)
+
+    month_boundaries = [first]
+    year = local_first.year
+    month = local_first.month
+    while True:
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        month_start = local_time_zone.localize(datetime(year, month, 1))
+        if month_start >= last:
+            break
+        month_boundaries.append(month_start)
+    month_boundaries.append(last)
+
+    return month_boundaries
+
+
+def _query_shard(stations, plan, first, last):
+    archived_datasets = read_archived_datasets(first, last, stations, plan.column_names)
+    return _combine_with_archived_datasets(archived_datasets, _query_database(plan, first, last, stations))
+
+
+def _query_shard_page(stations, plan, first, last, limit, cursor_key):
+    conditions = [plan.timepoint >= first, plan.timepoint <= last, plan.station_id.in_(stations)]
+
+    cursor_timepoint, cursor_station_id = cursor_key if cursor_key else (None, None)
+    if cursor_key:
+        conditions.append(tuple_(plan.timepoint, plan.station_id) > tuple_(cursor_timepoint, cursor_station_id))
+
+    # the wide temperature-humidity data is not multiplying the rows, the limit is therefore counting datasets
+    statement = plan.select(*conditions, order_by_station=True).limit(limit)
+    found_datasets = pd.read_sql(statement, get_read_engine())
+
+    # up to one archived dataset per station at the timepoint of the cursor is not following the cursor
+    archived_datasets = read_archived_datasets(max(first, cursor_timepoint) if cursor_key else first, last, stations,
+                                               plan.column_names, limit=limit + len(stations))
+    if archived_datasets is not None and cursor_key:
+        archived_datasets = archived_datasets[
+            (archived_datasets['timepoint'] > cursor_timepoint) |
+            ((archived_datasets['timepoint'] == cursor_timepoint) &
+             (archived_datasets['station_id'] > cursor_station_id))]
+
+    return _combine_with_archived_datasets(archived_datasets, found_datasets, order_by_station=True).head(limit)
+
+
+def _query_database(plan, first, last, stations):
+    engine = get_read_engine()
+
+    # the round trips of the work units only pay off for long time periods, short ones do not require the clipping
+    work_units = []
+    if _is_long_range(first, last):
+        available_first, available_last = get_available_time_period(first, last, stations)
+        if available_first is not None and _is_long_range(available_first, available_last):
+            work_units = split_into_work_units(available_first, available_last, stations)
+
+    if len(work_units) <= 1:
+        return pd.read_sql(_build_statement(plan, first, last, stations, is_last_inclusive=True), engine)
+
+    statements = [_build_statement(plan, unit.first, unit.last, [unit.station_id], unit.is_last_inclusive)
+                  for unit in work_units]
+
+    # the greenlets are only cooperative if `psycopg2` is patched for `gevent` (as done in `wsgi.py`)
+    pool = Pool(current_app.config['QUERY_PARALLELISM'])
+    partial_datasets = pool.map(lambda statement: pd.read_sql(statement, engine), statements)
+
+    return _merge_in_time_order(partial_datasets)
+
+
+def _is_long_range(first, last):
+    return last - first >= timedelta(days=current_app.config['QUERY_SPLIT_MIN_PERIOD_IN_DAYS'])
+
+
+def _build_statement(plan, first, last, stations, is_last_inclusive):
+    if is_last_inclusive:
+        last_condition = plan.timepoint <= last
+    else:
+        last_condition = plan.timepoint < last
+
+    return plan.select(plan.timepoint >= first, last_condition, plan.station_id.in_(stations))
+
+
+def _combine_with_archived_datasets(archived_datasets, datasets, order_by_station=False):
+    if archived_datasets is None or archived_datasets.empty:
+        return datasets
+    if datasets.empty:
+        return archived_datasets
+
+    datasets = datasets.assign(timepoint=pd.to_datetime(datasets['timepoint'], utc=True))
+    combined_datasets = pd.concat([archived_datasets, datasets], ignore_index=True)
+    # data ingested later into an already archived month is replacing the archived data
+    combined_datasets = combined_datasets.drop_duplicates(['timepoint', 'station_id'], keep='last')
+
+    order_by = ['timepoint', 'station_id'] if order_by_station else ['timepoint']
+    return combined_datasets.sort_values(order_by, kind='stable', ignore_index=True)
+
+
+def _merge_shards(partial_datasets, order_by_station=False):
+    if len(partial_datasets) == 1:
+        return partial_datasets[0]
+
+    non_empty_datasets = [datasets.assign(timepoint=pd.to_datetime(datasets['timepoint'], utc=True))
+                          for datasets in partial_datasets if not datasets.empty]
+    if not non_empty_datasets:
+        return partial_datasets[0]
+
+    # the stations are disjoint between the shards
+    order_by = ['timepoint', 'station_id'] if order_by_station else ['timepoint']
+    return pd.concat(non_empty_datasets, ignore_index=True).sort_values(order_by, kind='stable', ignore_index=True)
+
+
+def _merge_in_time_order(partial_datasets):
+    non_empty_datasets = [dataset for dataset in partial_datasets if not dataset.empty]
+    if not non_empty_datasets:
+        return partial_datasets[0]
+
+    merged_datasets = pd.concat(non_empty_datasets, ignore_index=True)
+    # a stable sort keeps the order of the rows within each work unit
+    return merged_datasets.sort_values('timepoint', kind='stable', ignore_index=True)
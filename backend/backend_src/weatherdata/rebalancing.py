@@ -0,0 +1,164 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import time
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from .query import get_ingest_watermark, get_month_boundaries
+from ..extensions import db
+from ..job.runner import update_job_progress
+from ..models import WeatherDataset, TempHumiditySensorData, wide_temp_humidity_sensor_data, LatestWeatherDataset, \
+    ArchivedFile, CompressedBlock, current_transaction_id
+from ..sharding import get_station_shards, get_shard_engine, use_shard, copy_reference_rows, lock_station_for_move, \
+    assign_station_to_shard
+
+# tables containing the data of a station at a timepoint, in the order required by the foreign keys
+DATASET_TABLES = [WeatherDataset.__table__, TempHumiditySensorData.__table__, wide_temp_humidity_sensor_data]
+# tables containing data of a station independent of the timepoint
+STATION_TABLES = [LatestWeatherDataset.__table__, ArchivedFile.__table__, CompressedBlock.__table__]
+
+# polling interval while waiting for the transactions still writing into the previous shard
+TRANSACTION_POLLING_INTERVAL_IN_SEC = 0.05
+
+
+def move_station_to_shard(job_id: int, station_id: str, target_shard: int) -> None:
+    """
+    Moves all data of the station into the target shard while the station keeps ingesting: the data is copied month by
+    month, the datasets changed in the meantime are copied again while the writes of the station are blocked for
+    switching the shard map and finally the data is deleted from the previous shard month by month
+
+    Deletions of data of the station while it is moved are not applied to the target shard.
+    """
+    source_shard = get_station_shards([station_id])[station_id]
+    if source_shard == target_shard:
+        current_app.logger.info('Station \'{}\' is already stored within shard {}'.format(station_id, target_shard))
+        return
+
+    copy_reference_rows(target_shard, [station_id])
+    source_engine = get_shard_engine(source_shard)
+    target_engine = get_shard_engine(target_shard)
+
+    with use_shard(source_shard):
+        watermark = get_ingest_watermark()
+        min_max_query_result = (db.session.query(db.func.min(WeatherDataset.timepoint).label('min_time'),
+                                                 db.func.max(WeatherDataset.timepoint).label('max_time'))
+                                .filter(WeatherDataset.station_id == station_id)
+                                .one())
+
+    month_boundaries = []
+    if min_max_query_result.min_time is not None:
+        month_boundaries = get_month_boundaries(min_max_query_result.min_time, min_max_query_result.max_time)
+    num_months = max(len(month_boundaries) - 1, 0)
+    num_steps = 2 * num_months + 1
+
+    num_copied_datasets = 0
+    for index in range(num_months):
+        with source_engine.connect() as source_connection, target_engine.begin() as target_connection:
+            num_copied_datasets += _copy_datasets(source_connection, target_connection, station_id,
+                                                  *_get_month_conditions(month_boundaries, index))
+        update_job_progress(job_id, 100 * (index + 1) / num_steps, num_copied_datasets)
+        db.session.commit()
+
+    # the writes of the station are blocked from here until the shard map is switched
+    lock_station_for_move(station_id)
+    with source_engine.connect() as source_connection:
+        _wait_for_running_transactions(source_connection)
+        changed_timepoints = source_connection.execute(
+            select(WeatherDataset.timepoint).where(WeatherDataset.station_id == station_id,
+                                                   WeatherDataset.ingest_sequence >= watermark)).scalars().all()
+        with target_engine.begin() as target_connection:
+            if changed_timepoints:
+                num_copied_datasets += _copy_datasets(source_connection, target_connection, station_id,
+                                                      lambda table: table.c.timepoint.in_(changed_timepoints))
+            for table in STATION_TABLES:
+                _copy_rows(source_connection, target_connection, table, table.c.station_id == station_id)
+
+    assign_station_to_shard(station_id, target_shard)
+    update_job_progress(job_id, 100 * (num_months + 1) / num_steps, num_copied_datasets)
+    db.session.commit()
+    current_app.logger.info('Switched station \'{}\' from shard {} to shard {}'.format(station_id, source_shard,
+                                                                                       target_shard))
+
+    # the data is only read from the target shard from now on, the archived files are shared by all shards
+    with source_engine.begin() as source_connection:
+        for table in reversed(STATION_TABLES):
+            source_connection.execute(table.delete().where(table.c.station_id == station_id))
+
+    for index in range(num_months):
+        with source_engine.begin() as source_connection:
+            for table in reversed(DATASET_TABLES):
+                source_connection.execute(table.delete().where(
+                    table.c.station_id == station_id,
+                    *[condition(table) for condition in _get_month_conditions(month_boundaries, index)]))
+        update_job_progress(job_id, 100 * (num_months + 2 + index) / num_steps, num_copied_datasets)
+        db.session.commit()
+
+        pause_in_sec = current_app.config['DELETION_SLICE_PAUSE_IN_SEC']
+        if pause_in_sec > 0 and index < num_months - 1:
+            time.sleep(pause_in_sec)
+
+    current_app.logger.info('Moved {} dataset(s) of station \'{}\' into shard {}'.format(num_copied_datasets,
+                                                                                         station_id, target_shard))
+
+
+def _get_month_conditions(month_boundaries, index):
+    first, last = month_boundaries[index], month_boundaries[index + 1]
+    if index == len(month_boundaries) - 2:
+        return (lambda table: table.c.timepoint >= first), (lambda table: table.c.timepoint <= last)
+
+    return (lambda table: table.c.timepoint >= first), (lambda table: table.c.timepoint < last)
+
+
+def _copy_datasets(source_connection, target_connection, station_id, *conditions):
+    num_copied_datasets = 0
+    for table in DATASET_TABLES:
+        num_copied_rows = _copy_rows(source_connection, target_connection, table, table.c.station_id == station_id,
+                                     *[condition(table) for condition in conditions])
+        if table is WeatherDataset.__table__:
+            num_copied_datasets = num_copied_rows
+
+    return num_copied_datasets
+
+
+def _copy_rows(source_connection, target_connection, table, *conditions):
+    # the ingest sequence is only meaningful within a database, the copies are new ingests of the target shard
+    copied_columns = [table_column for table_column in table.c if table_column.name != 'ingest_sequence']
+    rows = source_connection.execute(select(*copied_columns).where(*conditions)).mappings().all()
+    if not rows:
+        return 0
+
+    statement = insert(table)
+    updated_values = {table_column.name: statement.excluded[table_column.name]
+                      for table_column in copied_columns if not table_column.primary_key}
+    if 'ingest_sequence' in table.c:
+        updated_values['ingest_sequence'] = current_transaction_id()
+    statement = statement.on_conflict_do_update(index_elements=list(table.primary_key.columns), set_=updated_values)
+    target_connection.execute(statement, [dict(row) for row in rows])
+
+    return len(rows)
+
+
+def _wait_for_running_transactions(connection):
+    # the writes of the station that have passed the shard map before it was locked are committed within the shard
+    # only after the lock has been released by the primary database
+    next_transaction_id = connection.execute(
+        db.text('SELECT pg_snapshot_xmax(pg_current_snapshot())::text::bigint')).scalar()
+    while connection.execute(
+            db.text('SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint')).scalar() < next_transaction_id:
+        time.sleep(TRANSACTION_POLLING_INTERVAL_IN_SEC)
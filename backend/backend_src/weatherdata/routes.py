@@ -16,6 +16,7 @@
 
 import gzip
 import json
+import time
 from http import HTTPStatus
 from typing import List
 
@@ -26,11 +27,31 @@ from sqlalchemy import column
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql.elements import Tuple
 
+from .admission import estimate_query_cost, admit_query, limit_concurrency
+from .analytics import QueryEngine, query_weather_datasets_from_snapshot, is_analytics_enabled, \
+    refresh_analytics_snapshot
+from .archive import is_archive_enabled, delete_archived_datasets, get_archived_time_period, count_archived_files
+from .archiving import archive_closed_months
+from .backpressure import with_ingest_backpressure, measure_commit_latency
+from .deletion import delete_datasets, delete_datasets_in_slices, get_deletion_slices
+from .invalidation import invalidate_analytics_snapshot
+from .latest import update_latest_datasets, refresh_latest_datasets, get_latest_datasets
+from .query import query_weather_datasets, query_weather_datasets_page, query_changed_datasets, get_ingest_watermark
 from .schemas import single_weather_dataset_schema, time_period_with_sensors_and_stations_schema
-from .schemas import time_period_with_stations_schema, many_weather_datasets_schema
+from .schemas import time_period_with_stations_schema, many_weather_datasets_schema, \
+    changes_since_with_sensors_and_stations_schema
+from .update import update_datasets
+from .wide import refresh_wide_temp_humidity_sensor_data, split_wide_column_name
 from ..exceptions import APIError
+from ..executor.pool import run_offloaded
+from ..metrics.instrumentation import DATASETS_RETURNED, DATASETS_INGESTED, measure_stage, observe_stage, \
+    format_stage_durations
+from ..metrics.profiling import with_profiling, PROFILE_PARAMETER
 from ..extensions import db
-from ..models import WeatherDataset, TempHumiditySensorData, WeatherStation
+from ..job.runner import start_job
+from ..models import WeatherDataset, WeatherStation, current_transaction_id
+from ..read_replicas import read_from_replica
+from ..sharding import iterate_shards, get_station_shards, use_shard, run_on_shards, PRIMARY_SHARD
 from ..sensor.models import Sensor
 from ..utils import Role, with_rollback_and_raise_exception, approve_committed_station_ids, validate_items, \
     calc_dewpoint
@@ -42,15 +63,11 @@ weatherdata_blueprint = Blueprint('data', __name__, url_prefix='/api/v1/data')
 @weatherdata_blueprint.route('', methods=['POST'])
 @access_level_required(Role.PUSH_USER)
 @json_with_rollback_and_raise_exception
+@with_ingest_backpressure
 def add_weather_datasets():
     num_ignored_datasets = 0
 
-    if request.content_encoding == 'gzip':
-        uncompressed_data = gzip.decompress(request.data)
-    else:
-        uncompressed_data = request.data
-    json_data = json.loads(uncompressed_data)
-    all_datasets = many_weather_datasets_schema.load(json_data, session=db.session)
+    all_datasets = many_weather_datasets_schema.load(_load_json_data(), session=db.session)
     _add_timezone_to_datasets_if_required(all_datasets)
 
     try:
@@ -58,6 +75,7 @@ def add_weather_datasets():
     except IntegrityError:
         num_ignored_datasets = _add_new_datasets_only(all_datasets)
 
+    DATASETS_INGESTED.inc(len(all_datasets) - num_ignored_datasets)
     log_message = 'Added {} datasets to the database'.format(len(all_datasets) - num_ignored_datasets)
     if num_ignored_datasets > 0:
         log_message += ', ignored {} already existing datasets'.format(num_ignored_datasets)
@@ -66,14 +84,30 @@ def add_weather_datasets():
     return '', HTTPStatus.NO_CONTENT
 
 
+def _load_json_data():
+    # decompressing and parsing large uploads is blocking the event loop
+    return run_offloaded(_decode_json_data, request.data, request.content_encoding == 'gzip')
+
+
+def _decode_json_data(data, is_gzip_compressed):
+    if is_gzip_compressed:
+        uncompressed_data = gzip.decompress(data)
+    else:
+        uncompressed_data = data
+    return json.loads(uncompressed_data)
+
+
 def _add_new_datasets_only(all_datasets):
     # existing datasets are ignored in the POST-request
     db.session.rollback()
 
     keys_to_add = [(dataset.timepoint, dataset.station_id) for dataset in all_datasets]
-    existing_datasets = WeatherDataset.query.filter(Tuple(WeatherDataset.timepoint, WeatherDataset.station_id)
-                                                    .in_(keys_to_add)).all()
-    existing_keys = [(dataset.timepoint, dataset.station_id) for dataset in existing_datasets]
+    existing_keys = []
+    for shard_station_ids in iterate_shards(list(set(station_id for _, station_id in keys_to_add))):
+        existing_datasets = WeatherDataset.query.filter(Tuple(WeatherDataset.timepoint, WeatherDataset.station_id)
+                                                        .in_([key for key in keys_to_add
+                                                              if key[1] in shard_station_ids])).all()
+        existing_keys += [(dataset.timepoint, dataset.station_id) for dataset in existing_datasets]
 
     new_datasets = [x for x in all_datasets if (x.timepoint, x.station_id) not in existing_keys]
     num_ignored_datasets = len(all_datasets) - len(new_datasets)
@@ -98,10 +132,20 @@ def _add_timezone_to_datasets_if_required(all_datasets):
 
 
 def _perform_add_datasets(all_datasets):
-    db.session.add_all(all_datasets)
     station_ids_in_commit = set([dataset.station_id for dataset in all_datasets])
     approve_committed_station_ids(station_ids_in_commit)
-    db.session.commit()
+
+    with measure_commit_latency():
+        # the datasets of each shard are flushed while the session is using the shard
+        for shard_station_ids in iterate_shards(list(station_ids_in_commit), lock_for_write=True):
+            shard_datasets = [dataset for dataset in all_datasets if dataset.station_id in shard_station_ids]
+            db.session.add_all(shard_datasets)
+            refresh_wide_temp_humidity_sensor_data([(dataset.timepoint, dataset.station_id)
+                                                    for dataset in shard_datasets])
+            update_latest_datasets(shard_datasets)
+            db.session.flush()
+
+        db.session.commit()
 
 
 @weatherdata_blueprint.route('', methods=['PUT'])
@@ -112,145 +156,252 @@ def update_weather_dataset():
 
     approve_committed_station_ids([new_dataset.station_id])
 
-    existing_dataset = WeatherDataset.query.filter(
-        WeatherDataset.timepoint == new_dataset.timepoint and
-        WeatherDataset.station_id == new_dataset.station_id
-    ).one_or_none()
-
-    if not existing_dataset:
-        raise APIError('No dataset for station \'{}\' at timepoint \'{}\''.format(
-            new_dataset.station_id,
-            new_dataset.timepoint
-        ), status_code=HTTPStatus.NOT_FOUND)
-
-    existing_dataset.pressure = new_dataset.pressure
-    existing_dataset.uv = new_dataset.uv
-    existing_dataset.rain_count = new_dataset.rain_counter
-
-    for index, existing_sensor_data in enumerate(existing_dataset.temperature_humidity):
-        existing_sensor_id = existing_sensor_data.sensor_id
-
-        sensors_matched = False
-        for new_sensor_data in new_dataset.temperature_humidity:
-            if new_sensor_data.sensor_id == existing_sensor_id:
-                existing_sensor_data.temperature = new_sensor_data.temperature
-                existing_sensor_data.humidity = new_sensor_data.humidity
-                sensors_matched = True
-                break
-
-        if not sensors_matched:
-            raise APIError('No matching temperature humidity sensor found for sensor id \'{}\''
-                           .format(existing_sensor_id), status_code=HTTPStatus.NOT_FOUND)
-
-    existing_dataset.direction = new_dataset.direction
-    existing_dataset.speed = new_dataset.speed
-    existing_dataset.wind_temperature = new_dataset.wind_temperature
-    existing_dataset.gusts = new_dataset.gusts
+    shard = get_station_shards([new_dataset.station_id], lock_for_write=True)[new_dataset.station_id]
+    with use_shard(shard):
+        existing_dataset = WeatherDataset.query.filter(
+            WeatherDataset.timepoint == new_dataset.timepoint,
+            WeatherDataset.station_id == new_dataset.station_id
+        ).one_or_none()
+
+        if not existing_dataset:
+            raise APIError('No dataset for station \'{}\' at timepoint \'{}\''.format(
+                new_dataset.station_id,
+                new_dataset.timepoint
+            ), status_code=HTTPStatus.NOT_FOUND)
+
+        existing_dataset.pressure = new_dataset.pressure
+        existing_dataset.uv = new_dataset.uv
+        existing_dataset.rain_counter = new_dataset.rain_counter
+
+        for index, existing_sensor_data in enumerate(existing_dataset.temperature_humidity):
+            existing_sensor_id = existing_sensor_data.sensor_id
+
+            sensors_matched = False
+            for new_sensor_data in new_dataset.temperature_humidity:
+                if new_sensor_data.sensor_id == existing_sensor_id:
+                    existing_sensor_data.temperature = new_sensor_data.temperature
+                    existing_sensor_data.humidity = new_sensor_data.humidity
+                    sensors_matched = True
+                    break
+
+            if not sensors_matched:
+                raise APIError('No matching temperature humidity sensor found for sensor id \'{}\''
+                               .format(existing_sensor_id), status_code=HTTPStatus.NOT_FOUND)
+
+        existing_dataset.direction = new_dataset.direction
+        existing_dataset.speed = new_dataset.speed
+        existing_dataset.wind_temperature = new_dataset.wind_temperature
+        existing_dataset.gusts = new_dataset.gusts
+        existing_dataset.ingest_sequence = current_transaction_id()
+        refresh_wide_temp_humidity_sensor_data([(existing_dataset.timepoint, existing_dataset.station_id)])
+        update_latest_datasets([existing_dataset])
+
+        db.session.commit()
+
+        current_app.logger.info('Updated data for station \'{}\' at timepoint \'{}\''
+                                .format(existing_dataset.station_id, existing_dataset.timepoint))
+
+    return '', HTTPStatus.NO_CONTENT
+
+
+@weatherdata_blueprint.route('/batch', methods=['PUT'])
+@access_level_required(Role.PUSH_USER)
+@json_with_rollback_and_raise_exception
+def update_weather_datasets():
+    all_datasets = many_weather_datasets_schema.load(_load_json_data(), session=db.session)
+    _add_timezone_to_datasets_if_required(all_datasets)
+
+    approve_committed_station_ids(set([dataset.station_id for dataset in all_datasets]))
+
+    num_updated_datasets = 0
+    not_found = []
+    for shard_station_ids in iterate_shards(list(set(dataset.station_id for dataset in all_datasets)),
+                                            lock_for_write=True):
+        num_shard_updated_datasets, shard_not_found = update_datasets(
+            [dataset for dataset in all_datasets if dataset.station_id in shard_station_ids])
+        num_updated_datasets += num_shard_updated_datasets
+        not_found += shard_not_found
 
     db.session.commit()
 
-    current_app.logger.info('Updated data for station \'{}\' at timepoint \'{}\''
-                            .format(existing_dataset.station_id, existing_dataset.timepoint))
+    current_app.logger.info('Updated {} datasets in the database, {} datasets or sensor data have not been found'
+                            .format(num_updated_datasets, len(not_found)))
 
-    return '', HTTPStatus.NO_CONTENT
+    for not_found_data in not_found:
+        not_found_data['timepoint'] = not_found_data['timepoint'].isoformat()
+
+    return jsonify({'num_updated_datasets': num_updated_datasets, 'not_found': not_found}), HTTPStatus.OK
 
 
 @weatherdata_blueprint.route('', methods=['GET'])
 @access_level_required(Role.GUEST)
 @with_rollback_and_raise_exception
+@with_profiling
+@read_from_replica
 def get_weather_datasets():
-    first, last, requested_sensors, requested_stations = _get_query_params()
+    first, last, requested_sensors, requested_stations, limit, cursor = _get_query_params()
 
-    all_sensors = [sensor[0] for sensor in db.session.query(Sensor).with_entities(Sensor.sensor_id).all()]
-    validate_items(requested_sensors, all_sensors, 'sensor')
+    requested_sensors, queried_sensors, requested_stations, rain_calib_factors = \
+        _validate_sensors_and_stations(requested_sensors, requested_stations)
 
-    if len(requested_sensors) == 0:
-        requested_sensors = all_sensors
+    if last < first:
+        raise APIError('Last time \'{}\' is later than first time \'{}\''.format(last, first),
+                       status_code=HTTPStatus.BAD_REQUEST)
 
-    queried_sensors = _get_queried_sensors(requested_sensors)
+    if limit is None and cursor is not None:
+        raise APIError('A cursor can only be used together with a limit', status_code=HTTPStatus.BAD_REQUEST)
+
+    cost = estimate_query_cost(first, last, requested_stations, queried_sensors, limit)
+    query_engine, snapshot = admit_query(first, last, cost, is_paged=limit is not None)
+    with limit_concurrency(cost), measure_stage('sql'):
+        if limit is not None:
+            found_datasets, next_cursor = query_weather_datasets_page(first, last, requested_stations,
+                                                                      queried_sensors, limit, cursor)
+        elif query_engine == QueryEngine.DUCKDB:
+            found_datasets = query_weather_datasets_from_snapshot(snapshot, first, last, requested_stations,
+                                                                  queried_sensors)
+        else:
+            found_datasets = query_weather_datasets(first, last, requested_stations, queried_sensors)
 
-    all_stations_data = db.session.query(WeatherStation).with_entities(WeatherStation.station_id,
-                                                                       WeatherStation.rain_calib_factor).all()
-    all_stations = [station_data[0] for station_data in all_stations_data]
-    rain_calib_factors = {station_data[0]: station_data[1] for station_data in all_stations_data}
+    # required to provide standard conformant JSON containing `null` and not `NaN`
+    found_datasets = found_datasets.replace([np.nan], [None])
+
+    if found_datasets.empty:
+        if limit is not None:
+            return jsonify({'data': {}, 'next_cursor': None}), HTTPStatus.OK
+        return jsonify({}), HTTPStatus.OK
+
+    found_datasets_per_station, num_datasets_per_station = _reshape_datasets(found_datasets, requested_sensors,
+                                                                             rain_calib_factors)
+    DATASETS_RETURNED.inc(len(found_datasets))
+
+    num_datasets_log_str = ', '.join(num_datasets_per_station)
+    with measure_stage('serialization'):
+        if limit is not None:
+            # the derived rain values are restarting on each page
+            response = jsonify({'data': found_datasets_per_station, 'next_cursor': next_cursor})
+        else:
+            response = jsonify(found_datasets_per_station)
+    response.status_code = HTTPStatus.OK
+    current_app.logger.info('Returned datasets from time period \'{}\'-\'{}\' ({}) {}'
+                            .format(first, last, num_datasets_log_str, format_stage_durations()))
+
+    return response
+
+
+@weatherdata_blueprint.route('/latest', methods=['GET'])
+@access_level_required(Role.GUEST)
+@with_rollback_and_raise_exception
+@with_profiling
+@read_from_replica
+def get_latest_weather_datasets():
+    requested_stations = _obtain_request_args_for_get_method()['stations']
+
+    all_stations = [station[0] for station in
+                    db.session.query(WeatherStation).with_entities(WeatherStation.station_id).all()]
     validate_items(requested_stations, all_stations, 'station')
 
     if len(requested_stations) == 0:
         requested_stations = all_stations
 
-    if last < first:
-        raise APIError('Last time \'{}\' is later than first time \'{}\''.format(last, first),
+    latest_datasets = {}
+    with measure_stage('sql'):
+        for latest_shard_datasets in run_on_shards(requested_stations, get_latest_datasets):
+            latest_datasets.update(latest_shard_datasets)
+
+    with measure_stage('serialization'):
+        response = jsonify(latest_datasets)
+    response.status_code = HTTPStatus.OK
+    current_app.logger.info('Returned the latest datasets of {} stations {}'
+                            .format(len(latest_datasets), format_stage_durations()))
+
+    return response
+
+
+@weatherdata_blueprint.route('/changes', methods=['GET'])
+@access_level_required(Role.GUEST)
+@with_rollback_and_raise_exception
+@with_profiling
+def get_changed_weather_datasets():
+    changes_request = changes_since_with_sensors_and_stations_schema.load(_obtain_request_args_for_get_method())
+    since = changes_request.get('since')
+
+    requested_sensors, queried_sensors, requested_stations, rain_calib_factors = \
+        _validate_sensors_and_stations(changes_request['sensors'], changes_request['stations'])
+
+    # the watermarks of different shards are not comparable
+    shards = set(get_station_shards(requested_stations).values())
+    if len(shards) > 1:
+        raise APIError('The changes can only be read for stations within the same shard',
                        status_code=HTTPStatus.BAD_REQUEST)
 
-    found_datasets = pd.read_sql(db.session.query(WeatherDataset)
-                                 .filter(WeatherDataset.timepoint >= first)
-                                 .filter(WeatherDataset.timepoint <= last)
-                                 .filter(WeatherDataset.station_id.in_(requested_stations))
-                                 .join(WeatherDataset.temperature_humidity, isouter=True)
-                                 .order_by(WeatherDataset.timepoint).with_entities(WeatherDataset.timepoint,
-                                                                                   WeatherDataset.station_id,
-                                                                                   TempHumiditySensorData.sensor_id,
-                                                                                   *queried_sensors).statement,
-                                 db.engines['weather-data'])
+    shard = shards.pop() if shards else PRIMARY_SHARD
+    with use_shard(shard):
+        if since is None:
+            # the initial request of a client only provides the watermark to start polling from
+            watermark = _format_watermark(shard, get_ingest_watermark())
+            current_app.logger.info('Returned the current ingest watermark {}'.format(watermark))
+            return jsonify({'data': {}, 'watermark': watermark}), HTTPStatus.OK
 
-    found_datasets = _add_missing_temperature_sensor_data(found_datasets)
+        since_shard, since_sequence = _parse_watermark(since)
+        if since_shard != shard:
+            # the moved datasets have new ingest sequences of the target shard, the client needs to read all data again
+            raise APIError('The watermark \'{}\' has been issued for shard {}, but the stations are now stored in '
+                           'shard {}'.format(since, since_shard, shard), status_code=HTTPStatus.GONE)
+
+        with measure_stage('sql'):
+            found_datasets, sequence = query_changed_datasets(since_sequence, requested_stations, queried_sensors)
+        watermark = _format_watermark(shard, sequence)
 
     # required to provide standard conformant JSON containing `null` and not `NaN`
     found_datasets = found_datasets.replace([np.nan], [None])
 
     if found_datasets.empty:
-        return jsonify({}), HTTPStatus.OK
+        current_app.logger.info('No datasets changed since ingest watermark {}'.format(since))
+        return jsonify({'data': {}, 'watermark': watermark}), HTTPStatus.OK
 
-    found_datasets_per_station, num_datasets_per_station = _reshape_datasets_to_dict(found_datasets, requested_sensors,
-                                                                                     rain_calib_factors)
+    # the derived rain values are only covering the changed datasets
+    found_datasets_per_station, num_datasets_per_station = _reshape_datasets(found_datasets, requested_sensors,
+                                                                             rain_calib_factors)
+    DATASETS_RETURNED.inc(len(found_datasets))
 
-    num_datasets_log_str = ', '.join(num_datasets_per_station)
-    response = jsonify(found_datasets_per_station)
+    with measure_stage('serialization'):
+        response = jsonify({'data': found_datasets_per_station, 'watermark': watermark})
     response.status_code = HTTPStatus.OK
-    current_app.logger.info('Returned datasets from time period \'{}\'-\'{}\' ({})'.format(first, last,
-                                                                                           num_datasets_log_str))
+    current_app.logger.info('Returned datasets changed since ingest watermark {} ({}) {}'
+                            .format(since, ', '.join(num_datasets_per_station), format_stage_durations()))
 
     return response
 
 
-def _add_missing_temperature_sensor_data(found_datasets):
-    missing_time_points, time_points_are_missing = _get_missing_time_points(found_datasets)
+def _format_watermark(shard, sequence):
+    return '{}:{}'.format(shard, sequence)
 
-    if not time_points_are_missing:
-        return found_datasets
 
-    nan_datasets = []
-    for sensor_id in missing_time_points:
-        nan_dataset = found_datasets[found_datasets['timepoint'].isin(missing_time_points[sensor_id])
-                                     & (found_datasets['sensor_id'] == 'IN')]
-        nan_dataset.loc[:, 'sensor_id'] = sensor_id
-        if 'temperature' in found_datasets.columns:
-            nan_dataset.loc[:, 'temperature'] = np.nan
-        if 'humidity' in found_datasets.columns:
-            nan_dataset.loc[:, 'humidity'] = np.nan
-        nan_datasets.append(nan_dataset)
+def _parse_watermark(watermark):
+    shard, sequence = watermark.split(':')
+    return int(shard), int(sequence)
 
-    found_datasets = pd.concat(nan_datasets + [found_datasets])
-    found_datasets = found_datasets.sort_values('timepoint')
 
-    return found_datasets
+def _validate_sensors_and_stations(requested_sensors, requested_stations):
+    all_sensors = [sensor[0] for sensor in db.session.query(Sensor).with_entities(Sensor.sensor_id).all()]
+    validate_items(requested_sensors, all_sensors, 'sensor')
 
+    if len(requested_sensors) == 0:
+        requested_sensors = all_sensors
 
-def _get_missing_time_points(found_datasets):
-    missing_time_points = {}
-    time_points_in = set(found_datasets[found_datasets['sensor_id'] == 'IN']['timepoint'])  # IN is always available
-    time_points_are_missing = False
+    queried_sensors = _get_queried_sensors(requested_sensors)
 
-    for sensor_id in found_datasets['sensor_id'].unique():
-        if sensor_id == 'IN':
-            continue
+    all_stations_data = db.session.query(WeatherStation).with_entities(WeatherStation.station_id,
+                                                                       WeatherStation.rain_calib_factor).all()
+    all_stations = [station_data[0] for station_data in all_stations_data]
+    rain_calib_factors = {station_data[0]: station_data[1] for station_data in all_stations_data}
+    validate_items(requested_stations, all_stations, 'station')
 
-        time_points = set(found_datasets[found_datasets['sensor_id'] == sensor_id]['timepoint'])
-        missing_time_points[sensor_id] = list(time_points_in.difference(time_points))
-        if len(missing_time_points[sensor_id]) > 0:
-            time_points_are_missing = True
+    if len(requested_stations) == 0:
+        requested_stations = all_stations
 
-    return missing_time_points, time_points_are_missing
+    return requested_sensors, queried_sensors, requested_stations, rain_calib_factors
 
 
 def _get_query_params():
@@ -266,12 +417,15 @@ def _get_query_params():
 
     requested_sensors = time_period_with_sensors['sensors']
     requested_stations = time_period_with_sensors['stations']
+    limit = time_period_with_sensors.get('limit')
+    cursor = time_period_with_sensors.get('cursor')
 
-    return first, last, requested_sensors, requested_stations
+    return first, last, requested_sensors, requested_stations, limit, cursor
 
 
 def _obtain_request_args_for_get_method():
     request_args = dict(request.args.to_dict())
+    request_args.pop(PROFILE_PARAMETER, None)
 
     if 'sensors' not in request_args:
         request_args['sensors'] = []
@@ -313,42 +467,62 @@ def _get_queried_sensors(requested_sensors) -> List[column]:
     return queried_sensors
 
 
-def _reshape_datasets_to_dict(found_datasets, requested_sensors, rain_calib_factors):
-    found_datasets['timepoint'] = (pd.to_datetime(found_datasets['timepoint'], utc=True).dt
-                                   .tz_convert(current_app.config['TIMEZONE']))
+def _reshape_datasets(found_datasets, requested_sensors, rain_calib_factors):
+    start_time = time.perf_counter()
+    found_datasets_per_station, num_datasets_per_station, dewpoint_duration = run_offloaded(
+        _reshape_datasets_to_dict, found_datasets, requested_sensors, rain_calib_factors,
+        current_app.config['TIMEZONE'])
 
-    found_datasets_per_station = {}
-    temp_humidity_sensor_ids = found_datasets.sensor_id.unique()
-    grouped_datasets = found_datasets.groupby(['station_id', 'sensor_id'])
-
-    for sensor_id in list(found_datasets.columns):
-        if sensor_id not in ['station_id', 'sensor_id']:
-            for dataset in grouped_datasets[sensor_id]:
-                station_id = dataset[0][0]
-                temp_humidity_sensor = dataset[0][1]
-                data = dataset[1].to_list()
-
-                if station_id not in found_datasets_per_station:
-                    found_datasets_per_station[station_id] = _create_station_dict(requested_sensors,
-                                                                                  temp_humidity_sensor_ids)
-
-                if sensor_id in ['temperature', 'humidity']:
-                    found_datasets_per_station[station_id]['temperature_humidity'][temp_humidity_sensor][
-                        sensor_id] = data
-                elif sensor_id in ['rain_counter']:
-                    _reshape_rain(found_datasets_per_station, requested_sensors, dataset, rain_calib_factors,
-                                  station_id)
-                else:
-                    found_datasets_per_station[station_id][sensor_id] = data
+    observe_stage('reshape', time.perf_counter() - start_time - dewpoint_duration)
+    if 'dewpoint' in requested_sensors:
+        observe_stage('dewpoint', dewpoint_duration)
 
+    return found_datasets_per_station, num_datasets_per_station
+
+
+def _reshape_datasets_to_dict(found_datasets, requested_sensors, rain_calib_factors, time_zone):
+    # runs on the worker pool, the app context (and the metrics of the worker) are therefore not available
+    found_datasets['timepoint'] = pd.to_datetime(found_datasets['timepoint'], utc=True).dt.tz_convert(time_zone)
+
+    # all stations are containing the temperature-humidity sensors present in any of the found datasets
+    temp_humidity_sensor_ids = []
+    for wide_column_name in found_datasets.columns:
+        wide_column = split_wide_column_name(wide_column_name)
+        if wide_column and wide_column[1] not in temp_humidity_sensor_ids and \
+                found_datasets[wide_column_name].notna().any():
+            temp_humidity_sensor_ids.append(wide_column[1])
+
+    found_datasets_per_station = {}
+    for station_id, station_datasets in found_datasets.groupby('station_id'):
+        station_dict = _create_station_dict(requested_sensors, temp_humidity_sensor_ids)
+        found_datasets_per_station[station_id] = station_dict
+
+        for sensor_id in list(found_datasets.columns):
+            if sensor_id == 'station_id':
+                continue
+
+            wide_column = split_wide_column_name(sensor_id)
+            if wide_column:
+                quantity, temp_humidity_sensor = wide_column
+                if temp_humidity_sensor in temp_humidity_sensor_ids:
+                    station_dict['temperature_humidity'][temp_humidity_sensor][quantity] = \
+                        station_datasets[sensor_id].to_list()
+            elif sensor_id in ['rain_counter']:
+                _reshape_rain(station_dict, requested_sensors, station_datasets[sensor_id], rain_calib_factors,
+                              station_id)
+            else:
+                station_dict[sensor_id] = station_datasets[sensor_id].to_list()
+
+    dewpoint_start_time = time.perf_counter()
     if 'dewpoint' in requested_sensors:
         _reshape_dewpoint(found_datasets_per_station, requested_sensors)
+    dewpoint_duration = time.perf_counter() - dewpoint_start_time
 
     num_datasets_per_station = []
     for station_id, dataset in found_datasets_per_station.items():
         num_datasets_per_station.append('{}: {}'.format(station_id, len(dataset['timepoint'])))
 
-    return found_datasets_per_station, num_datasets_per_station
+    return found_datasets_per_station, num_datasets_per_station, dewpoint_duration
 
 
 def _reshape_dewpoint(found_datasets_per_station, requested_sensors):
@@ -363,17 +537,17 @@ def _reshape_dewpoint(found_datasets_per_station, requested_sensors):
                 del temp_humid_data['humidity']
 
 
-def _reshape_rain(found_datasets_per_station, requested_sensors, dataset, rain_calib_factors, station_id):
-    rain_rate = dataset[1].diff() * rain_calib_factors[station_id]
+def _reshape_rain(station_dict, requested_sensors, rain_counter, rain_calib_factors, station_id):
+    rain_rate = rain_counter.diff() * rain_calib_factors[station_id]
 
     # handle reset of the rain counter to 0 due to battery replacement, etc.
     rain_rate = rain_rate.clip(lower=0)
     rain_rate.iloc[0] = 0
 
     if 'rain_rate' in requested_sensors:
-        found_datasets_per_station[station_id]['rain_rate'] = rain_rate.to_list()
+        station_dict['rain_rate'] = rain_rate.to_list()
     if 'rain' in requested_sensors:
-        found_datasets_per_station[station_id]['rain'] = rain_rate.cumsum().to_list()
+        station_dict['rain'] = rain_rate.cumsum().to_list()
 
 
 def _create_station_dict(requested_sensors, temp_humidity_sensor_ids):
@@ -396,43 +570,62 @@ def delete_weather_dataset():
     last = time_period_with_stations['last_timepoint']
     stations = time_period_with_stations['stations']
 
+    # times without given timezone are assumed to be given in server time zone (as done by the database before)
+    if not first.tzinfo:
+        first = LocalTimeZone.get(current_app).get_local_time_zone().localize(first)
+    if not last.tzinfo:
+        last = LocalTimeZone.get(current_app).get_local_time_zone().localize(last)
+
     all_stations = [sensor[0] for sensor in
                     db.session.query(WeatherStation).with_entities(WeatherStation.station_id).all()]
     validate_items(stations, all_stations, 'station')
-
-    _delete_datasets_from_table(TempHumiditySensorData, first, last, stations)
-    num_deleted_datasets = _delete_datasets_from_table(WeatherDataset, first, last, stations)
-
-    db.session.commit()
-
     if len(stations) == 0:
+        stations = all_stations
         station_log_str = 'all stations'
     else:
         station_log_str = 'the stations [' + ', '.join(stations) + ']'
 
+    spans_several_months = any(len(deletion_slices) > 2 for deletion_slices in
+                               run_on_shards(stations, _get_deletion_slices, first, last))
+    spans_several_archived_files = sum(run_on_shards(stations, _count_archived_files, first, last)) > 1
+    if spans_several_months or spans_several_archived_files:
+        # deletions spanning several months are running as job to keep the locks and transactions small
+        job = start_job('Deletion of datasets within time period \'{}\'-\'{}\' for {}'
+                        .format(first, last, station_log_str), delete_datasets_in_slices, first, last, stations)
+        response = jsonify(job)
+        response.status_code = HTTPStatus.ACCEPTED
+        response.headers['location'] = '/api/v1/job/{}'.format(job.id)
+        return response
+
+    # the archived datasets are not within the database, the affected archived file is replaced separately
+    num_deleted_datasets = 0
+    for shard_station_ids in iterate_shards(stations):
+        num_deleted_datasets += delete_archived_datasets(first, last, shard_station_ids)
+
+    for shard_station_ids in iterate_shards(stations, lock_for_write=True):
+        num_deleted_datasets += delete_datasets(first, last, shard_station_ids)
+        refresh_latest_datasets(shard_station_ids)
+
+    invalidate_analytics_snapshot()
+    db.session.commit()
+
     current_app.logger.info('Deleted {} dataset(s) within time period \'{}\'-\'{}\' for {} from the database'
                             .format(num_deleted_datasets, first, last, station_log_str))
     return '', HTTPStatus.NO_CONTENT
 
 
-def _delete_datasets_from_table(table, first_timepoint, last_timepoint, stations):
-    query = (db.session.query(table)
-             .filter(table.timepoint >= first_timepoint)
-             .filter(table.timepoint < last_timepoint))
-
-    if len(stations) > 0:
-        query = query.filter(table.station_id.in_(stations))
-    return query.delete(synchronize_session=False)
-
-
 @weatherdata_blueprint.route('/limits', methods=['GET'])
 @access_level_required(Role.GUEST)
 @with_rollback_and_raise_exception
+@read_from_replica
 def get_available_time_period():
-    min_max_query_result = db.session.query(db.func.min(WeatherDataset.timepoint).label('min_time'),
-                                            db.func.max(WeatherDataset.timepoint).label('max_time')).one()
-    first_timepoint = min_max_query_result.min_time
-    last_timepoint = min_max_query_result.max_time
+    all_stations = [station[0] for station in
+                    db.session.query(WeatherStation).with_entities(WeatherStation.station_id).all()]
+    shard_time_periods = [time_period for shard_time_periods in run_on_shards(all_stations, _get_shard_time_periods)
+                          for time_period in shard_time_periods]
+
+    first_timepoint = _get_extreme_timepoint(min, *[first for first, _ in shard_time_periods])
+    last_timepoint = _get_extreme_timepoint(max, *[last for _, last in shard_time_periods])
 
     time_range = {
         'first_timepoint': first_timepoint,
@@ -445,3 +638,66 @@ def get_available_time_period():
                                                                                    time_range['last_timepoint']))
 
     return response
+
+
+@weatherdata_blueprint.route('/archive', methods=['POST'])
+@access_level_required(Role.ADMIN)
+@with_rollback_and_raise_exception
+def archive_weather_datasets():
+    if not is_archive_enabled():
+        raise APIError('No archive is configured', status_code=HTTPStatus.BAD_REQUEST)
+
+    all_stations = [station[0] for station in
+                    db.session.query(WeatherStation).with_entities(WeatherStation.station_id).all()]
+
+    # moving months of data out of the database takes too long for a single request
+    job = start_job('Archiving of the closed months older than {} months'
+                    .format(current_app.config['ARCHIVE_AGE_IN_MONTHS']), archive_closed_months, all_stations)
+
+    response = jsonify(job)
+    response.status_code = HTTPStatus.ACCEPTED
+    response.headers['location'] = '/api/v1/job/{}'.format(job.id)
+
+    return response
+
+
+@weatherdata_blueprint.route('/analytics/snapshot', methods=['POST'])
+@access_level_required(Role.ADMIN)
+@with_rollback_and_raise_exception
+def create_analytics_snapshot():
+    if not is_analytics_enabled():
+        raise APIError('No analytics engine is configured', status_code=HTTPStatus.BAD_REQUEST)
+
+    all_stations = [station[0] for station in
+                    db.session.query(WeatherStation).with_entities(WeatherStation.station_id).all()]
+
+    job = start_job('Creation of the analytics snapshot', refresh_analytics_snapshot, all_stations)
+
+    response = jsonify(job)
+    response.status_code = HTTPStatus.ACCEPTED
+    response.headers['location'] = '/api/v1/job/{}'.format(job.id)
+
+    return response
+
+
+def _get_shard_time_periods(_):
+    min_max_query_result = db.session.query(db.func.min(WeatherDataset.timepoint).label('min_time'),
+                                            db.func.max(WeatherDataset.timepoint).label('max_time')).one()
+
+    return [(min_max_query_result.min_time, min_max_query_result.max_time), get_archived_time_period()]
+
+
+def _get_deletion_slices(stations, first, last):
+    return get_deletion_slices(first, last, stations)
+
+
+def _count_archived_files(stations, first, last):
+    return count_archived_files(first, last, stations)
+
+
+def _get_extreme_timepoint(extreme_function, *timepoints):
+    available_timepoints = [timepoint for timepoint in timepoints if timepoint is not None]
+    if not available_timepoints:
+        return None
+
+    return extreme_function(available_timepoints)
@@ -17,6 +17,7 @@
 import marshmallow
 import marshmallow_sqlalchemy
 from marshmallow.schema import Schema
+from marshmallow.validate import Range, Regexp
 from marshmallow_sqlalchemy import fields, field_for
 
 from ..extensions import ma
@@ -39,6 +40,7 @@ class TempHumiditySensorSchema(ma.SQLAlchemyAutoSchema):
 class WeatherDatasetSchema(ma.SQLAlchemyAutoSchema):
     class Meta:
         model = WeatherDataset
+        exclude = ('ingest_sequence',)
         include_fk = True
         load_instance = True
         transient = True
@@ -52,6 +54,18 @@ class TimePeriodWithSensorsAndStationsSchema(Schema):
     last_timepoint = marshmallow.fields.DateTime(required=True)
     sensors = marshmallow.fields.List(marshmallow.fields.String, required=True)
     stations = marshmallow.fields.List(marshmallow.fields.String, required=True)
+    limit = marshmallow.fields.Integer(validate=Range(min=1))
+    cursor = marshmallow.fields.String()
+
+
+WATERMARK_PATTERN = r'^\d+:\d+$'
+
+
+class ChangesSinceWithSensorsAndStationsSchema(Schema):
+    # the watermark is only valid within the shard it has been issued for (`<shard>:<ingest sequence>`)
+    since = marshmallow.fields.String(validate=Regexp(WATERMARK_PATTERN, error='Invalid watermark'))
+    sensors = marshmallow.fields.List(marshmallow.fields.String, required=True)
+    stations = marshmallow.fields.List(marshmallow.fields.String, required=True)
 
 
 class TimePeriodWithStationSchema(Schema):
@@ -63,5 +77,6 @@ class TimePeriodWithStationSchema(Schema):
 # initialize the schemas
 time_period_with_sensors_and_stations_schema = TimePeriodWithSensorsAndStationsSchema()
 time_period_with_stations_schema = TimePeriodWithStationSchema()
+changes_since_with_sensors_and_stations_schema = ChangesSinceWithSensorsAndStationsSchema()
 single_weather_dataset_schema = WeatherDatasetSchema()
 many_weather_datasets_schema = WeatherDatasetSchema(many=True)
@@ -0,0 +1,78 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from typing import List, Dict, Tuple
+
+from sqlalchemy import values, column, update, cast
+
+from .latest import refresh_latest_datasets
+from .wide import refresh_wide_temp_humidity_sensor_data
+from ..extensions import db
+from ..models import WeatherDataset, TempHumiditySensorData, current_transaction_id
+
+UPDATED_DATASET_FIELDS = ['pressure', 'uv', 'rain_counter', 'direction', 'speed', 'wind_temperature', 'gusts']
+UPDATED_SENSOR_DATA_FIELDS = ['temperature', 'humidity']
+
+
+def update_datasets(datasets: List[WeatherDataset]) -> Tuple[int, List[Dict]]:
+    """
+    Updates the existing datasets with a single `UPDATE ... FROM (VALUES ...)` statement per table, returns the number
+    of updated datasets and the keys of all datasets and temperature-humidity sensor data not found in the database
+    """
+    if len(datasets) == 0:
+        return 0, []
+
+    dataset_rows = [(dataset.timepoint, dataset.station_id,
+                     *[getattr(dataset, field) for field in UPDATED_DATASET_FIELDS])
+                    for dataset in datasets]
+    updated_keys = _update_table(WeatherDataset, ['timepoint', 'station_id'], UPDATED_DATASET_FIELDS, dataset_rows,
+                                 ingest_sequence=current_transaction_id())
+    not_found = [{'timepoint': dataset.timepoint, 'station_id': dataset.station_id}
+                 for dataset in datasets if (dataset.timepoint, dataset.station_id) not in updated_keys]
+
+    # the sensor data of not existing datasets cannot exist either and is only reported with the dataset
+    sensor_data_rows = [(dataset.timepoint, dataset.station_id, sensor_data.sensor_id,
+                         *[getattr(sensor_data, field) for field in UPDATED_SENSOR_DATA_FIELDS])
+                        for dataset in datasets if (dataset.timepoint, dataset.station_id) in updated_keys
+                        for sensor_data in dataset.temperature_humidity]
+    if sensor_data_rows:
+        updated_sensor_keys = _update_table(TempHumiditySensorData, ['timepoint', 'station_id', 'sensor_id'],
+                                            UPDATED_SENSOR_DATA_FIELDS, sensor_data_rows)
+        not_found += [{'timepoint': row[0], 'station_id': row[1], 'sensor_id': row[2]}
+                      for row in sensor_data_rows if tuple(row[:3]) not in updated_sensor_keys]
+        refresh_wide_temp_humidity_sensor_data(list(set((row[0], row[1]) for row in updated_sensor_keys)))
+
+    # an update of an older dataset is not changing the snapshot, but rebuilding it is cheaper than checking this
+    refresh_latest_datasets(sorted(set(station_id for _, station_id in updated_keys)))
+
+    return len(updated_keys), not_found
+
+
+def _update_table(table, key_fields, fields, rows, **additional_values):
+    table_columns = table.__table__.c
+    updated_data = values(*[column(field, table_columns[field].type) for field in key_fields + fields],
+                          name='updated_data').data(rows)
+
+    # the type of a `VALUES`-column containing only `NULL` is unknown to the database and needs to be specified
+    new_values = {field: cast(updated_data.c[field], table_columns[field].type) for field in fields}
+    new_values.update(additional_values)
+
+    statement = (update(table)
+                 .where(*[table_columns[field] == updated_data.c[field] for field in key_fields])
+                 .values(new_values)
+                 .returning(*[table_columns[field] for field in key_fields]))
+
+    return set(tuple(updated_key) for updated_key in db.session.execute(statement).all())
@@ -0,0 +1,85 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import datetime
+from typing import List, Tuple, Optional
+
+from sqlalchemy import tuple_, select, column
+from sqlalchemy.dialects.postgresql import insert
+
+from ..extensions import db
+from ..models import TempHumiditySensorData, wide_temp_humidity_sensor_data, WIDE_TEMP_HUMIDITY_SENSOR_IDS, \
+    get_wide_column_name
+
+WIDE_QUANTITIES = ['temperature', 'humidity']
+
+
+def refresh_wide_temp_humidity_sensor_data(keys: Optional[List[Tuple[datetime, str]]] = None) -> None:
+    """
+    Pivots the temperature-humidity sensor data of the datasets with the (timepoint, station_id)-keys (all datasets if
+    `None`) into the wide representation, needs to be called within the transaction writing the sensor data
+    """
+    if keys is not None and len(keys) == 0:
+        return
+
+    pivoted_columns = [db.func.max(getattr(TempHumiditySensorData, quantity))
+                       .filter(TempHumiditySensorData.sensor_id == sensor_id)
+                       .label(get_wide_column_name(quantity, sensor_id))
+                       for sensor_id in WIDE_TEMP_HUMIDITY_SENSOR_IDS for quantity in WIDE_QUANTITIES]
+    pivot_query = select(TempHumiditySensorData.timepoint, TempHumiditySensorData.station_id, *pivoted_columns)
+    if keys is not None:
+        pivot_query = pivot_query.where(tuple_(TempHumiditySensorData.timepoint, TempHumiditySensorData.station_id)
+                                        .in_(keys))
+    pivot_query = pivot_query.group_by(TempHumiditySensorData.timepoint, TempHumiditySensorData.station_id)
+
+    statement = insert(wide_temp_humidity_sensor_data).from_select(
+        [wide_column.name for wide_column in wide_temp_humidity_sensor_data.c], pivot_query)
+    statement = statement.on_conflict_do_update(
+        index_elements=[wide_temp_humidity_sensor_data.c.timepoint, wide_temp_humidity_sensor_data.c.station_id],
+        set_={name: statement.excluded[name] for name in get_wide_column_names()}
+    )
+
+    # the sensor data added within the session is required to be present in the database
+    db.session.flush()
+    db.session.execute(statement)
+
+
+def get_wide_column_names(queried_sensors: Optional[List[column]] = None,
+                          sensor_ids: Optional[List[str]] = None) -> List[str]:
+    """
+    Returns the names of the wide sensor data columns of the queried sensors and temperature-humidity sensor ids (all if
+    `None`)
+    """
+    queried_quantities = WIDE_QUANTITIES
+    if queried_sensors is not None:
+        queried_sensor_names = [sensor.name for sensor in queried_sensors]
+        queried_quantities = [quantity for quantity in WIDE_QUANTITIES if quantity in queried_sensor_names]
+
+    return [get_wide_column_name(quantity, sensor_id)
+            for sensor_id in WIDE_TEMP_HUMIDITY_SENSOR_IDS for quantity in queried_quantities
+            if sensor_ids is None or sensor_id in sensor_ids]
+
+
+def split_wide_column_name(name: str) -> Optional[Tuple[str, str]]:
+    """
+    Returns the quantity and the sensor id of a wide sensor data column, `None` for any other column
+    """
+    for quantity in WIDE_QUANTITIES:
+        prefix = '{}_'.format(quantity)
+        if name.startswith(prefix) and name[len(prefix):] in WIDE_TEMP_HUMIDITY_SENSOR_IDS:
+            return quantity, name[len(prefix):]
+
+    return None
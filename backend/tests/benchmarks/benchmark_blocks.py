@@ -0,0 +1,68 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Compression ratio and decode throughput of the compressed time-series blocks for a month of TE923 data, run from the
+backend directory with:
+
+    python -m tests.benchmarks.benchmark_blocks
+"""
+import io
+import time
+from datetime import datetime
+
+import pytz
+
+from backend_src.weatherdata.blocks import encode_datasets, decode_floats, decode_timepoints, TIMEPOINT_BLOCK
+from .te923_data import generate_te923_datasets
+
+NUM_DECODE_REPETITIONS = 20
+
+
+def main():
+    datasets = generate_te923_datasets('TES', pytz.timezone('Europe/Berlin').localize(datetime(2021, 3, 1)),
+                                       num_days=31)
+    num_values = len(datasets)
+
+    print('Compressed blocks of {} TE923 datasets (one month)\n'.format(num_values))
+    print('{:<20} {:>10} {:>10} {:>8} {:>16}'.format('Column', 'Raw [B]', 'Block [B]', 'Ratio', 'Decode [MVal/s]'))
+
+    total_raw_size = 0
+    total_block_size = 0
+    for column_name, (block_num_values, data) in encode_datasets(datasets).items():
+        decode = decode_timepoints if column_name == TIMEPOINT_BLOCK else decode_floats
+        start_time = time.perf_counter()
+        for _ in range(NUM_DECODE_REPETITIONS):
+            decode(data, block_num_values)
+        decode_time_in_sec = (time.perf_counter() - start_time) / NUM_DECODE_REPETITIONS
+
+        raw_size = 8 * num_values
+        total_raw_size += raw_size
+        total_block_size += len(data)
+        print('{:<20} {:>10} {:>10} {:>8.1f} {:>16.1f}'.format(column_name, raw_size, len(data), raw_size / len(data),
+                                                               num_values / decode_time_in_sec / 1e6))
+
+    print('\n{:<20} {:>10} {:>10} {:>8.1f}'.format('Total', total_raw_size, total_block_size,
+                                                   total_raw_size / total_block_size))
+
+    parquet_file = io.BytesIO()
+    datasets.to_parquet(parquet_file, compression='zstd', index=False)
+    print('{:<20} {:>10} {:>10} {:>8.1f}'.format('Parquet (zstd)', total_raw_size, len(parquet_file.getvalue()),
+                                                 total_raw_size / len(parquet_file.getvalue())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Compares the query times of PostgreSQL and DuckDB for the same queries on generated TE923 data, uses the test database
+and a temporary snapshot directory, run from the backend directory with:
+
+    python -m tests.benchmarks.benchmark_engines
+"""
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pytz
+from sqlalchemy import insert, column
+
+from backend_app import create_app
+from backend_config.settings import TestConfig
+from backend_src.extensions import db
+from backend_src.job.models import Job, JobStatus
+from backend_src.models import WeatherStation, WeatherDataset, wide_temp_humidity_sensor_data, \
+    create_temp_humidity_sensors
+from backend_src.weatherdata.analytics import refresh_analytics_snapshot, get_valid_snapshot, \
+    query_weather_datasets_from_snapshot
+from backend_src.weatherdata.query import query_weather_datasets
+from .te923_data import generate_te923_datasets
+
+STATIONS = ['TES', 'TES2']
+NUM_YEARS = 2
+NUM_REPETITIONS = 3
+INSERT_BATCH_SIZE = 5000
+
+QUERIES = [
+    ('1 month, pressure', 31, ['pressure']),
+    ('1 year, pressure', 365, ['pressure']),
+    ('1 year, temperature + humidity', 365, ['temperature', 'humidity']),
+    ('2 years, all sensors', 2 * 365, ['pressure', 'uv', 'rain_counter', 'direction', 'speed', 'wind_temperature',
+                                       'gusts', 'temperature', 'humidity'])
+]
+
+
+def main():
+    local_time_zone = pytz.timezone(TestConfig.TIMEZONE)
+    first = local_time_zone.localize(datetime(2019, 1, 1))
+
+    with tempfile.TemporaryDirectory() as snapshot_path:
+        config = TestConfig()
+        config.ANALYTICS_ENGINE = 'duckdb'
+        config.ANALYTICS_SNAPSHOT_PATH = snapshot_path
+        config.ANALYTICS_MIN_PERIOD_IN_DAYS = 0
+        app = create_app(config)
+
+        with app.test_request_context():
+            try:
+                _prepare_database(first)
+                snapshot = get_valid_snapshot()
+                print('Snapshot of {} datasets\n'.format(snapshot.num_datasets))
+                print('{:<35} {:>10} {:>16} {:>12}'.format('Query', 'Datasets', 'PostgreSQL [s]', 'DuckDB [s]'))
+
+                for description, num_days, sensor_ids in QUERIES:
+                    last = first + timedelta(days=num_days)
+                    queried_sensors = [column(sensor_id) for sensor_id in sensor_ids]
+                    num_datasets, postgresql_time = _measure(
+                        lambda: query_weather_datasets(first, last, STATIONS, queried_sensors))
+                    _, duckdb_time = _measure(
+                        lambda: query_weather_datasets_from_snapshot(snapshot, first, last, STATIONS, queried_sensors))
+                    print('{:<35} {:>10} {:>16.3f} {:>12.3f}'.format(description, num_datasets, postgresql_time,
+                                                                     duckdb_time))
+            finally:
+                db.session.rollback()
+                db.drop_all()
+
+
+def _prepare_database(first):
+    db.create_all()
+    create_temp_humidity_sensors()
+    for station_id in STATIONS:
+        db.session.add(WeatherStation(station_id=station_id, device='TE923', location='Benchmark', latitude=0,
+                                      longitude=0, height=0, rain_calib_factor=1))
+    db.session.commit()
+
+    dataset_columns = [table_column.name for table_column in WeatherDataset.__table__.c
+                       if table_column.name != 'ingest_sequence']
+    wide_columns = [table_column.name for table_column in wide_temp_humidity_sensor_data.c]
+    for seed, station_id in enumerate(STATIONS):
+        datasets = generate_te923_datasets(station_id, first, num_days=NUM_YEARS * 365, seed=seed)
+        for start in range(0, len(datasets), INSERT_BATCH_SIZE):
+            batch = datasets.iloc[start:start + INSERT_BATCH_SIZE]
+            db.session.execute(insert(WeatherDataset), _to_rows(batch[dataset_columns]))
+            db.session.execute(insert(wide_temp_humidity_sensor_data), _to_rows(batch[wide_columns]))
+        db.session.commit()
+
+    job = Job(description='Benchmark snapshot', status=JobStatus.RUNNING.name)
+    db.session.add(job)
+    db.session.commit()
+    refresh_analytics_snapshot(job.id, STATIONS)
+
+
+def _to_rows(datasets):
+    rows = datasets.astype(object).where(datasets.notna(), None).to_dict('records')
+    for row in rows:
+        row['timepoint'] = row['timepoint'].to_pydatetime()
+    return rows
+
+
+def _measure(query):
+    query_times = []
+    num_datasets = 0
+    for _ in range(NUM_REPETITIONS):
+        start_time = time.perf_counter()
+        num_datasets = len(query())
+        query_times.append(time.perf_counter() - start_time)
+
+    return num_datasets, statistics.median(query_times)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Measures the latency of small requests while a large data query is running, for each kind of worker pool used for the
+CPU-bound request steps. Serves the app with the gevent server like in production and uses the test database, run from
+the backend directory with:
+
+    python -m tests.benchmarks.benchmark_offload
+"""
+from . import gevent_patch  # noqa: F401, needs to be imported as early as possible
+
+import logging
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import gevent
+import pytz
+import requests
+from flask_jwt_extended import create_access_token
+from gevent.pywsgi import WSGIServer
+from sqlalchemy import insert
+
+from backend_app import create_app
+from backend_config.settings import TestConfig
+from backend_src.executor.pool import ExecutorKind
+from backend_src.extensions import db
+from backend_src.models import WeatherStation, WeatherDataset, wide_temp_humidity_sensor_data, \
+    create_temp_humidity_sensors
+from backend_src.utils import Role
+from .te923_data import generate_te923_datasets
+
+STATIONS = ['TES', 'TES2']
+NUM_DAYS = 365
+NUM_LARGE_QUERIES = 3
+SMALL_REQUEST_INTERVAL_IN_SEC = 0.01
+INSERT_BATCH_SIZE = 5000
+
+
+def main():
+    local_time_zone = pytz.timezone(TestConfig.TIMEZONE)
+    first = local_time_zone.localize(datetime(2019, 1, 1))
+    last = first + timedelta(days=NUM_DAYS)
+
+    app = create_app(_get_config(ExecutorKind.INLINE))
+    with app.test_request_context():
+        _prepare_database(first)
+
+    try:
+        print('{:<10} {:>16} {:>18} {:>18} {:>16}'.format('Executor', 'Large query [s]', 'Small median [ms]',
+                                                          'Small max [ms]', 'Small requests'))
+        for executor_kind in ExecutorKind:
+            large_query_time, small_request_times = _measure(executor_kind, first, last)
+            print('{:<10} {:>16.3f} {:>18.1f} {:>18.1f} {:>16}'.format(
+                executor_kind.value or 'inline', large_query_time, 1000 * statistics.median(small_request_times),
+                1000 * max(small_request_times), len(small_request_times)))
+    finally:
+        with app.test_request_context():
+            db.session.rollback()
+            db.drop_all()
+
+
+def _get_config(executor_kind):
+    config = TestConfig()
+    config.OFFLOAD_EXECUTOR = executor_kind.value
+    return config
+
+
+def _measure(executor_kind, first, last):
+    app = create_app(_get_config(executor_kind))
+    app.logger.setLevel(logging.WARNING)
+    with app.app_context():
+        # noinspection PyTypeChecker
+        access_token = create_access_token(identity={'name': 'benchmark', 'role': Role.ADMIN.name},
+                                           additional_claims={'station_id': None}, expires_delta=False)
+    server = WSGIServer(('127.0.0.1', 0), app, log=None)
+    server.start()
+    base_url = 'http://127.0.0.1:{}/api/v1'.format(server.server_port)
+    session = requests.Session()
+    session.headers['Authorization'] = 'Bearer {}'.format(access_token)
+
+    try:
+        # the first request is warming up the worker pool and the database connections
+        _run_large_query(session, base_url, first, first + timedelta(days=1))
+
+        large_query_times = []
+        small_request_times = []
+        for _ in range(NUM_LARGE_QUERIES):
+            large_query = gevent.spawn(_run_large_query, session, base_url, first, last)
+            while not large_query.ready():
+                start_time = time.perf_counter()
+                result = requests.get('{}/station'.format(base_url))
+                result.raise_for_status()
+                small_request_times.append(time.perf_counter() - start_time)
+                gevent.sleep(SMALL_REQUEST_INTERVAL_IN_SEC)
+            large_query_times.append(large_query.get())
+    finally:
+        server.stop()
+
+    return statistics.median(large_query_times), small_request_times
+
+
+def _run_large_query(session, base_url, first, last):
+    start_time = time.perf_counter()
+    result = session.get('{}/data'.format(base_url), params={'first_timepoint': first.isoformat(),
+                                                             'last_timepoint': last.isoformat()})
+    result.raise_for_status()
+    return time.perf_counter() - start_time
+
+
+def _prepare_database(first):
+    db.create_all()
+    create_temp_humidity_sensors()
+    for station_id in STATIONS:
+        db.session.add(WeatherStation(station_id=station_id, device='TE923', location='Benchmark', latitude=0,
+                                      longitude=0, height=0, rain_calib_factor=1))
+    db.session.commit()
+
+    dataset_columns = [table_column.name for table_column in WeatherDataset.__table__.c
+                       if table_column.name != 'ingest_sequence']
+    wide_columns = [table_column.name for table_column in wide_temp_humidity_sensor_data.c]
+    for seed, station_id in enumerate(STATIONS):
+        datasets = generate_te923_datasets(station_id, first, num_days=NUM_DAYS, seed=seed)
+        for start in range(0, len(datasets), INSERT_BATCH_SIZE):
+            batch = datasets.iloc[start:start + INSERT_BATCH_SIZE]
+            db.session.execute(insert(WeatherDataset), _to_rows(batch[dataset_columns]))
+            db.session.execute(insert(wide_temp_humidity_sensor_data), _to_rows(batch[wide_columns]))
+        db.session.commit()
+
+
+def _to_rows(datasets):
+    rows = datasets.astype(object).where(datasets.notna(), None).to_dict('records')
+    for row in rows:
+        row['timepoint'] = row['timepoint'].to_pydatetime()
+    return rows
+
+
+if __name__ == '__main__':
+    main()
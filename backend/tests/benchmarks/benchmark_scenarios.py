@@ -0,0 +1,406 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Runs scripted read/write mixes against the backend and reports the latency of each operation, comparable between runs
+and revisions. The database is seeded with generated TE923 data of several stations (diurnal cycles, rain counter
+resets, DST transitions and sensor outages). Run from the backend directory in process against the test database:
+
+    python -m tests.benchmarks.benchmark_scenarios --mix read_heavy --report report.json
+
+or over HTTP against a running server with an empty database (the user needs the admin role):
+
+    python -m tests.benchmarks.benchmark_scenarios --url http://localhost:8000 --user admin --password secret
+
+A previous report is compared against with `--compare baseline.json`.
+"""
+import argparse
+import gzip
+import json
+import logging
+import math
+import random
+import statistics
+import subprocess
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from http import HTTPStatus
+from typing import Dict, List, Optional
+
+import pandas as pd
+import pytz
+import requests
+from flask_jwt_extended import create_access_token
+
+from backend_app import create_app
+from backend_config.settings import TestConfig
+from backend_src.extensions import db
+from backend_src.models import create_temp_humidity_sensors, create_sensors
+from backend_src.utils import Role
+from .te923_data import generate_te923_datasets, to_api_datasets, TE923_INTERVAL
+
+DEFAULT_STATIONS = ['TES', 'TES2']
+DEFAULT_FIRST_DAY = '2021-01-01'  # the default period is covering the DST transition in March
+DEFAULT_NUM_DAYS = 120
+DEFAULT_NUM_OPERATIONS = 500
+NUM_WARMUP_OPERATIONS = 10
+SEED_BATCH_SIZE = 2000
+INGEST_BATCH_SIZE = 6  # the client is uploading the datasets of the last hour
+RAIN_COUNTER_RESETS_PER_YEAR = 2
+SENSOR_OUTAGES_PER_MONTH = 1
+MAX_RETRY_WAIT_IN_SEC = 60
+# reports are only comparable if these settings are the same
+COMPARED_SETTINGS = ['transport', 'mix', 'stations', 'first_day', 'num_days', 'num_operations', 'seed']
+
+ALL_SENSORS = ['pressure', 'uv', 'rain', 'direction', 'speed', 'wind_temperature', 'gusts', 'temperature', 'humidity',
+               'dewpoint']
+
+# name -> (queried period in days, requested sensors), the sensor combinations cover all plans of the data query
+QUERIES = {
+    'day_all_sensors': (1, ALL_SENSORS),
+    'month_pressure': (31, ['pressure']),
+    'month_rain': (31, ['rain']),
+    'month_temperature_humidity': (31, ['temperature', 'humidity']),
+    'month_dewpoint': (31, ['dewpoint']),
+    'month_pressure_temperature': (31, ['pressure', 'temperature']),
+    'month_all_sensors': (31, ALL_SENSORS),
+    'year_pressure': (365, ['pressure']),
+    'year_all_sensors': (365, ALL_SENSORS)
+}
+
+# name -> weights of the operations
+MIXES = {
+    'read_heavy': {'latest': 40, 'day_all_sensors': 25, 'month_pressure': 8, 'month_temperature_humidity': 8,
+                   'year_pressure': 4, 'ingest': 15},
+    'write_heavy': {'ingest': 70, 'latest': 20, 'day_all_sensors': 10},
+    'sensor_combinations': {name: 1 for name in QUERIES}
+}
+
+
+@dataclass
+class Response:
+    status_code: int
+    headers: Dict[str, str]
+    content: bytes
+
+
+@dataclass
+class OperationStats:
+    latencies_in_sec: List[float] = field(default_factory=list)
+    num_bytes: List[int] = field(default_factory=list)
+    server_timings_in_ms: Dict[str, List[float]] = field(default_factory=dict)
+    num_errors: int = 0
+
+    def add(self, response: Response, latency_in_sec: float):
+        if response.status_code >= HTTPStatus.BAD_REQUEST:
+            self.num_errors += 1
+            return
+
+        self.latencies_in_sec.append(latency_in_sec)
+        self.num_bytes.append(len(response.content))
+        for stage, duration in _parse_server_timing(response.headers.get('Server-Timing')).items():
+            self.server_timings_in_ms.setdefault(stage, []).append(duration)
+
+    def to_dict(self) -> Dict:
+        latencies_in_ms = sorted(1000 * latency for latency in self.latencies_in_sec)
+        if not latencies_in_ms:
+            return {'count': 0, 'errors': self.num_errors}
+
+        return {
+            'count': len(latencies_in_ms),
+            'errors': self.num_errors,
+            'median_ms': statistics.median(latencies_in_ms),
+            'p95_ms': latencies_in_ms[min(len(latencies_in_ms) - 1, math.ceil(0.95 * len(latencies_in_ms)) - 1)],
+            'max_ms': latencies_in_ms[-1],
+            'mean_bytes': statistics.mean(self.num_bytes),
+            'server_timing_median_ms': {stage: statistics.median(durations)
+                                        for stage, durations in self.server_timings_in_ms.items()}
+        }
+
+
+class InProcessTransport:
+    """
+    Runs the requests against `create_app(TestConfig())`, the test database is created and dropped again
+    """
+    name = 'in-process'
+
+    def __init__(self):
+        self._app = create_app(TestConfig())
+        self._client = self._app.test_client()
+        logging.getLogger('wsgi').parent.handlers = []
+
+        with self._app.test_request_context():
+            db.create_all()
+            create_temp_humidity_sensors()
+            create_sensors()
+            # noinspection PyTypeChecker
+            access_token = create_access_token(identity={'name': 'benchmark_admin', 'role': Role.ADMIN.name},
+                                               additional_claims={'station_id': None}, expires_delta=False,
+                                               fresh=True)
+        self._client.environ_base['HTTP_AUTHORIZATION'] = 'Bearer {}'.format(access_token)
+
+    def request(self, method: str, path: str, params: Optional[Dict] = None, payload=None,
+                compress: bool = False) -> Response:
+        data, headers = _encode_payload(payload, compress)
+        response = self._client.open(path, method=method, query_string=params, data=data, headers=headers)
+        return Response(response.status_code, dict(response.headers), response.get_data())
+
+    def close(self):
+        with self._app.test_request_context():
+            db.session.rollback()
+            db.drop_all()
+
+
+class HttpTransport:
+    """
+    Runs the requests against a running server, the user is logged in with the password
+    """
+    name = 'http'
+
+    def __init__(self, url: str, user: str, password: str):
+        self._url = url.rstrip('/')
+        self._session = requests.Session()
+        response = self._session.post('{}/api/v1/login'.format(self._url), json={'name': user, 'password': password})
+        response.raise_for_status()
+        self._session.headers['Authorization'] = 'Bearer {}'.format(response.json()['token'])
+
+    def request(self, method: str, path: str, params: Optional[Dict] = None, payload=None,
+                compress: bool = False) -> Response:
+        data, headers = _encode_payload(payload, compress)
+        response = self._session.request(method, '{}{}'.format(self._url, path), params=params, data=data,
+                                         headers=headers)
+        return Response(response.status_code, dict(response.headers), response.content)
+
+    def close(self):
+        self._session.close()
+
+
+class Scenario:
+    """
+    Seeds the database and runs a mix of operations in a reproducible random order
+    """
+
+    def __init__(self, transport, station_ids: List[str], first: datetime, num_days: int, num_operations: int,
+                 seed: int):
+        self._transport = transport
+        self._station_ids = station_ids
+        self._first = first
+        self._last = first + timedelta(days=num_days)
+        self._num_days = num_days
+        self._num_operations = num_operations
+        self._random = random.Random(seed)
+        self._seed = seed
+        self._pending_ingests = {}
+
+    def seed_database(self):
+        # the datasets after the seeded period are uploaded by the ingest operations
+        num_ingest_days = math.ceil(self._num_operations * INGEST_BATCH_SIZE * TE923_INTERVAL / timedelta(days=1)) + 1
+        sensor_ids = self._get_temp_humidity_sensor_ids()
+        for index, station_id in enumerate(self._station_ids):
+            self._add_station(station_id)
+
+            datasets = generate_te923_datasets(
+                station_id, self._first, self._num_days + num_ingest_days, seed=self._seed + index,
+                num_rain_counter_resets=math.ceil(RAIN_COUNTER_RESETS_PER_YEAR * self._num_days / 365),
+                num_sensor_outages=math.ceil(SENSOR_OUTAGES_PER_MONTH * self._num_days / 30))
+            api_datasets = to_api_datasets(datasets, sensor_ids)
+            num_seeded_datasets = int((datasets['timepoint'] < pd.Timestamp(self._last)).sum())
+
+            start_time = time.perf_counter()
+            for start in range(0, num_seeded_datasets, SEED_BATCH_SIZE):
+                self._request_with_retry('POST', '/api/v1/data',
+                                         payload=api_datasets[start:min(start + SEED_BATCH_SIZE, num_seeded_datasets)])
+            print('Seeded {} datasets of station \'{}\' in {:.1f} s'
+                  .format(num_seeded_datasets, station_id, time.perf_counter() - start_time))
+            self._pending_ingests[station_id] = api_datasets[num_seeded_datasets:]
+
+    def run(self, mix: Dict[str, int]) -> Dict[str, OperationStats]:
+        operation_names = list(mix.keys())
+        weights = list(mix.values())
+        stats = {name: OperationStats() for name in operation_names}
+
+        for index in range(NUM_WARMUP_OPERATIONS + self._num_operations):
+            name = self._random.choices(operation_names, weights)[0]
+            start_time = time.perf_counter()
+            response = self._perform(name)
+            latency_in_sec = time.perf_counter() - start_time
+            if index >= NUM_WARMUP_OPERATIONS:
+                stats[name].add(response, latency_in_sec)
+
+        return stats
+
+    def _perform(self, name: str) -> Response:
+        station_id = self._random.choice(self._station_ids)
+        if name == 'ingest':
+            payload = self._pending_ingests[station_id][:INGEST_BATCH_SIZE]
+            del self._pending_ingests[station_id][:INGEST_BATCH_SIZE]
+            return self._transport.request('POST', '/api/v1/data', payload=payload, compress=True)
+        if name == 'latest':
+            return self._transport.request('GET', '/api/v1/data/latest')
+
+        num_days, sensors = QUERIES[name]
+        num_days = min(num_days, self._num_days)
+        last = self._first + timedelta(days=self._random.randint(num_days, self._num_days))
+        return self._transport.request('GET', '/api/v1/data', params={
+            'first_timepoint': (last - timedelta(days=num_days)).isoformat(),
+            'last_timepoint': last.isoformat(),
+            'stations': station_id,
+            'sensors': ','.join(sensors)
+        })
+
+    def _get_temp_humidity_sensor_ids(self) -> List[str]:
+        response = self._transport.request('GET', '/api/v1/temp-humidity-sensor')
+        return [sensor['sensor_id'] for sensor in json.loads(response.content)]
+
+    def _add_station(self, station_id: str):
+        response = self._transport.request('POST', '/api/v1/station', payload={
+            'station_id': station_id,
+            'device': 'TE923',
+            'location': 'Benchmark',
+            'latitude': 0,
+            'longitude': 0,
+            'height': 0,
+            'rain_calib_factor': 1
+        })
+        if response.status_code not in [HTTPStatus.CREATED, HTTPStatus.CONFLICT]:
+            raise RuntimeError('Adding station \'{}\' failed with status {}'.format(station_id, response.status_code))
+
+    def _request_with_retry(self, method: str, path: str, payload) -> Response:
+        while True:
+            response = self._transport.request(method, path, payload=payload, compress=True)
+            if response.status_code not in [HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.SERVICE_UNAVAILABLE]:
+                break
+            time.sleep(min(float(response.headers.get('Retry-After', 1)), MAX_RETRY_WAIT_IN_SEC))
+
+        if response.status_code >= HTTPStatus.BAD_REQUEST:
+            raise RuntimeError('Request {} {} failed with status {}'.format(method, path, response.status_code))
+        return response
+
+
+def create_report(transport_name: str, mix_name: str, arguments, stats: Dict[str, OperationStats]) -> Dict:
+    return {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'revision': _get_git_revision(),
+        'transport': transport_name,
+        'mix': mix_name,
+        'stations': arguments.stations,
+        'first_day': arguments.first_day,
+        'num_days': arguments.days,
+        'num_operations': arguments.operations,
+        'seed': arguments.seed,
+        'operations': {name: operation_stats.to_dict() for name, operation_stats in sorted(stats.items())}
+    }
+
+
+def print_report(report: Dict, baseline: Optional[Dict] = None):
+    print('\n{} mix ({}, revision {})\n'.format(report['mix'], report['transport'], report['revision']))
+    print('{:<28} {:>6} {:>7} {:>12} {:>12} {:>12} {:>10} {:>10}'.format(
+        'Operation', 'Count', 'Errors', 'Median [ms]', 'p95 [ms]', 'Max [ms]', 'SQL [ms]', 'Change'))
+
+    for name, operation in report['operations'].items():
+        if not operation['count']:
+            print('{:<28} {:>6} {:>7}'.format(name, operation['count'], operation['errors']))
+            continue
+
+        change = ''
+        baseline_operation = baseline['operations'].get(name) if baseline else None
+        if baseline_operation and baseline_operation.get('median_ms'):
+            change = '{:+.1f} %'.format(100 * (operation['median_ms'] / baseline_operation['median_ms'] - 1))
+        sql_duration = operation['server_timing_median_ms'].get('sql')
+        print('{:<28} {:>6} {:>7} {:>12.1f} {:>12.1f} {:>12.1f} {:>10} {:>10}'.format(
+            name, operation['count'], operation['errors'], operation['median_ms'], operation['p95_ms'],
+            operation['max_ms'], '{:.1f}'.format(sql_duration) if sql_duration is not None else '', change))
+
+    different_settings = [key for key in COMPARED_SETTINGS if baseline and baseline.get(key) != report[key]]
+    if different_settings:
+        print('\nThe baseline was measured with different settings:')
+        for key in different_settings:
+            print('  {}: {} instead of {}'.format(key, baseline.get(key), report[key]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs a read/write mix against the backend')
+    parser.add_argument('--mix', choices=MIXES.keys(), default='read_heavy')
+    parser.add_argument('--stations', nargs='+', default=DEFAULT_STATIONS)
+    parser.add_argument('--first-day', default=DEFAULT_FIRST_DAY, help='first seeded day (server time zone)')
+    parser.add_argument('--days', type=int, default=DEFAULT_NUM_DAYS, help='number of seeded days')
+    parser.add_argument('--operations', type=int, default=DEFAULT_NUM_OPERATIONS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--url', help='runs over HTTP against this server instead of in process')
+    parser.add_argument('--user')
+    parser.add_argument('--password')
+    parser.add_argument('--report', help='writes the report as JSON to this file')
+    parser.add_argument('--compare', help='compares with a previous JSON report')
+    arguments = parser.parse_args()
+
+    first = pytz.timezone(TestConfig.TIMEZONE).localize(datetime.fromisoformat(arguments.first_day))
+    if arguments.url:
+        transport = HttpTransport(arguments.url, arguments.user, arguments.password)
+    else:
+        transport = InProcessTransport()
+
+    try:
+        scenario = Scenario(transport, arguments.stations, first, arguments.days, arguments.operations,
+                            arguments.seed)
+        scenario.seed_database()
+        stats = scenario.run(MIXES[arguments.mix])
+    finally:
+        transport.close()
+
+    report = create_report(transport.name, arguments.mix, arguments, stats)
+    baseline = None
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+    print_report(report, baseline)
+
+    if arguments.report:
+        with open(arguments.report, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+
+
+def _encode_payload(payload, compress):
+    if payload is None:
+        return None, {}
+
+    data = json.dumps(payload).encode('utf-8')
+    if not compress:
+        return data, {'Content-Type': 'application/json'}
+
+    return gzip.compress(data), {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}
+
+
+def _parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    server_timing = {}
+    for metric in filter(None, (header or '').split(',')):
+        name, _, duration = metric.strip().partition(';dur=')
+        if duration:
+            server_timing[name] = float(duration)
+
+    return server_timing
+
+
+def _get_git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import datetime
+from typing import List, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from backend_src.models import WIDE_TEMP_HUMIDITY_SENSOR_IDS, get_wide_column_name
+
+# recording interval of the TE923 weather station
+TE923_INTERVAL = pd.Timedelta(minutes=10)
+# temperature-humidity sensors connected to the simulated station, the station reports the others as invalid
+CONNECTED_SENSOR_IDS = ['IN', 'OUT1', 'OUT2']
+# a radio connection of an outside sensor is lost for up to a day
+MAX_SENSOR_OUTAGE = pd.Timedelta(days=1)
+
+
+def generate_te923_datasets(station_id: str, first: datetime, num_days: int, seed: int = 0,
+                            num_rain_counter_resets: int = 0, num_sensor_outages: int = 0) -> pd.DataFrame:
+    """
+    Generates datasets of a TE923 weather station in the format of the queried datasets (with the wide temperature-
+    humidity columns), the values are changing slowly with daily cycles and have the resolution of the station
+
+    The timepoints are equidistant in absolute time, a localized `first` timepoint is therefore crossing the DST
+    transitions like the station does. Optionally the rain counter is reset (as for a battery change) and outside
+    sensors are temporarily losing their radio connection.
+    """
+    random_generator = np.random.default_rng(seed)
+    timepoints = pd.date_range(first, periods=num_days * 144, freq=TE923_INTERVAL)
+    # a few records are lost due to radio interferences
+    timepoints = timepoints[random_generator.random(len(timepoints)) > 0.005]
+    num_values = len(timepoints)
+    daily_cycle = np.sin(2 * np.pi * (timepoints.hour * 60 + timepoints.minute).to_numpy() / (24 * 60) - np.pi / 2)
+
+    def random_walk(scale):
+        return np.cumsum(random_generator.normal(0, scale, num_values))
+
+    outside_temperature = 8 + 6 * daily_cycle + random_walk(0.05)
+    datasets = {
+        'timepoint': timepoints,
+        'station_id': station_id,
+        'pressure': np.round(1013 + random_walk(0.05), 1),
+        'uv': np.round(np.clip(6 * daily_cycle, 0, None), 1),
+        'rain_counter': _generate_rain_counter(random_generator, num_values, num_rain_counter_resets),
+        'direction': 22.5 * random_generator.integers(0, 16, num_values),
+        'speed': np.round(np.clip(random_generator.gamma(1.5, 1.5, num_values) - 1, 0, None), 1),
+        'wind_temperature': np.round(outside_temperature - 1, 1),
+        'gusts': np.round(np.clip(random_generator.gamma(2, 2, num_values) - 1, 0, None), 1)
+    }
+
+    for sensor_id in WIDE_TEMP_HUMIDITY_SENSOR_IDS:
+        if sensor_id not in CONNECTED_SENSOR_IDS:
+            temperature = humidity = np.full(num_values, np.nan)
+        elif sensor_id == 'IN':
+            temperature = 21 + 0.5 * daily_cycle + random_walk(0.01)
+            humidity = 45 + random_walk(0.1)
+        else:
+            temperature = outside_temperature + random_walk(0.01)
+            humidity = np.clip(80 - 15 * daily_cycle + random_walk(0.2), 10, 100)
+
+        # the station is providing the temperature in steps of 0.05 degrees and the humidity in steps of 1 %
+        datasets[get_wide_column_name('temperature', sensor_id)] = np.round(20 * temperature) / 20
+        datasets[get_wide_column_name('humidity', sensor_id)] = np.round(humidity)
+
+    outside_sensor_ids = [sensor_id for sensor_id in CONNECTED_SENSOR_IDS if sensor_id != 'IN']
+    max_outage_length = int(MAX_SENSOR_OUTAGE / TE923_INTERVAL)
+    for _ in range(num_sensor_outages):
+        sensor_id = outside_sensor_ids[random_generator.integers(0, len(outside_sensor_ids))]
+        start = random_generator.integers(0, num_values)
+        end = start + random_generator.integers(1, max_outage_length + 1)
+        for quantity in ['temperature', 'humidity']:
+            datasets[get_wide_column_name(quantity, sensor_id)][start:end] = np.nan
+
+    return pd.DataFrame(datasets)
+
+
+def _generate_rain_counter(random_generator, num_values, num_resets):
+    rain_counter = 1500 + np.cumsum(random_generator.random(num_values) < 0.02).astype(float)
+    for reset_index in np.sort(random_generator.integers(1, num_values, num_resets)):
+        rain_counter[reset_index:] -= rain_counter[reset_index]
+
+    return rain_counter
+
+
+def to_api_datasets(datasets: pd.DataFrame, sensor_ids: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Converts generated datasets into the JSON payload of the weather data endpoint, missing sensors and sensors not in
+    `sensor_ids` (if given) are left out
+    """
+    api_datasets = []
+    for dataset in datasets.to_dict('records'):
+        temperature_humidity = []
+        for sensor_id in WIDE_TEMP_HUMIDITY_SENSOR_IDS:
+            temperature = dataset.pop(get_wide_column_name('temperature', sensor_id))
+            humidity = dataset.pop(get_wide_column_name('humidity', sensor_id))
+            if sensor_ids is not None and sensor_id not in sensor_ids:
+                continue
+            if not np.isnan(temperature) and not np.isnan(humidity):
+                temperature_humidity.append({'sensor_id': sensor_id, 'temperature': temperature, 'humidity': humidity})
+
+        dataset['timepoint'] = dataset['timepoint'].isoformat()
+        dataset['temperature_humidity'] = temperature_humidity
+        api_datasets.append(dataset)
+
+    return api_datasets
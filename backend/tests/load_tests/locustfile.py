@@ -14,21 +14,268 @@
 #   You should have received a copy of the GNU Affero General Public License
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+"""
+Load profiles of the backend for measuring the capacity limits before a deployment, each profile is a user class:
+
+- `DashboardUser`: the weather dashboard loading the time limits, stations and sensors and the data of the default
+  sensors over `INITIAL_TIME_PERIOD`, followed by changes of the station and the time period
+- `ExportUser`: the monthly exporter pulling the full months of all stations
+- `StationClientUser`: station clients logging in and uploading the datasets of the last hour as gzip batch at the same
+  minute of the hour
+
+The ratios between the profiles and the tasks are tuned with the `LOAD_TEST_*_WEIGHT` environment variables, single
+profiles are selected by their class names on the command line. With an admin user, the stations and push users of the
+station clients are created at the start. Historical data for the dashboard and the exporter can be seeded with
+`tests.benchmarks.benchmark_scenarios`. Run from the backend directory against a running server with:
+
+    LOAD_TEST_ADMIN_USER=admin LOAD_TEST_ADMIN_PASSWORD=secret locust -f tests/load_tests/locustfile.py \
+        --host http://localhost:8000 --headless --users 300 --spawn-rate 50 --run-time 10m
+
+The run fails (exit code 1) if any of the service level objectives in `MAX_P95_RESPONSE_TIMES_IN_MS` or
+`MAX_FAILURE_RATIO` is violated.
+"""
+import gzip
+import itertools
 import json
-from locust import HttpUser, task, constant
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from http import HTTPStatus
+
+import requests
+from dateutil.parser import isoparse
+from dateutil.relativedelta import relativedelta
+from locust import HttpUser, task, between, events
+from locust.runners import WorkerRunner
+
+
+def _get_env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+DASHBOARD_WEIGHT = _get_env_int('LOAD_TEST_DASHBOARD_WEIGHT', 10)
+EXPORT_WEIGHT = _get_env_int('LOAD_TEST_EXPORT_WEIGHT', 1)
+STATION_WEIGHT = _get_env_int('LOAD_TEST_STATION_WEIGHT', 30)
+DASHBOARD_PAGE_LOAD_WEIGHT = _get_env_int('LOAD_TEST_DASHBOARD_PAGE_LOAD_WEIGHT', 3)
+DASHBOARD_CHANGE_WEIGHT = _get_env_int('LOAD_TEST_DASHBOARD_CHANGE_WEIGHT', 1)
+
+# same setting as for the frontend
+INITIAL_TIME_PERIOD = timedelta(days=_get_env_int('INITIAL_TIME_PERIOD', 7))
+CHANGED_TIME_PERIODS = [timedelta(days=1), timedelta(days=31), timedelta(days=365)]
+# the frontend is requesting temperature and humidity for the default sensors 'OUT1_temp' and 'OUT1_humid'
+DASHBOARD_SENSORS = ['pressure', 'rain', 'temperature', 'humidity']
+NUM_EXPORTED_MONTHS = 12
+
+ADMIN_USER = os.environ.get('LOAD_TEST_ADMIN_USER')
+ADMIN_PASSWORD = os.environ.get('LOAD_TEST_ADMIN_PASSWORD')
+NUM_STATIONS = _get_env_int('LOAD_TEST_NUM_STATIONS', 300)
+STATION_PASSWORD = os.environ.get('LOAD_TEST_STATION_PASSWORD', 'load-test')
+STATION_ID_FORMAT = 'LT{:04d}'
+# the period can be shortened for provoking the upload peak more often than once per hour
+UPLOAD_PERIOD_IN_SEC = _get_env_int('LOAD_TEST_UPLOAD_PERIOD_IN_SEC', 3600)
+UPLOAD_OFFSET_IN_SEC = _get_env_int('LOAD_TEST_UPLOAD_OFFSET_IN_SEC', 0)
+UPLOAD_JITTER_IN_SEC = _get_env_int('LOAD_TEST_UPLOAD_JITTER_IN_SEC', 20)
+DATASET_INTERVAL = timedelta(minutes=10)
+NUM_DATASETS_PER_UPLOAD = 6
 
+# service level objectives per request name (95th percentile of the response time)
+MAX_P95_RESPONSE_TIMES_IN_MS = {
+    ('GET', 'dashboard: limits'): 500,
+    ('GET', 'dashboard: station'): 500,
+    ('GET', 'dashboard: sensor'): 500,
+    ('GET', 'dashboard: temp-humidity-sensor'): 500,
+    ('GET', 'dashboard: data'): 2000,
+    ('GET', 'dashboard: data (changed period)'): 5000,
+    ('GET', 'export: data'): 10000,
+    ('POST', 'station: login'): 1000,
+    ('POST', 'station: data'): 3000
+}
+MAX_FAILURE_RATIO = float(os.environ.get('LOAD_TEST_MAX_FAILURE_RATIO', 0.01))
 
-class WebsiteUser(HttpUser):
-    wait_time = constant(1.0)
+logger = logging.getLogger('load_test')
+
+
+class DashboardUser(HttpUser):
+    weight = DASHBOARD_WEIGHT
+    wait_time = between(5, 30)
+
+    def on_start(self):
+        self._station_ids = []
+        self._last_timepoint = datetime.now(timezone.utc)
+
+    @task(DASHBOARD_PAGE_LOAD_WEIGHT)
+    def load_page(self):
+        limits = self.client.get('/api/v1/data/limits', name='dashboard: limits')
+        stations = self.client.get('/api/v1/station', name='dashboard: station')
+        self.client.get('/api/v1/sensor', name='dashboard: sensor')
+        self.client.get('/api/v1/temp-humidity-sensor', name='dashboard: temp-humidity-sensor')
+        if not limits.ok or not stations.ok:
+            return
+
+        self._station_ids = sorted(station['station_id'] for station in stations.json())
+        if limits.json().get('last_timepoint'):
+            self._last_timepoint = isoparse(limits.json()['last_timepoint'])
+        if self._station_ids:
+            # the dashboard is showing the last station by default
+            self._get_data(self._station_ids[-1], INITIAL_TIME_PERIOD, 'dashboard: data')
+
+    @task(DASHBOARD_CHANGE_WEIGHT)
+    def change_station_and_period(self):
+        if self._station_ids:
+            self._get_data(random.choice(self._station_ids), random.choice(CHANGED_TIME_PERIODS),
+                           'dashboard: data (changed period)')
+
+    def _get_data(self, station_id, time_period, name):
+        self.client.get('/api/v1/data', name=name, params={
+            'first_timepoint': (self._last_timepoint - time_period).isoformat(),
+            'last_timepoint': self._last_timepoint.isoformat(),
+            'stations': station_id,
+            'sensors': ','.join(DASHBOARD_SENSORS)
+        })
+
+
+class ExportUser(HttpUser):
+    weight = EXPORT_WEIGHT
+    wait_time = between(30, 60)
 
     @task
-    def get(self):
-        payload = {
-            'first_timepoint': '2017-03-11T00:00:00+02:00',
-            'last_timepoint': '2019-03-18T00:00:00+02:00',
-            'sensors': []
-        }
+    def export_month(self):
+        self.client.get('/api/v1/sensor', name='export: sensor')
+        stations = self.client.get('/api/v1/station', name='export: station')
+        if not stations.ok:
+            return
+
+        # the exporter is requesting all sensors of each station for the month in server time
+        first_day_of_month = datetime.now().date().replace(day=1)
+        first = datetime.combine(first_day_of_month, datetime.min.time()) - relativedelta(
+            months=random.randint(1, NUM_EXPORTED_MONTHS))
+        for station in stations.json():
+            self.client.get('/api/v1/data', name='export: data', params={
+                'first_timepoint': first.isoformat(),
+                'last_timepoint': (first + relativedelta(months=1)).isoformat(),
+                'stations': station['station_id']
+            })
+
+
+class StationClientUser(HttpUser):
+    weight = STATION_WEIGHT
+    # distinct stations for the users of each process
+    _station_indices = itertools.count()
+
+    def on_start(self):
+        station_index = next(StationClientUser._station_indices) % NUM_STATIONS
+        self._station_id = STATION_ID_FORMAT.format(station_index)
+        self._user_name = self._station_id.lower()
+
+    def wait_time(self):
+        # all clients are uploading at the same minute of the hour
+        time_in_period = (time.time() - UPLOAD_OFFSET_IN_SEC) % UPLOAD_PERIOD_IN_SEC
+        return UPLOAD_PERIOD_IN_SEC - time_in_period + random.uniform(0, UPLOAD_JITTER_IN_SEC)
+
+    @task
+    def upload_datasets(self):
+        # the client is logging in before each upload
+        login = self.client.post('/api/v1/login', name='station: login',
+                                 json={'name': self._user_name, 'password': STATION_PASSWORD})
+        if not login.ok:
+            return
+
         headers = {
-            'content-type': 'application/json',
-            'Accept-Encoding': 'gzip, deflate'}
-        self.client.get('/api/v1/data', data=json.dumps(payload), headers=headers)
+            'Authorization': 'Bearer {}'.format(login.json()['token']),
+            'Content-Encoding': 'gzip',
+            'Content-Type': 'application/json'
+        }
+        payload = gzip.compress(json.dumps(_generate_datasets(self._station_id)).encode('utf-8'))
+        with self.client.post('/api/v1/data', name='station: data', data=payload, headers=headers,
+                              catch_response=True) as response:
+            if response.status_code in [HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.SERVICE_UNAVAILABLE]:
+                response.failure('Backpressure, retry after {} s'.format(response.headers.get('Retry-After')))
+
+
+def _generate_datasets(station_id):
+    now = datetime.now(timezone.utc)
+    last_timepoint = now - (now - datetime.min.replace(tzinfo=timezone.utc)) % DATASET_INTERVAL
+    datasets = []
+    for index in reversed(range(NUM_DATASETS_PER_UPLOAD)):
+        datasets.append({
+            'timepoint': (last_timepoint - index * DATASET_INTERVAL).isoformat(),
+            'station_id': station_id,
+            'pressure': round(random.uniform(980, 1050), 1),
+            'uv': round(random.uniform(0, 12), 1),
+            'rain_counter': round(random.uniform(0, 2000), 1),
+            'direction': 22.5 * random.randint(0, 15),
+            'speed': round(random.uniform(0, 120), 1),
+            'gusts': round(random.uniform(0, 200), 1),
+            'wind_temperature': round(random.uniform(-30, 50), 1),
+            'temperature_humidity': [
+                {'sensor_id': 'IN', 'temperature': round(random.uniform(10, 30), 1),
+                 'humidity': round(random.uniform(20, 80))},
+                {'sensor_id': 'OUT1', 'temperature': round(random.uniform(-30, 50), 1),
+                 'humidity': round(random.uniform(0, 100))}
+            ]
+        })
+
+    return datasets
+
+
+@events.test_start.add_listener
+def _create_stations_and_users(environment, **_):
+    if isinstance(environment.runner, WorkerRunner) or not ADMIN_USER:
+        return
+    if StationClientUser not in environment.user_classes:
+        return
+
+    session = requests.Session()
+    login = session.post('{}/api/v1/login'.format(environment.host),
+                         json={'name': ADMIN_USER, 'password': ADMIN_PASSWORD})
+    login.raise_for_status()
+    session.headers['Authorization'] = 'Bearer {}'.format(login.json()['token'])
+
+    for station_index in range(NUM_STATIONS):
+        station_id = STATION_ID_FORMAT.format(station_index)
+        station = session.post('{}/api/v1/station'.format(environment.host), json={
+            'station_id': station_id,
+            'device': 'TE923',
+            'location': 'Load test',
+            'latitude': 0,
+            'longitude': 0,
+            'height': 0,
+            'rain_calib_factor': 1
+        })
+        user = session.post('{}/api/v1/user'.format(environment.host), json={
+            'name': station_id.lower(),
+            'password': STATION_PASSWORD,
+            'role': 'PUSH_USER',
+            'station_id': station_id
+        })
+        for response in [station, user]:
+            if response.status_code not in [HTTPStatus.CREATED, HTTPStatus.CONFLICT]:
+                response.raise_for_status()
+
+    logger.info('Created the stations and push users of {} station clients'.format(NUM_STATIONS))
+
+
+@events.quitting.add_listener
+def _verify_service_level_objectives(environment, **_):
+    if isinstance(environment.runner, WorkerRunner):
+        return
+
+    violations = []
+    for (method, name), max_p95_response_time in MAX_P95_RESPONSE_TIMES_IN_MS.items():
+        entry = environment.stats.entries.get((name, method))
+        if entry and entry.num_requests:
+            p95_response_time = entry.get_response_time_percentile(0.95)
+            if p95_response_time > max_p95_response_time:
+                violations.append('95th percentile of \'{} {}\' is {} ms (objective {} ms)'.format(
+                    method, name, p95_response_time, max_p95_response_time))
+
+    failure_ratio = environment.stats.total.fail_ratio
+    if failure_ratio > MAX_FAILURE_RATIO:
+        violations.append('Failure ratio is {:.2%} (objective {:.2%})'.format(failure_ratio, MAX_FAILURE_RATIO))
+
+    for violation in violations:
+        logger.error('Service level objective violated: {}'.format(violation))
+    if violations:
+        environment.process_exit_code = 1
@@ -0,0 +1,154 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from http import HTTPStatus
+
+import gevent
+import pytest
+from dateutil.parser import isoparse
+from sqlalchemy import column
+
+from backend_src.weatherdata import analytics
+from backend_src.weatherdata.admission import QueryAdmission, estimate_query_cost
+from backend_src.weatherdata.query import get_temp_humidity_sensor_ids
+# noinspection PyUnresolvedReferences
+from ..utils import client_with_admin_permissions, datasets_over_several_months_for_two_stations  # required fixtures
+from ..utils import wait_for_job
+
+URL = '/api/v1/data?first_timepoint=1900-01-01T00:00&last_timepoint=2100-01-01T00:00'
+
+
+@pytest.fixture
+def client_with_data(client_with_admin_permissions, datasets_over_several_months_for_two_stations):
+    create_result = client_with_admin_permissions.post('/api/v1/data',
+                                                       json=datasets_over_several_months_for_two_stations)
+    assert create_result.status_code == HTTPStatus.NO_CONTENT
+    yield client_with_admin_permissions
+
+
+@pytest.mark.usefixtures('client_with_data')
+def test_estimate_query_cost(client_with_data):
+    with client_with_data.application.test_request_context():
+        # data every 10 minutes between the first and the last dataset (90 days, without the hour lost by DST)
+        assert estimate_query_cost(isoparse('1900-01-01T00:00+01:00'), isoparse('2100-01-01T00:00+01:00'), ['TES'],
+                                   [column('pressure')]) == 90 * 144 - 6 + 1
+        assert estimate_query_cost(isoparse('2016-02-01T00:00+01:00'), isoparse('2016-02-11T00:00+01:00'),
+                                   ['TES', 'TES2'], [column('pressure'), column('uv')]) == 2 * 2 * (10 * 144 + 1)
+        assert estimate_query_cost(isoparse('2016-02-01T00:00+01:00'), isoparse('2016-02-11T00:00+01:00'), ['TES'],
+                                   [column('pressure')], limit=10) == 10
+        assert estimate_query_cost(isoparse('2017-01-01T00:00+01:00'), isoparse('2018-01-01T00:00+01:00'), ['TES'],
+                                   [column('pressure')]) == 0
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'datasets_over_several_months_for_two_stations')
+def test_estimate_query_cost_from_the_first_timepoint_of_each_station(client_with_admin_permissions,
+                                                                      datasets_over_several_months_for_two_stations):
+    tes_datasets = [dataset for dataset in datasets_over_several_months_for_two_stations
+                    if dataset['station_id'] == 'TES']
+    later_tes2_dataset = dict(tes_datasets[-1], station_id='TES2', timepoint='2016-04-30T23:40:00+02:00')
+    client_with_admin_permissions.post('/api/v1/data', json=tes_datasets + [later_tes2_dataset])
+    first = isoparse('1900-01-01T00:00+01:00')
+    last = isoparse('2100-01-01T00:00+01:00')
+
+    with client_with_admin_permissions.application.test_request_context():
+        # the station added later is not assumed to have the full history of the other one
+        assert estimate_query_cost(first, last, ['TES2'], [column('pressure')]) == 1
+        # the temperature is read from the column of each temperature-humidity sensor
+        assert estimate_query_cost(first, last, ['TES2'], [column('pressure'), column('temperature')]) == \
+            1 + len(get_temp_humidity_sensor_ids())
+
+    # older data sent by a station catching up extends its time period
+    earlier_tes2_dataset = dict(later_tes2_dataset, timepoint='2016-04-30T23:00:00+02:00')
+    client_with_admin_permissions.post('/api/v1/data', json=[earlier_tes2_dataset])
+    with client_with_admin_permissions.application.test_request_context():
+        assert estimate_query_cost(first, last, ['TES2'], [column('pressure')]) == 5
+
+    # the deletion of the first datasets shortens it again
+    delete_payload = {'first_timepoint': '2016-04-30T23:00', 'last_timepoint': '2016-04-30T23:30', 'stations': ['TES2']}
+    client_with_admin_permissions.delete('/api/v1/data', json=delete_payload)
+    with client_with_admin_permissions.application.test_request_context():
+        assert estimate_query_cost(first, last, ['TES2'], [column('pressure')]) == 1
+
+
+@pytest.mark.usefixtures('client_with_data')
+def test_reject_query_above_budget(client_with_data):
+    client_with_data.application.config['QUERY_COST_BUDGET'] = 1000
+
+    result = client_with_data.get(URL)
+    assert result.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert 'error' in result.get_json()
+    assert result.headers['Retry-After'] == str(client_with_data.application.config['QUERY_RETRY_AFTER_IN_SEC'])
+
+    # a page of the data is within the budget
+    page_result = client_with_data.get('{}&limit=5'.format(URL))
+    assert page_result.status_code == HTTPStatus.OK
+    assert client_with_data.application.extensions['query_admission'].num_rejected_queries == 1
+
+
+@pytest.mark.usefixtures('client_with_data')
+def test_route_query_above_budget_to_snapshot(client_with_data, tmp_path, mocker):
+    expected_data = client_with_data.get(URL).get_json()
+
+    client_with_data.application.config['ANALYTICS_ENGINE'] = 'duckdb'
+    client_with_data.application.config['ANALYTICS_SNAPSHOT_PATH'] = str(tmp_path)
+    # the time period of the query is too short for the snapshot without the budget
+    client_with_data.application.config['ANALYTICS_MIN_PERIOD_IN_DAYS'] = 1000000
+    snapshot_result = client_with_data.post('/api/v1/data/analytics/snapshot')
+    assert wait_for_job(client_with_data, snapshot_result.headers['Location'])['status'] == 'FINISHED'
+    client_with_data.application.config['QUERY_COST_BUDGET'] = 1000
+    duckdb_query_spy = mocker.spy(analytics, '_run_duckdb_query')
+
+    result = client_with_data.get(URL)
+    assert result.status_code == HTTPStatus.OK
+    assert result.get_json() == expected_data
+    assert duckdb_query_spy.call_count == 1
+    assert client_with_data.application.extensions['query_admission'].num_routed_queries == 1
+
+
+@pytest.mark.usefixtures('client_with_data')
+def test_limit_concurrency_of_expensive_queries(client_with_data):
+    app = client_with_data.application
+    app.config['EXPENSIVE_QUERY_COST'] = 1000
+    app.config['EXPENSIVE_QUERY_WAIT_IN_SEC'] = 0
+    app.extensions['query_admission'] = QueryAdmission(1)
+    cheap_url = '/api/v1/data?first_timepoint=2016-02-01T00:00&last_timepoint=2016-02-02T00:00&sensors=pressure'
+
+    with app.test_request_context():
+        with app.extensions['query_admission'].admit_expensive_query(0):
+            expensive_result = client_with_data.get(URL)
+            assert expensive_result.status_code == HTTPStatus.TOO_MANY_REQUESTS
+            assert 'Retry-After' in expensive_result.headers
+
+            cheap_result = client_with_data.get(cheap_url)
+            assert cheap_result.status_code == HTTPStatus.OK
+
+    assert client_with_data.get(URL).status_code == HTTPStatus.OK
+    assert app.extensions['query_admission'].get_stats()['num_running_expensive_queries'] == 0
+
+
+def test_waiting_for_an_expensive_query_slot_is_cooperative():
+    query_admission = QueryAdmission(1)
+
+    def run_expensive_query():
+        with query_admission.admit_expensive_query(0):
+            gevent.sleep(0.1)
+
+    running_query = gevent.spawn(run_expensive_query)
+    gevent.sleep(0)
+    # the running query can only finish if the waiting one is yielding to it
+    with query_admission.admit_expensive_query(5):
+        assert running_query.dead
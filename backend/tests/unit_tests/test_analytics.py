@@ -0,0 +1,155 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import shutil
+from http import HTTPStatus
+
+import pytest
+from dateutil.parser import isoparse
+
+from backend_src.weatherdata import analytics
+# noinspection PyUnresolvedReferences
+from ..utils import client_with_admin_permissions, datasets_over_several_months_for_two_stations  # required fixtures
+from ..utils import wait_for_job
+
+URL = '/api/v1/data?first_timepoint=1900-01-01T00:00&last_timepoint=2100-01-01T00:00'
+
+
+def _create_snapshot(client, tmp_path):
+    client.application.config['ANALYTICS_ENGINE'] = 'duckdb'
+    client.application.config['ANALYTICS_SNAPSHOT_PATH'] = str(tmp_path)
+
+    snapshot_result = client.post('/api/v1/data/analytics/snapshot')
+    assert snapshot_result.status_code == HTTPStatus.ACCEPTED
+    job = wait_for_job(client, snapshot_result.headers['Location'])
+    assert job['status'] == 'FINISHED'
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'datasets_over_several_months_for_two_stations')
+def test_query_with_analytics_engine(client_with_admin_permissions, datasets_over_several_months_for_two_stations,
+                                     tmp_path, mocker):
+    client_with_admin_permissions.post('/api/v1/data', json=datasets_over_several_months_for_two_stations)
+    expected_data = client_with_admin_permissions.get(URL).get_json()
+    _create_snapshot(client_with_admin_permissions, tmp_path)
+    duckdb_query_spy = mocker.spy(analytics, '_run_duckdb_query')
+
+    assert client_with_admin_permissions.get(URL).get_json() == expected_data
+    assert duckdb_query_spy.call_count == 1
+
+    # short time periods are always queried from PostgreSQL
+    short_period_result = client_with_admin_permissions.get('/api/v1/data?first_timepoint=2016-02-01T00:00'
+                                                            '&last_timepoint=2016-02-20T00:00')
+    assert len(short_period_result.get_json()['TES']['timepoint']) == 2
+    assert duckdb_query_spy.call_count == 1
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'datasets_over_several_months_for_two_stations')
+def test_query_with_analytics_engine_includes_the_last_timepoint(client_with_admin_permissions,
+                                                                 datasets_over_several_months_for_two_stations,
+                                                                 tmp_path, mocker):
+    client_with_admin_permissions.post('/api/v1/data', json=datasets_over_several_months_for_two_stations)
+    # a dataset exists exactly at the last timepoint
+    query_string = {'first_timepoint': '1900-01-01T00:00', 'last_timepoint': '2016-03-01T00:10:00+01:00'}
+    expected_data = client_with_admin_permissions.get('/api/v1/data', query_string=query_string).get_json()
+    assert len(expected_data['TES']['timepoint']) == 4
+    _create_snapshot(client_with_admin_permissions, tmp_path)
+    duckdb_query_spy = mocker.spy(analytics, '_run_duckdb_query')
+
+    assert client_with_admin_permissions.get('/api/v1/data', query_string=query_string).get_json() == expected_data
+    assert duckdb_query_spy.call_count == 1
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'datasets_over_several_months_for_two_stations')
+def test_query_without_local_snapshot_files(client_with_admin_permissions,
+                                            datasets_over_several_months_for_two_stations, tmp_path, mocker):
+    client_with_admin_permissions.post('/api/v1/data', json=datasets_over_several_months_for_two_stations)
+    expected_data = client_with_admin_permissions.get(URL).get_json()
+    _create_snapshot(client_with_admin_permissions, tmp_path)
+    duckdb_query_spy = mocker.spy(analytics, '_run_duckdb_query')
+
+    # as on another instance or after a restart, the snapshot is still valid in the database
+    shutil.rmtree(tmp_path)
+
+    assert client_with_admin_permissions.get(URL).get_json() == expected_data
+    assert duckdb_query_spy.call_count == 0
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'datasets_over_several_months_for_two_stations')
+def test_changed_data_invalidates_the_analytics_snapshot(client_with_admin_permissions,
+                                                         datasets_over_several_months_for_two_stations, tmp_path,
+                                                         mocker):
+    client_with_admin_permissions.post('/api/v1/data', json=datasets_over_several_months_for_two_stations)
+    _create_snapshot(client_with_admin_permissions, tmp_path)
+    duckdb_query_spy = mocker.spy(analytics, '_run_duckdb_query')
+
+    late_dataset = dict(datasets_over_several_months_for_two_stations[0], timepoint='2016-02-10T12:00:00+01:00')
+    create_result = client_with_admin_permissions.post('/api/v1/data', json=[late_dataset])
+    assert create_result.status_code == HTTPStatus.NO_CONTENT
+
+    search_result = client_with_admin_permissions.get(URL)
+    assert isoparse('2016-02-10T12:00:00+01:00') in [isoparse(timepoint) for timepoint in
+                                                     search_result.get_json()['TES']['timepoint']]
+    assert duckdb_query_spy.call_count == 0
+
+    _create_snapshot(client_with_admin_permissions, tmp_path)
+    delete_payload = {
+        'first_timepoint': '2016-02-01T00:00',
+        'last_timepoint': '2016-02-28T00:00',
+        'stations': ['TES']
+    }
+    client_with_admin_permissions.delete('/api/v1/data', json=delete_payload)
+
+    search_result = client_with_admin_permissions.get(URL)
+    assert len(search_result.get_json()['TES']['timepoint']) == 3
+    assert duckdb_query_spy.call_count == 0
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'datasets_over_several_months_for_two_stations')
+def test_deletion_job_during_the_refresh_of_the_analytics_snapshot(client_with_admin_permissions,
+                                                                   datasets_over_several_months_for_two_stations,
+                                                                   tmp_path, mocker):
+    client_with_admin_permissions.post('/api/v1/data', json=datasets_over_several_months_for_two_stations)
+    read_month_datasets = analytics.read_month_datasets
+    deletion_jobs = []
+
+    def read_month_datasets_while_deleting(station_id, month_start, month_end):
+        datasets = read_month_datasets(station_id, month_start, month_end)
+        # the deletion job runs after the refresh has already read some of the data
+        if not datasets.empty and not deletion_jobs:
+            delete_payload = {
+                'first_timepoint': '1900-01-01T00:00',
+                'last_timepoint': '2100-01-01T00:00',
+                'stations': ['TES']
+            }
+            delete_result = client_with_admin_permissions.delete('/api/v1/data', json=delete_payload)
+            assert delete_result.status_code == HTTPStatus.ACCEPTED
+            deletion_jobs.append(wait_for_job(client_with_admin_permissions, delete_result.headers['Location']))
+        return datasets
+
+    mocker.patch.object(analytics, 'read_month_datasets', side_effect=read_month_datasets_while_deleting)
+    _create_snapshot(client_with_admin_permissions, tmp_path)
+    assert deletion_jobs[0]['status'] == 'FINISHED'
+    duckdb_query_spy = mocker.spy(analytics, '_run_duckdb_query')
+
+    search_result = client_with_admin_permissions.get(URL)
+    assert 'TES' not in search_result.get_json()
+    assert duckdb_query_spy.call_count == 0
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions')
+def test_create_analytics_snapshot_without_configured_engine(client_with_admin_permissions):
+    result = client_with_admin_permissions.post('/api/v1/data/analytics/snapshot')
+    assert result.status_code == HTTPStatus.BAD_REQUEST
@@ -0,0 +1,140 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from http import HTTPStatus
+
+import pytest
+from dateutil.parser import isoparse
+
+# noinspection PyUnresolvedReferences
+from ..utils import client_with_admin_permissions, datasets_over_several_months_for_two_stations  # required fixtures
+from ..utils import wait_for_job
+
+URL = '/api/v1/data?first_timepoint=1900-01-01T00:00&last_timepoint=2100-01-01T00:00'
+
+
+def _get_all_pages(client, limit):
+    data = {}
+    cursor = None
+    while True:
+        result = client.get(URL + '&limit={}'.format(limit) + ('&cursor={}'.format(cursor) if cursor else ''))
+        assert result.status_code == HTTPStatus.OK
+        for station_id, station_data in result.get_json()['data'].items():
+            station_pages = data.setdefault(station_id, {'timepoint': [], 'pressure': []})
+            station_pages['timepoint'] += station_data['timepoint']
+            station_pages['pressure'] += station_data['pressure']
+
+        cursor = result.get_json()['next_cursor']
+        if not cursor:
+            return data
+
+
+def _configure_archive(client, archive_format, tmp_path):
+    client.application.config['ARCHIVE_FORMAT'] = archive_format
+    if archive_format == 'parquet':
+        client.application.config['ARCHIVE_PATH'] = str(tmp_path)
+
+
+def _archive(client):
+    archive_result = client.post('/api/v1/data/archive')
+    assert archive_result.status_code == HTTPStatus.ACCEPTED
+
+    return wait_for_job(client, archive_result.headers['Location'])
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'datasets_over_several_months_for_two_stations')
+@pytest.mark.parametrize('archive_format', ['parquet', 'blocks'])
+def test_archive_closed_months(client_with_admin_permissions, datasets_over_several_months_for_two_stations,
+                               archive_format, tmp_path):
+    _configure_archive(client_with_admin_permissions, archive_format, tmp_path)
+    create_result = client_with_admin_permissions.post('/api/v1/data',
+                                                       json=datasets_over_several_months_for_two_stations)
+    assert create_result.status_code == HTTPStatus.NO_CONTENT
+    expected_data = client_with_admin_permissions.get(URL).get_json()
+    expected_pages = _get_all_pages(client_with_admin_permissions, limit=3)
+    expected_limits = client_with_admin_permissions.get('/api/v1/data/limits').get_json()
+
+    job = _archive(client_with_admin_permissions)
+    assert job['status'] == 'FINISHED'
+    # the month of the latest dataset of each station stays in the database
+    assert job['num_deleted_datasets'] == 8
+    assert len(list(tmp_path.glob('*/*.parquet'))) == (6 if archive_format == 'parquet' else 0)
+
+    assert client_with_admin_permissions.get(URL).get_json() == expected_data
+    assert _get_all_pages(client_with_admin_permissions, limit=3) == expected_pages
+    assert client_with_admin_permissions.get('/api/v1/data/limits').get_json() == expected_limits
+
+    # archiving again is not changing anything
+    job = _archive(client_with_admin_permissions)
+    assert job['num_deleted_datasets'] == 0
+    assert client_with_admin_permissions.get(URL).get_json() == expected_data
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'datasets_over_several_months_for_two_stations')
+@pytest.mark.parametrize('archive_format', ['parquet', 'blocks'])
+def test_delete_archived_datasets(client_with_admin_permissions, datasets_over_several_months_for_two_stations,
+                                  archive_format, tmp_path):
+    _configure_archive(client_with_admin_permissions, archive_format, tmp_path)
+    client_with_admin_permissions.post('/api/v1/data', json=datasets_over_several_months_for_two_stations)
+    _archive(client_with_admin_permissions)
+
+    delete_payload = {
+        'first_timepoint': '2016-02-01T00:00',
+        'last_timepoint': '2016-03-01T00:00',
+        'stations': ['TES']
+    }
+    delete_result = client_with_admin_permissions.delete('/api/v1/data', json=delete_payload)
+    assert delete_result.status_code == HTTPStatus.NO_CONTENT
+
+    search_result = client_with_admin_permissions.get(URL)
+    assert [isoparse(timepoint) for timepoint in search_result.get_json()['TES']['timepoint']] == \
+           [isoparse('2016-01-31T23:50:00+01:00'), isoparse('2016-03-01T00:10:00+01:00'),
+            isoparse('2016-04-30T23:50:00+02:00')]
+    assert len(search_result.get_json()['TES2']['timepoint']) == 5
+    if archive_format == 'parquet':
+        # the file of the month has been replaced
+        assert len(list(tmp_path.glob('TES/*.parquet'))) == 2
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'datasets_over_several_months_for_two_stations')
+def test_delete_datasets_of_several_archived_months(client_with_admin_permissions,
+                                                    datasets_over_several_months_for_two_stations, tmp_path):
+    _configure_archive(client_with_admin_permissions, 'parquet', tmp_path)
+    client_with_admin_permissions.post('/api/v1/data', json=datasets_over_several_months_for_two_stations)
+    _archive(client_with_admin_permissions)
+
+    delete_payload = {
+        'first_timepoint': '2016-01-01T00:00',
+        'last_timepoint': '2016-04-01T00:00',
+        'stations': ['TES']
+    }
+    delete_result = client_with_admin_permissions.delete('/api/v1/data', json=delete_payload)
+    assert delete_result.status_code == HTTPStatus.ACCEPTED
+
+    job = wait_for_job(client_with_admin_permissions, delete_result.headers['Location'])
+    assert job['status'] == 'FINISHED'
+    assert job['progress_in_percent'] == 100
+    assert job['num_deleted_datasets'] == 4
+
+    search_result = client_with_admin_permissions.get(URL)
+    assert [isoparse(timepoint) for timepoint in search_result.get_json()['TES']['timepoint']] == \
+           [isoparse('2016-04-30T23:50:00+02:00')]
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions')
+def test_archive_without_configured_archive(client_with_admin_permissions):
+    result = client_with_admin_permissions.post('/api/v1/data/archive')
+    assert result.status_code == HTTPStatus.BAD_REQUEST
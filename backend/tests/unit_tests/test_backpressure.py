@@ -0,0 +1,72 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from http import HTTPStatus
+
+import pytest
+
+from backend_src.weatherdata.backpressure import IngestMonitor
+# noinspection PyUnresolvedReferences
+from ..utils import client_with_push_user_permissions, a_dataset, another_dataset  # required as a fixture
+
+
+@pytest.mark.usefixtures('client_with_push_user_permissions', 'a_dataset', 'another_dataset')
+def test_reject_ingest_with_too_many_pending_requests(client_with_push_user_permissions, a_dataset,
+                                                      another_dataset):
+    monitor = client_with_push_user_permissions.application.extensions['ingest_monitor']
+    monitor.num_pending_ingests = monitor.max_pending_ingests
+
+    result = client_with_push_user_permissions.post('/api/v1/data', json=a_dataset)
+    assert result.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert 'error' in result.get_json()
+    assert result.headers['Retry-After'] == str(
+        client_with_push_user_permissions.application.config['INGEST_RETRY_AFTER_IN_SEC'])
+    assert monitor.num_rejected_ingests == 1
+
+    monitor.num_pending_ingests = 0
+    result = client_with_push_user_permissions.post('/api/v1/data', json=another_dataset)
+    assert result.status_code == HTTPStatus.NO_CONTENT
+    assert monitor.num_pending_ingests == 0
+    assert monitor.commit_latency_in_sec > 0
+
+
+@pytest.mark.usefixtures('client_with_push_user_permissions', 'a_dataset')
+def test_reject_ingest_with_slow_commits(client_with_push_user_permissions, a_dataset):
+    monitor = client_with_push_user_permissions.application.extensions['ingest_monitor']
+    monitor.commit_latency_in_sec = 2 * monitor.max_commit_latency_in_sec
+    monitor.num_pending_ingests = 1
+
+    result = client_with_push_user_permissions.post('/api/v1/data', json=a_dataset)
+    assert result.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+
+    # a single ingest is still admitted, the fast commit is reducing the latency
+    monitor.num_pending_ingests = 0
+    result = client_with_push_user_permissions.post('/api/v1/data', json=a_dataset)
+    assert result.status_code == HTTPStatus.NO_CONTENT
+    assert monitor.commit_latency_in_sec < 2 * monitor.max_commit_latency_in_sec
+
+
+def test_commit_latency_average():
+    monitor = IngestMonitor(max_pending_ingests=2, max_commit_latency_in_sec=1.0)
+    for _ in range(20):
+        monitor.record_commit_latency(2.0)
+    monitor.num_pending_ingests = 1
+    assert monitor.is_overloaded()
+
+    for _ in range(20):
+        monitor.record_commit_latency(0.1)
+    assert not monitor.is_overloaded()
@@ -0,0 +1,68 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend_src.weatherdata.blocks import encode_timepoints, decode_timepoints, encode_floats, decode_floats, \
+    encode_datasets, decode_datasets, CHUNK_SIZE
+
+
+@pytest.mark.parametrize('num_values', [0, 1, 2, CHUNK_SIZE, CHUNK_SIZE + 2, 10 * CHUNK_SIZE + 1])
+def test_encode_and_decode_timepoints(num_values):
+    timepoints = pd.Series(pd.date_range('2021-03-01', periods=num_values, freq='10min', tz='Europe/Berlin'))
+    # irregular timepoints
+    timepoints.iloc[num_values // 2:] += pd.Timedelta(seconds=7, microseconds=15)
+
+    decoded_timepoints = decode_timepoints(encode_timepoints(timepoints), num_values)
+
+    assert decoded_timepoints.tolist() == pd.to_datetime(timepoints, utc=True).tolist()
+
+
+def test_encode_regular_timepoints_compactly():
+    timepoints = pd.Series(pd.date_range('2021-03-01', periods=31 * 144, freq='10min', tz='Europe/Berlin'))
+    assert len(encode_timepoints(timepoints)) < 200
+
+
+@pytest.mark.parametrize('num_values', [0, 1, 2, CHUNK_SIZE, CHUNK_SIZE + 2, 10 * CHUNK_SIZE + 1])
+def test_encode_and_decode_floats(num_values):
+    random_generator = np.random.default_rng(12345)
+    values = pd.Series(np.round(1013 + np.cumsum(random_generator.normal(0, 0.2, num_values)), 1))
+    values.iloc[num_values // 3:num_values // 2] = np.nan
+
+    decoded_values = decode_floats(encode_floats(values), num_values)
+
+    np.testing.assert_array_equal(decoded_values, values.to_numpy())
+
+
+def test_encode_constant_floats_compactly():
+    values = pd.Series(np.full(31 * 144, 53.0))
+    assert len(encode_floats(values)) < 200
+
+
+def test_encode_and_decode_datasets():
+    datasets = pd.DataFrame({
+        'timepoint': pd.date_range('2021-03-01', periods=100, freq='10min', tz='UTC'),
+        'station_id': 'TES',
+        'pressure': np.linspace(1000, 1010, 100),
+        'temperature_OUT1': np.linspace(-10, 10, 100)
+    })
+
+    decoded_datasets = decode_datasets('TES', encode_datasets(datasets), ['timepoint', 'station_id', 'pressure'])
+
+    pd.testing.assert_frame_equal(decoded_datasets, datasets[['timepoint', 'station_id', 'pressure']],
+                                  check_dtype=False)
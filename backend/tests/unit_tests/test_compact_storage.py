@@ -0,0 +1,81 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from http import HTTPStatus
+
+import pytest
+
+from backend_app import create_app
+from backend_config.settings import TestConfig
+from backend_src import compact_storage
+from backend_src.extensions import db
+from backend_src.models import upgrade_weather_database, WeatherDataset
+# noinspection PyUnresolvedReferences
+from ..utils import client_with_admin_permissions, a_dataset_with_missing_outside_sensor_data  # required as a fixture
+
+
+def _get_column_type(table_name, column_name):
+    return db.session.execute(db.text('SELECT data_type FROM information_schema.columns '
+                                      'WHERE table_name = :table_name AND column_name = :column_name'),
+                              {'table_name': table_name, 'column_name': column_name}).scalar()
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'a_dataset_with_missing_outside_sensor_data')
+def test_migrate_to_compact_storage(client_with_admin_permissions, a_dataset_with_missing_outside_sensor_data,
+                                    monkeypatch):
+    # the backfill is running in several batches
+    monkeypatch.setattr(compact_storage, 'MIGRATION_BATCH_SIZE', 2)
+
+    create_result = client_with_admin_permissions.post('/api/v1/data', json=a_dataset_with_missing_outside_sensor_data)
+    assert create_result.status_code == HTTPStatus.NO_CONTENT
+    url = '/api/v1/data?first_timepoint=1900-01-01T00:00&last_timepoint=2100-01-01T00:00'
+    expected_data = client_with_admin_permissions.get(url).get_json()
+
+    compact_config = TestConfig()
+    compact_config.COMPACT_STORAGE = True
+    compact_app = create_app(compact_config)
+    with compact_app.app_context():
+        upgrade_weather_database()
+        assert _get_column_type('weather_dataset', 'pressure') == 'smallint'
+        assert _get_column_type('weather_dataset', 'rain_counter') == 'integer'
+        assert _get_column_type('temp_humidity_sensor_data', 'temperature') == 'smallint'
+        assert _get_column_type('wide_temp_humidity_sensor_data', 'humidity_OUT1') == 'smallint'
+
+    compact_client = compact_app.test_client()
+    compact_client.environ_base['HTTP_AUTHORIZATION'] = client_with_admin_permissions.environ_base['HTTP_AUTHORIZATION']
+    assert compact_client.get(url).get_json() == expected_data
+
+    # the layout is bound to the engine, the values are therefore converted without an app context, e.g. in a greenlet
+    with compact_app.app_context():
+        compact_engine = db.engines['weather-data']
+    with compact_engine.connect() as connection:
+        pressures = connection.execute(db.select(WeatherDataset.pressure).order_by(WeatherDataset.timepoint)).scalars()
+        assert pressures.all() == [1020.5, 1030.5, 1040.5]
+
+    # the compact data would be misinterpreted without the compact storage layout being enabled
+    with client_with_admin_permissions.application.app_context():
+        with pytest.raises(RuntimeError):
+            upgrade_weather_database()
+
+
+def test_refuse_to_convert_values_without_a_bound_storage_layout():
+    unbound_engine = db.create_engine(TestConfig.SQLALCHEMY_BINDS['weather-data'])
+    try:
+        with unbound_engine.connect() as connection:
+            with pytest.raises(RuntimeError):
+                connection.execute(db.select(WeatherDataset.pressure)).all()
+    finally:
+        unbound_engine.dispose()
@@ -0,0 +1,82 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from http import HTTPStatus
+
+import pytest
+
+from backend_app import create_app
+from backend_config.settings import TestConfig
+from backend_src.executor.pool import ExecutorKind, OffloadExecutor
+# noinspection PyUnresolvedReferences
+from ..utils import client_with_admin_permissions, a_dataset, a_user  # required as a fixture
+from ..utils import drop_registration_details_for_user, zip_payload
+
+
+def _create_client(executor_kind, client_with_admin_permissions):
+    config = TestConfig()
+    config.OFFLOAD_EXECUTOR = executor_kind.value
+    app = create_app(config)
+
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = client_with_admin_permissions.environ_base['HTTP_AUTHORIZATION']
+
+    return client
+
+
+def _square(value):
+    return value * value
+
+
+@pytest.mark.parametrize('executor_kind', list(ExecutorKind))
+def test_run_offloaded(executor_kind):
+    executor = OffloadExecutor(executor_kind, 2)
+    assert executor.run(_square, 3) == 9
+    assert executor.get_stats()['num_pending'] == 0
+    assert executor.get_stats()['num_completed'] == (0 if executor_kind == ExecutorKind.INLINE else 1)
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions')
+def test_get_executor_stats(client_with_admin_permissions):
+    result = client_with_admin_permissions.get('/api/v1/executor')
+    assert result.status_code == HTTPStatus.OK
+    assert result.get_json() == {'kind': 'thread', 'num_workers': TestConfig.OFFLOAD_NUM_WORKERS, 'num_pending': 0,
+                                 'queue_depth': 0, 'num_completed': 0}
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'a_dataset', 'a_user')
+@pytest.mark.parametrize('executor_kind', list(ExecutorKind))
+def test_requests_with_executor(client_with_admin_permissions, a_dataset, a_user, executor_kind):
+    client = _create_client(executor_kind, client_with_admin_permissions)
+
+    create_result = client.post('/api/v1/data', data=zip_payload(a_dataset),
+                                headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+    assert create_result.status_code == HTTPStatus.NO_CONTENT
+
+    get_result = client.get('/api/v1/data', query_string={'first_timepoint': a_dataset[0]['timepoint'],
+                                                          'last_timepoint': a_dataset[0]['timepoint']})
+    assert get_result.status_code == HTTPStatus.OK
+    assert get_result.get_json()[a_dataset[0]['station_id']]['pressure'] == [a_dataset[0]['pressure']]
+
+    user_result = client.post('/api/v1/user', json=a_user)
+    assert user_result.status_code == HTTPStatus.CREATED
+    drop_registration_details_for_user(a_user)
+    login_result = client.post('/api/v1/login', json=a_user)
+    assert login_result.status_code == HTTPStatus.OK
+
+    stats_result = client.get('/api/v1/executor')
+    assert stats_result.get_json()['kind'] == (executor_kind.value or 'inline')
@@ -0,0 +1,48 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backend_src.extensions import db
+from backend_src.job.models import Job, JobStatus
+from backend_src.job.runner import fail_orphaned_jobs
+# noinspection PyUnresolvedReferences
+from ..utils import client_with_admin_permissions  # required as a fixture
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions')
+def test_fail_orphaned_jobs(client_with_admin_permissions):
+    with client_with_admin_permissions.application.app_context():
+        long_ago = datetime.now(timezone.utc) - timedelta(hours=1)
+        orphaned_job = Job(description='Orphaned', status=JobStatus.RUNNING.name, progress_in_percent=40,
+                           updated_at=long_ago)
+        running_job = Job(description='Running', status=JobStatus.RUNNING.name)
+        finished_job = Job(description='Finished', status=JobStatus.FINISHED.name, updated_at=long_ago)
+        db.session.add_all([orphaned_job, running_job, finished_job])
+        db.session.commit()
+        job_ids = [orphaned_job.id, running_job.id, finished_job.id]
+
+        # as done on startup by `prepare_database`
+        fail_orphaned_jobs()
+
+    job_statuses = [client_with_admin_permissions.get('/api/v1/job/{}'.format(job_id)).get_json()['status']
+                    for job_id in job_ids]
+    assert job_statuses == ['FAILED', 'RUNNING', 'FINISHED']
+    orphaned_job_result = client_with_admin_permissions.get('/api/v1/job/{}'.format(job_ids[0])).get_json()
+    assert orphaned_job_result['progress_in_percent'] == 40
+    assert orphaned_job_result['error']
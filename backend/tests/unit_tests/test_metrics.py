@@ -0,0 +1,124 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from http import HTTPStatus
+
+import pytest
+from prometheus_client import REGISTRY
+from prometheus_client.parser import text_string_to_metric_families
+
+# noinspection PyUnresolvedReferences
+from ..utils import client_with_admin_permissions, client_with_push_user_permissions, client_without_permissions, \
+    a_dataset  # required fixtures
+
+DATA_ROUTE = '/api/v1/data'
+METRICS_AUTHORIZATION = {'Authorization': 'Bearer METRICS-TOKEN'}
+URL = '{}?first_timepoint=2016-02-05T00:00&last_timepoint=2016-02-06T00:00&sensors=dewpoint'.format(DATA_ROUTE)
+
+
+def _get_sample_value(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'a_dataset')
+def test_get_metrics(client_with_admin_permissions, a_dataset):
+    num_ingested = _get_sample_value('weather_datasets_ingested_total')
+    num_returned = _get_sample_value('weather_datasets_returned_total')
+    num_requests = _get_sample_value('weather_http_requests_total',
+                                     {'method': 'GET', 'route': DATA_ROUTE, 'status': '200'})
+    num_dewpoint_stages = _get_sample_value('weather_request_stage_duration_seconds_count', {'stage': 'dewpoint'})
+    num_checkouts = _get_sample_value('weather_db_pool_checkout_duration_seconds_count')
+
+    create_result = client_with_admin_permissions.post(DATA_ROUTE, json=a_dataset)
+    assert create_result.status_code == HTTPStatus.NO_CONTENT
+    query_result = client_with_admin_permissions.get(URL)
+    assert query_result.status_code == HTTPStatus.OK
+
+    result = client_with_admin_permissions.get('/metrics', headers=METRICS_AUTHORIZATION)
+    assert result.status_code == HTTPStatus.OK
+    assert result.headers['Content-Type'].startswith('text/plain')
+    metric_names = [family.name for family in text_string_to_metric_families(result.get_data(as_text=True))]
+    for name in ['weather_http_requests', 'weather_http_request_duration_seconds', 'weather_http_request_bytes',
+                 'weather_http_response_bytes', 'weather_request_stage_duration_seconds',
+                 'weather_db_pool_checkout_duration_seconds', 'weather_executor_queue_depth',
+                 'weather_pending_ingests', 'weather_rejected_queries']:
+        assert name in metric_names
+
+    assert _get_sample_value('weather_datasets_ingested_total') == num_ingested + 1
+    assert _get_sample_value('weather_datasets_returned_total') == num_returned + 1
+    assert _get_sample_value('weather_http_requests_total',
+                             {'method': 'GET', 'route': DATA_ROUTE, 'status': '200'}) == num_requests + 1
+    assert _get_sample_value('weather_request_stage_duration_seconds_count',
+                             {'stage': 'dewpoint'}) == num_dewpoint_stages + 1
+    assert _get_sample_value('weather_db_pool_checkout_duration_seconds_count') > num_checkouts
+    assert _get_sample_value('weather_http_response_bytes_total', {'route': DATA_ROUTE}) > 0
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions')
+def test_get_metrics_without_metrics_token(client_with_admin_permissions):
+    # the JWT access tokens are not accepted, not even of an admin
+    result = client_with_admin_permissions.get('/metrics')
+    assert result.status_code == HTTPStatus.UNAUTHORIZED
+    assert 'error' in result.get_json()
+
+
+@pytest.mark.usefixtures('client_without_permissions')
+def test_get_metrics_with_wrong_metrics_token(client_without_permissions):
+    result = client_without_permissions.get('/metrics', headers={'Authorization': 'Bearer WRONG-TOKEN'})
+    assert result.status_code == HTTPStatus.UNAUTHORIZED
+    assert 'error' in result.get_json()
+
+
+@pytest.mark.usefixtures('client_without_permissions')
+def test_get_metrics_if_disabled(client_without_permissions):
+    client_without_permissions.application.config['METRICS_TOKEN'] = ''
+
+    result = client_without_permissions.get('/metrics', headers=METRICS_AUTHORIZATION)
+    assert result.status_code == HTTPStatus.NOT_FOUND
+    assert 'error' in result.get_json()
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'a_dataset')
+def test_server_timing(client_with_admin_permissions, a_dataset):
+    client_with_admin_permissions.post(DATA_ROUTE, json=a_dataset)
+
+    result = client_with_admin_permissions.get(URL)
+    assert result.status_code == HTTPStatus.OK
+    stages = [entry.split(';')[0] for entry in result.headers['Server-Timing'].split(', ')]
+    assert stages == ['sql', 'reshape', 'dewpoint', 'serialization', 'total']
+
+    latest_result = client_with_admin_permissions.get('{}/latest'.format(DATA_ROUTE))
+    assert 'sql;dur=' in latest_result.headers['Server-Timing']
+
+    assert 'Server-Timing' not in client_with_admin_permissions.get('/api/v1/station').headers
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'a_dataset')
+def test_profile(client_with_admin_permissions, a_dataset):
+    client_with_admin_permissions.post(DATA_ROUTE, json=a_dataset)
+
+    result = client_with_admin_permissions.get('{}&profile=1'.format(URL))
+    assert result.status_code == HTTPStatus.OK
+    assert result.headers['Content-Type'].startswith('text/plain')
+    assert 'get_weather_datasets' in result.get_data(as_text=True)
+
+
+@pytest.mark.usefixtures('client_with_push_user_permissions')
+def test_profile_without_admin_permissions(client_with_push_user_permissions):
+    result = client_with_push_user_permissions.get('{}&profile=1'.format(URL))
+    assert result.status_code == HTTPStatus.FORBIDDEN
+    assert 'error' in result.get_json()
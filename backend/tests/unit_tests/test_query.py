@@ -0,0 +1,50 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from sqlalchemy import column
+
+from backend_src.weatherdata.query import plan_query, QueryPlanType
+
+
+def test_plan_query_for_weather_data_only():
+    plan = plan_query([column('pressure'), column('rain_counter')], ['IN', 'OUT1'])
+    assert plan.plan_type == QueryPlanType.WEATHER_DATA_ONLY
+    assert [data_column.name for data_column in plan.dataset_columns] == ['pressure', 'rain_counter']
+    assert plan.wide_columns == []
+
+
+def test_plan_query_for_temp_humidity_data_only():
+    plan = plan_query([column('temperature')], ['IN', 'OUT1'])
+    assert plan.plan_type == QueryPlanType.TEMP_HUMIDITY_DATA_ONLY
+    assert plan.dataset_columns == []
+    assert [data_column.name for data_column in plan.wide_columns] == ['temperature_IN', 'temperature_OUT1']
+
+
+def test_plan_query_for_joined_data():
+    plan = plan_query([column('uv'), column('temperature'), column('humidity')], ['IN'])
+    assert plan.plan_type == QueryPlanType.JOINED
+    assert [data_column.name for data_column in plan.wide_columns] == ['temperature_IN', 'humidity_IN']
+
+
+def test_plan_query_for_temp_humidity_data_requiring_datasets():
+    plan = plan_query([column('humidity')], ['IN'], requires_datasets=True)
+    assert plan.plan_type == QueryPlanType.JOINED
+
+
+def test_plan_query_without_temp_humidity_sensors():
+    plan = plan_query([column('temperature')], [])
+    assert plan.plan_type == QueryPlanType.WEATHER_DATA_ONLY
+    assert plan.wide_columns == []
@@ -0,0 +1,121 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from http import HTTPStatus
+from urllib.parse import quote_plus
+
+import pytest
+from sqlalchemy import create_engine
+
+from backend_app import create_app
+from backend_config.settings import TestConfig
+from backend_src.compact_storage import bind_storage_layout
+from backend_src.extensions import db
+from backend_src.models import WeatherStation
+from backend_src.read_replicas import WRITE_POSITION_COOKIE
+# noinspection PyUnresolvedReferences
+from ..utils import client_with_admin_permissions, a_station  # required as a fixture
+
+REPLICA_DATABASE = 'replica_test'
+REPLICA_URI = 'postgresql+psycopg2://{}:{}@{}:{}/{}'.format(TestConfig.DB_USER, quote_plus(TestConfig.DB_PASSWORD),
+                                                            TestConfig.DB_URL, TestConfig.DB_PORT, REPLICA_DATABASE)
+UNAVAILABLE_REPLICA_URI = 'postgresql+psycopg2://{}:{}@{}:1/{}'.format(TestConfig.DB_USER,
+                                                                       quote_plus(TestConfig.DB_PASSWORD),
+                                                                       TestConfig.DB_URL, REPLICA_DATABASE)
+
+
+@pytest.fixture
+def a_replica_database():
+    # a separate database is standing in for a replica, its different content shows which database served a request
+    primary_engine = create_engine(TestConfig.SQLALCHEMY_BINDS['weather-data'], isolation_level='AUTOCOMMIT')
+    with primary_engine.connect() as connection:
+        if not connection.execute(db.text('SELECT 1 FROM pg_database WHERE datname = :name'),
+                                  {'name': REPLICA_DATABASE}).scalar():
+            connection.execute(db.text('CREATE DATABASE {}'.format(REPLICA_DATABASE)))
+    primary_engine.dispose()
+
+    replica_engine = create_engine(REPLICA_URI)
+    bind_storage_layout(replica_engine, TestConfig.COMPACT_STORAGE)
+    db.metadatas['weather-data'].create_all(replica_engine)
+    with replica_engine.begin() as connection:
+        connection.execute(WeatherStation.__table__.insert().values(
+            station_id='REP', device='DEVICE', location='The Replica Location', latitude=10.5, longitude=5.2,
+            height=0.0, rain_calib_factor=1.0))
+
+    try:
+        yield REPLICA_URI
+    finally:
+        db.metadatas['weather-data'].drop_all(replica_engine)
+        replica_engine.dispose()
+
+
+def _create_client(replica_uris, client_with_admin_permissions):
+    config = TestConfig()
+    config.READ_REPLICA_URIS = replica_uris
+    app = create_app(config)
+
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = client_with_admin_permissions.environ_base['HTTP_AUTHORIZATION']
+
+    return client
+
+
+def _get_station_ids(client):
+    result = client.get('/api/v1/station')
+    assert result.status_code == HTTPStatus.OK
+    return sorted(station['station_id'] for station in result.get_json())
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'a_replica_database')
+def test_read_from_replicas_round_robin(client_with_admin_permissions, a_replica_database):
+    # the primary database is also serving as second replica
+    client = _create_client([a_replica_database, TestConfig.SQLALCHEMY_BINDS['weather-data']],
+                            client_with_admin_permissions)
+
+    assert _get_station_ids(client) == ['REP']
+    assert _get_station_ids(client) == ['TES', 'TES2']
+    assert _get_station_ids(client) == ['REP']
+    assert _get_station_ids(client_with_admin_permissions) == ['TES', 'TES2']
+
+    limits_result = client.get('/api/v1/data/limits')
+    assert limits_result.status_code == HTTPStatus.OK
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'a_replica_database')
+def test_fall_back_for_unavailable_replica(client_with_admin_permissions, a_replica_database):
+    client = _create_client([UNAVAILABLE_REPLICA_URI, a_replica_database], client_with_admin_permissions)
+    assert _get_station_ids(client) == ['REP']
+    assert _get_station_ids(client) == ['REP']
+    assert not client.application.extensions['read_replicas'].replicas[0].is_available
+
+    client = _create_client([UNAVAILABLE_REPLICA_URI], client_with_admin_permissions)
+    assert _get_station_ids(client) == ['TES', 'TES2']
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'a_replica_database', 'a_station')
+def test_read_your_writes(client_with_admin_permissions, a_replica_database, a_station):
+    client = _create_client([a_replica_database], client_with_admin_permissions)
+    assert _get_station_ids(client) == ['REP']
+
+    create_result = client.post('/api/v1/station', json=a_station)
+    assert create_result.status_code == HTTPStatus.CREATED
+    assert client.get_cookie(WRITE_POSITION_COOKIE) is not None
+
+    # the replica has not replayed the write, the writing client is therefore served by the primary database
+    assert _get_station_ids(client) == ['TES', 'TES2', 'TES3']
+
+    other_client = _create_client([a_replica_database], client_with_admin_permissions)
+    assert _get_station_ids(other_client) == ['REP']
@@ -0,0 +1,164 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import datetime, timedelta
+from http import HTTPStatus
+from typing import List, Dict
+
+import pytest
+
+from backend_src.extensions import db
+from backend_src.job.models import Job, JobStatus
+from backend_src.models import WeatherStation
+from backend_src.weatherdata.deletion import delete_station_in_slices
+
+# noinspection PyUnresolvedReferences
+from ..utils import client_with_admin_permissions, request_budgets, verify_request_budget  # required as a fixture
+from ..utils import measure_request, wait_for_job
+
+NUM_DATASETS = 50
+
+
+@pytest.fixture
+def many_datasets() -> List[Dict]:
+    first_timepoint = datetime.fromisoformat('2016-02-05T00:00:00+01:00')
+    datasets = []
+    for index in range(NUM_DATASETS):
+        datasets.append({
+            'timepoint': (first_timepoint + timedelta(minutes=10 * index)).isoformat(),
+            'station_id': 'TES',
+            'pressure': 1000.0 + index,
+            'uv': 2.4,
+            'rain_counter': 980.5 + index,
+            'direction': 350.2,
+            'speed': 95.2,
+            'wind_temperature': 9.8,
+            'gusts': 120.5,
+            'temperature_humidity': [
+                {
+                    'sensor_id': 'IN',
+                    'temperature': 20.0 + index,
+                    'humidity': 53.0
+                },
+                {
+                    'sensor_id': 'OUT1',
+                    'temperature': -10.0 + index,
+                    'humidity': 73.0
+                }
+            ]
+        })
+
+    yield datasets
+
+
+def _get_query_string(datasets):
+    return {
+        'first_timepoint': datasets[0]['timepoint'],
+        'last_timepoint': datasets[-1]['timepoint'],
+        'stations': 'TES'
+    }
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'many_datasets', 'verify_request_budget')
+def test_create_datasets_budget(client_with_admin_permissions, many_datasets, verify_request_budget):
+    result = verify_request_budget('create_datasets', client_with_admin_permissions,
+                                   lambda: client_with_admin_permissions.post('/api/v1/data', json=many_datasets))
+    assert result.status_code == HTTPStatus.NO_CONTENT
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'many_datasets', 'verify_request_budget')
+def test_update_dataset_budget(client_with_admin_permissions, many_datasets, verify_request_budget):
+    client_with_admin_permissions.post('/api/v1/data', json=many_datasets)
+
+    updated_dataset = dict(many_datasets[NUM_DATASETS // 2], pressure=900.0)
+    result = verify_request_budget('update_dataset', client_with_admin_permissions,
+                                   lambda: client_with_admin_permissions.put('/api/v1/data', json=updated_dataset))
+    assert result.status_code == HTTPStatus.NO_CONTENT
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'many_datasets', 'verify_request_budget')
+def test_update_datasets_budget(client_with_admin_permissions, many_datasets, verify_request_budget):
+    client_with_admin_permissions.post('/api/v1/data', json=many_datasets)
+
+    updated_datasets = [dict(dataset, pressure=900.0) for dataset in many_datasets]
+    result = verify_request_budget('update_datasets', client_with_admin_permissions,
+                                   lambda: client_with_admin_permissions.put('/api/v1/data/batch',
+                                                                             json=updated_datasets))
+    assert result.status_code == HTTPStatus.OK
+    assert result.get_json()['num_updated_datasets'] == NUM_DATASETS
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'many_datasets', 'verify_request_budget')
+def test_get_datasets_budget(client_with_admin_permissions, many_datasets, verify_request_budget):
+    client_with_admin_permissions.post('/api/v1/data', json=many_datasets)
+
+    result = verify_request_budget('get_datasets', client_with_admin_permissions,
+                                   lambda: client_with_admin_permissions.get(
+                                       '/api/v1/data', query_string=_get_query_string(many_datasets)))
+    assert result.status_code == HTTPStatus.OK
+    assert len(result.get_json()['TES']['timepoint']) == NUM_DATASETS
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'many_datasets', 'verify_request_budget')
+def test_get_latest_datasets_budget(client_with_admin_permissions, many_datasets, verify_request_budget):
+    client_with_admin_permissions.post('/api/v1/data', json=many_datasets)
+
+    result = verify_request_budget('get_latest_datasets', client_with_admin_permissions,
+                                   lambda: client_with_admin_permissions.get('/api/v1/data/latest'))
+    assert result.status_code == HTTPStatus.OK
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'many_datasets', 'verify_request_budget')
+def test_remove_station_budget(client_with_admin_permissions, many_datasets, verify_request_budget):
+    client_with_admin_permissions.post('/api/v1/data', json=many_datasets)
+
+    # the deletion of the data itself is running as a job, its budget is verified separately
+    result = verify_request_budget('remove_station', client_with_admin_permissions,
+                                   lambda: client_with_admin_permissions.delete('/api/v1/station/1'))
+    assert result.status_code == HTTPStatus.ACCEPTED
+    assert wait_for_job(client_with_admin_permissions, result.headers['Location'])['status'] == 'FINISHED'
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'many_datasets', 'verify_request_budget')
+def test_delete_station_job_budget(client_with_admin_permissions, many_datasets, verify_request_budget):
+    client_with_admin_permissions.post('/api/v1/data', json=many_datasets)
+
+    # the job function is measured directly because the job is running in the background of the request
+    with client_with_admin_permissions.application.app_context():
+        job = Job(description='Deletion of station \'TES\'', status=JobStatus.RUNNING.name)
+        db.session.add(job)
+        db.session.commit()
+
+        verify_request_budget('delete_station_job', client_with_admin_permissions,
+                              lambda: delete_station_in_slices(job.id, 'TES'))
+        assert not WeatherStation.query.filter_by(station_id='TES').first()
+        assert db.session.get(Job, job.id).num_deleted_datasets == NUM_DATASETS
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'many_datasets')
+def test_measure_request_counts_statements(client_with_admin_permissions, many_datasets):
+    client_with_admin_permissions.post('/api/v1/data', json=many_datasets[:1])
+    single_measurement = measure_request(client_with_admin_permissions, lambda: client_with_admin_permissions.get(
+        '/api/v1/data', query_string=_get_query_string(many_datasets)))
+
+    client_with_admin_permissions.post('/api/v1/data', json=many_datasets[1:])
+    many_measurement = measure_request(client_with_admin_permissions, lambda: client_with_admin_permissions.get(
+        '/api/v1/data', query_string=_get_query_string(many_datasets)))
+
+    assert single_measurement.num_statements > 0
+    assert single_measurement.peak_allocation_in_bytes > 0
+    # the number of statements must not scale with the number of returned datasets
+    assert many_measurement.num_statements == single_measurement.num_statements
@@ -0,0 +1,164 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from http import HTTPStatus
+from urllib.parse import quote_plus
+
+import pytest
+from sqlalchemy import create_engine
+
+from backend_app import create_app
+from backend_config.settings import TestConfig
+from backend_src.extensions import db, SHARDED_TABLE_NAMES
+from backend_src.models import WeatherStation, TempHumiditySensor
+from backend_src.sharding import prepare_shards
+# noinspection PyUnresolvedReferences
+from ..utils import client_with_admin_permissions, \
+    datasets_over_several_months_for_two_stations  # required as a fixture
+from ..utils import wait_for_job
+
+SHARD_DATABASE = 'shard_test'
+SHARD_URI = 'postgresql+psycopg2://{}:{}@{}:{}/{}'.format(TestConfig.DB_USER, quote_plus(TestConfig.DB_PASSWORD),
+                                                          TestConfig.DB_URL, TestConfig.DB_PORT, SHARD_DATABASE)
+ALL_DATA_URL = '/api/v1/data?first_timepoint=1900-01-01T00:00&last_timepoint=2100-01-01T00:00'
+
+
+@pytest.fixture
+def a_sharded_client(client_with_admin_permissions):
+    primary_engine = create_engine(TestConfig.SQLALCHEMY_BINDS['weather-data'], isolation_level='AUTOCOMMIT')
+    with primary_engine.connect() as connection:
+        if not connection.execute(db.text('SELECT 1 FROM pg_database WHERE datname = :name'),
+                                  {'name': SHARD_DATABASE}).scalar():
+            connection.execute(db.text('CREATE DATABASE {}'.format(SHARD_DATABASE)))
+    primary_engine.dispose()
+
+    config = TestConfig()
+    config.SHARD_URIS = [SHARD_URI]
+    app = create_app(config)
+    with app.app_context():
+        prepare_shards()
+
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = client_with_admin_permissions.environ_base['HTTP_AUTHORIZATION']
+
+    try:
+        yield client
+    finally:
+        shard_engine = app.extensions['weather_data_shards'][0]
+        shard_tables = [table for table in db.metadatas['weather-data'].sorted_tables
+                        if table.name in SHARDED_TABLE_NAMES]
+        db.metadatas['weather-data'].drop_all(
+            shard_engine, tables=[WeatherStation.__table__, TempHumiditySensor.__table__] + shard_tables)
+        shard_engine.dispose()
+
+
+def _move_station(client, station_id, shard):
+    numeric_station_id = [station['id'] for station in client.get('/api/v1/station').get_json()
+                          if station['station_id'] == station_id][0]
+    move_result = client.put('/api/v1/station/{}/shard'.format(numeric_station_id), json={'shard': shard})
+    assert move_result.status_code == HTTPStatus.ACCEPTED
+    assert wait_for_job(client, move_result.headers['location'])['status'] == 'FINISHED'
+
+
+def _count_datasets(engine, station_id):
+    with engine.connect() as connection:
+        return connection.execute(db.text('SELECT count(*) FROM weather_dataset WHERE station_id = :station_id'),
+                                  {'station_id': station_id}).scalar()
+
+
+@pytest.mark.usefixtures('a_sharded_client', 'datasets_over_several_months_for_two_stations')
+def test_ingest_and_query_sharded_stations(a_sharded_client, datasets_over_several_months_for_two_stations):
+    _move_station(a_sharded_client, 'TES2', 1)
+
+    create_result = a_sharded_client.post('/api/v1/data', json=datasets_over_several_months_for_two_stations)
+    assert create_result.status_code == HTTPStatus.NO_CONTENT
+
+    with a_sharded_client.application.app_context():
+        primary_engine = db.engines['weather-data']
+        shard_engine = a_sharded_client.application.extensions['weather_data_shards'][0]
+        assert _count_datasets(primary_engine, 'TES') == 5
+        assert _count_datasets(primary_engine, 'TES2') == 0
+        assert _count_datasets(shard_engine, 'TES2') == 5
+
+    all_data = a_sharded_client.get(ALL_DATA_URL).get_json()
+    assert len(all_data['TES']['timepoint']) == 5
+    assert len(all_data['TES2']['timepoint']) == 5
+    assert all_data['TES2']['temperature_humidity']['OUT1']['temperature'][0] == -5.0 + 5
+
+    first_page = a_sharded_client.get(ALL_DATA_URL + '&limit=3').get_json()
+    assert [len(first_page['data'][station_id]['timepoint']) for station_id in ['TES', 'TES2']] == [2, 1]
+
+    limits = a_sharded_client.get('/api/v1/data/limits').get_json()
+    assert limits['first_timepoint'] is not None
+    assert set(a_sharded_client.get('/api/v1/data/latest').get_json().keys()) == {'TES', 'TES2'}
+
+    # the watermarks of the shards are not comparable
+    assert a_sharded_client.get('/api/v1/data/changes?since=0:0').status_code == HTTPStatus.BAD_REQUEST
+    assert a_sharded_client.get('/api/v1/data/changes?since=1:0&stations=TES2').status_code == HTTPStatus.OK
+
+    delete_result = a_sharded_client.delete('/api/v1/data', json={'first_timepoint': '1900-01-01T00:00',
+                                                                  'last_timepoint': '2100-01-01T00:00',
+                                                                  'stations': []})
+    assert delete_result.status_code == HTTPStatus.ACCEPTED
+    assert wait_for_job(a_sharded_client, delete_result.headers['location'])['num_deleted_datasets'] == 10
+    assert a_sharded_client.get(ALL_DATA_URL).get_json() == {}
+
+
+@pytest.mark.usefixtures('a_sharded_client', 'datasets_over_several_months_for_two_stations')
+def test_move_station_with_data_between_shards(a_sharded_client, datasets_over_several_months_for_two_stations):
+    create_result = a_sharded_client.post('/api/v1/data', json=datasets_over_several_months_for_two_stations)
+    assert create_result.status_code == HTTPStatus.NO_CONTENT
+    expected_data = a_sharded_client.get(ALL_DATA_URL).get_json()
+    expected_latest_data = a_sharded_client.get('/api/v1/data/latest').get_json()
+
+    _move_station(a_sharded_client, 'TES', 1)
+
+    with a_sharded_client.application.app_context():
+        assert _count_datasets(db.engines['weather-data'], 'TES') == 0
+        assert _count_datasets(a_sharded_client.application.extensions['weather_data_shards'][0], 'TES') == 5
+
+    assert a_sharded_client.get(ALL_DATA_URL).get_json() == expected_data
+    assert a_sharded_client.get('/api/v1/data/latest').get_json() == expected_latest_data
+
+    _move_station(a_sharded_client, 'TES', 0)
+    assert a_sharded_client.get(ALL_DATA_URL).get_json() == expected_data
+
+
+@pytest.mark.usefixtures('a_sharded_client', 'datasets_over_several_months_for_two_stations')
+def test_poll_changes_across_a_move(a_sharded_client, datasets_over_several_months_for_two_stations):
+    a_sharded_client.post('/api/v1/data', json=datasets_over_several_months_for_two_stations[:4])
+    watermark = a_sharded_client.get('/api/v1/data/changes?stations=TES').get_json()['watermark']
+
+    _move_station(a_sharded_client, 'TES', 1)
+    a_sharded_client.post('/api/v1/data', json=datasets_over_several_months_for_two_stations[4:5])
+
+    # the ingest sequences of the shards are unrelated, the client needs to read all data again
+    stale_result = a_sharded_client.get('/api/v1/data/changes?stations=TES&since={}'.format(watermark))
+    assert stale_result.status_code == HTTPStatus.GONE
+    assert 'error' in stale_result.get_json()
+
+    new_watermark = a_sharded_client.get('/api/v1/data/changes?stations=TES').get_json()['watermark']
+    a_sharded_client.post('/api/v1/data', json=[dict(datasets_over_several_months_for_two_stations[4],
+                                                     timepoint='2016-05-01T00:00:00+02:00')])
+    changes_result = a_sharded_client.get('/api/v1/data/changes?stations=TES&since={}'.format(new_watermark))
+    assert changes_result.status_code == HTTPStatus.OK
+    assert changes_result.get_json()['data']['TES']['timepoint'] == ['2016-05-01T00:00:00+02:00']
+
+
+@pytest.mark.usefixtures('a_sharded_client')
+def test_move_station_into_missing_shard(a_sharded_client):
+    move_result = a_sharded_client.put('/api/v1/station/1/shard', json={'shard': 2})
+    assert move_result.status_code == HTTPStatus.BAD_REQUEST
@@ -0,0 +1,87 @@
+#  Remote Weather Access - Client/server solution for distributed weather networks
+#   Copyright (C) 2013-2023 Ralf Rettig (info@personalfme.de)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import time
+from http import HTTPStatus
+
+import pytest
+
+from backend_app import create_app
+from backend_config.settings import TestConfig
+# noinspection PyUnresolvedReferences
+from ..utils import client_with_admin_permissions, a_dataset  # required as a fixture
+
+URL = '/api/v1/data?first_timepoint=2016-02-05T00:00&last_timepoint=2016-02-06T00:00'
+
+
+def _create_client(threshold_in_sec, client_with_admin_permissions):
+    config = TestConfig()
+    config.SLOW_QUERY_THRESHOLD_IN_SEC = threshold_in_sec
+    config.SLOW_QUERY_EXPLAIN_SAMPLE_RATE = 1.0
+    app = create_app(config)
+
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = client_with_admin_permissions.environ_base['HTTP_AUTHORIZATION']
+
+    return client
+
+
+def _wait_for_plans(client, timeout_in_sec=10):
+    start_time = time.time()
+    while True:
+        entries = client.get('/api/v1/slow_query').get_json()
+        select_entries = [entry for entry in entries if entry['statement'].lstrip().upper().startswith('SELECT')]
+        if select_entries and all(entry['plan'] is not None for entry in select_entries):
+            return entries
+
+        assert time.time() - start_time < timeout_in_sec
+        time.sleep(0.05)
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'a_dataset')
+def test_slow_query_log(client_with_admin_permissions, a_dataset):
+    # all statements are slow with this threshold
+    client = _create_client(1e-9, client_with_admin_permissions)
+    client.post('/api/v1/data', json=a_dataset)
+    client.delete('/api/v1/slow_query')
+    assert client.get(URL).status_code == HTTPStatus.OK
+
+    entries = _wait_for_plans(client)
+    assert len(entries) > 0
+    assert all(entry['engine'] == 'weather-data' and entry['duration_in_sec'] > 0 for entry in entries)
+    assert any('weather_dataset' in entry['statement'] for entry in entries)
+    assert any('Execution Time' in entry['plan'] for entry in entries if entry['plan'])
+
+    delete_result = client.delete('/api/v1/slow_query')
+    assert delete_result.status_code == HTTPStatus.NO_CONTENT
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions')
+def test_slow_query_log_is_bounded(client_with_admin_permissions):
+    client = _create_client(1e-9, client_with_admin_permissions)
+    for _ in range(TestConfig.SLOW_QUERY_LOG_SIZE):
+        client.get('/api/v1/station')
+
+    assert len(client.get('/api/v1/slow_query').get_json()) == TestConfig.SLOW_QUERY_LOG_SIZE
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions')
+def test_slow_query_log_without_configuration(client_with_admin_permissions):
+    client = _create_client(0, client_with_admin_permissions)
+    result = client.get('/api/v1/slow_query')
+    assert result.status_code == HTTPStatus.BAD_REQUEST
+    assert 'error' in result.get_json()
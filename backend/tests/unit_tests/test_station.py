@@ -20,8 +20,9 @@ import pytest
 
 # noinspection PyUnresolvedReferences
 from ..utils import client_with_admin_permissions, client_with_push_user_permissions, client_without_permissions, \
-    a_station, another_station, an_updated_station  # required as a fixture
-from ..utils import drop_permissions
+    a_station, another_station, an_updated_station, \
+    datasets_over_several_months_for_two_stations  # required as a fixture
+from ..utils import drop_permissions, wait_for_job
 
 
 @pytest.mark.usefixtures('client_with_admin_permissions', 'a_station')
@@ -225,6 +226,36 @@ def test_delete_a_station(client_with_admin_permissions, a_station):
     assert result.status_code == HTTPStatus.NO_CONTENT
 
 
+@pytest.mark.usefixtures('client_with_admin_permissions', 'datasets_over_several_months_for_two_stations')
+def test_delete_a_station_with_data(client_with_admin_permissions, datasets_over_several_months_for_two_stations):
+    result = client_with_admin_permissions.post('/api/v1/data', json=datasets_over_several_months_for_two_stations)
+    assert result.status_code == HTTPStatus.NO_CONTENT
+
+    result = client_with_admin_permissions.delete('/api/v1/station/1')
+    assert result.status_code == HTTPStatus.ACCEPTED
+
+    job = wait_for_job(client_with_admin_permissions, result.headers['Location'])
+    assert job['status'] == 'FINISHED'
+    assert job['progress_in_percent'] == 100
+    assert job['num_deleted_datasets'] == 5
+
+    station_result = client_with_admin_permissions.get('/api/v1/station')
+    assert [station['station_id'] for station in station_result.get_json()] == ['TES2']
+
+    data_result = client_with_admin_permissions.get('/api/v1/data?first_timepoint=1900-01-01T00:00'
+                                                    '&last_timepoint=2100-01-01T00:00')
+    assert data_result.status_code == HTTPStatus.OK
+    assert list(data_result.get_json().keys()) == ['TES2']
+    assert len(data_result.get_json()['TES2']['timepoint']) == 5
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions')
+def test_get_status_of_a_not_existing_job(client_with_admin_permissions):
+    result = client_with_admin_permissions.get('/api/v1/job/1')
+    assert result.status_code == HTTPStatus.NOT_FOUND
+    assert 'error' in result.get_json()
+
+
 @pytest.mark.usefixtures('client_with_admin_permissions')
 def test_delete_a_not_existing_station(client_with_admin_permissions):
     result = client_with_admin_permissions.delete('/api/v1/station/3')
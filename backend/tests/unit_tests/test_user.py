@@ -440,3 +440,86 @@ def test_login_with_too_long_name(client_without_permissions, a_user):
     result = client_without_permissions.post('/api/v1/login', json=invalid_user)
     assert result.status_code == HTTPStatus.BAD_REQUEST
     assert 'error' in result.get_json()
+
+
+def _login(client, user):
+    login_user = dict(user)
+    drop_registration_details_for_user(login_user)
+    login_result = client.post('/api/v1/login', json=login_user)
+    assert login_result.status_code == HTTPStatus.OK
+    return login_result.get_json()
+
+
+def _refresh(client, refresh_token):
+    return client.post('/api/v1/refresh', headers={'Authorization': 'Bearer {}'.format(refresh_token)})
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'a_user')
+def test_refresh(client_with_admin_permissions, a_user):
+    create_result = client_with_admin_permissions.post('/api/v1/user', json=a_user)
+    assert create_result.status_code == HTTPStatus.CREATED
+    refresh_token = _login(client_with_admin_permissions, a_user)['refresh_token']
+
+    refresh_result = _refresh(client_with_admin_permissions, refresh_token)
+    assert refresh_result.status_code == HTTPStatus.OK
+    assert refresh_result.get_json()['user'] == a_user['name']
+
+    users_result = client_with_admin_permissions.get('/api/v1/user', headers={
+        'Authorization': 'Bearer {}'.format(refresh_result.get_json()['token'])})
+    # the access token is valid, but a push user has no access to the user details
+    assert users_result.status_code == HTTPStatus.FORBIDDEN
+
+    # the refresh token cannot be used for accessing the API
+    users_result = client_with_admin_permissions.get('/api/v1/user', headers={
+        'Authorization': 'Bearer {}'.format(refresh_token)})
+    assert users_result.status_code == HTTPStatus.UNAUTHORIZED
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'a_user')
+def test_refresh_with_revoked_token(client_with_admin_permissions, a_user):
+    create_result = client_with_admin_permissions.post('/api/v1/user', json=a_user)
+    assert create_result.status_code == HTTPStatus.CREATED
+    refresh_token = _login(client_with_admin_permissions, a_user)['refresh_token']
+
+    revoke_result = client_with_admin_permissions.delete('{}/refresh_token'.format(create_result.headers['Location']))
+    assert revoke_result.status_code == HTTPStatus.NO_CONTENT
+
+    refresh_result = _refresh(client_with_admin_permissions, refresh_token)
+    assert refresh_result.status_code == HTTPStatus.UNAUTHORIZED
+    assert 'error' in refresh_result.get_json()
+
+    new_refresh_token = _login(client_with_admin_permissions, a_user)['refresh_token']
+    assert _refresh(client_with_admin_permissions, new_refresh_token).status_code == HTTPStatus.OK
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'a_user')
+def test_refresh_after_recreating_the_user(client_with_admin_permissions, a_user):
+    create_result = client_with_admin_permissions.post('/api/v1/user', json=a_user)
+    assert create_result.status_code == HTTPStatus.CREATED
+    refresh_token = _login(client_with_admin_permissions, a_user)['refresh_token']
+
+    delete_result = client_with_admin_permissions.delete(create_result.headers['Location'])
+    assert delete_result.status_code == HTTPStatus.NO_CONTENT
+    recreate_result = client_with_admin_permissions.post('/api/v1/user', json=a_user)
+    assert recreate_result.status_code == HTTPStatus.CREATED
+
+    assert _refresh(client_with_admin_permissions, refresh_token).status_code == HTTPStatus.UNAUTHORIZED
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'a_user', 'an_updated_user')
+def test_refresh_after_password_change(client_with_admin_permissions, a_user, an_updated_user):
+    create_result = client_with_admin_permissions.post('/api/v1/user', json=a_user)
+    assert create_result.status_code == HTTPStatus.CREATED
+    refresh_token = _login(client_with_admin_permissions, a_user)['refresh_token']
+
+    update_result = client_with_admin_permissions.put(create_result.headers['Location'], json=an_updated_user)
+    assert update_result.status_code == HTTPStatus.NO_CONTENT
+
+    assert _refresh(client_with_admin_permissions, refresh_token).status_code == HTTPStatus.UNAUTHORIZED
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions')
+def test_refresh_with_access_token(client_with_admin_permissions):
+    access_token = client_with_admin_permissions.environ_base['HTTP_AUTHORIZATION'].split(' ')[1]
+    result = _refresh(client_with_admin_permissions, access_token)
+    assert result.status_code == HTTPStatus.UNAUTHORIZED
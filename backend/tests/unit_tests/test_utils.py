@@ -14,9 +14,17 @@
 #   You should have received a copy of the GNU Affero General Public License
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import threading
+import time
+from types import SimpleNamespace
+
 import pytest
+import pytz
+
+from backend_src import utils
+from backend_src.utils import calc_dewpoint, LocalTimeZone
 
-from backend_src.utils import calc_dewpoint
+NUM_CONCURRENT_REQUESTS = 8
 
 
 def test_calc_dew_point():
@@ -39,3 +47,37 @@ def test_calc_dew_point_if_input_is_none():
     assert dew_points[0] is None
     assert dew_points[1] is None
     assert dew_points[2] is None
+
+
+def test_concurrent_first_calls_of_local_time_zone(monkeypatch):
+    monkeypatch.setattr(LocalTimeZone, '_instance', None)
+
+    # widens the window between creating the singleton and setting its time zone
+    timezone = pytz.timezone
+
+    def slow_timezone(zone):
+        time.sleep(0.01)
+        return timezone(zone)
+
+    monkeypatch.setattr(utils.pytz, 'timezone', slow_timezone)
+
+    app = SimpleNamespace(config={'TIMEZONE': 'Europe/Berlin'})
+    barrier = threading.Barrier(NUM_CONCURRENT_REQUESTS)
+    local_time_zones = []
+    errors = []
+
+    def get_local_time_zone():
+        barrier.wait()
+        try:
+            local_time_zones.append(LocalTimeZone.get(app).get_local_time_zone())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=get_local_time_zone) for _ in range(NUM_CONCURRENT_REQUESTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert local_time_zones == [pytz.timezone('Europe/Berlin')] * NUM_CONCURRENT_REQUESTS
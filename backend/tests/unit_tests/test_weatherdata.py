@@ -20,12 +20,14 @@ import pytest
 import pytz
 from dateutil.parser import isoparse
 
+from backend_src.weatherdata import query
 # noinspection PyUnresolvedReferences
 from ..utils import client_without_permissions, client_with_push_user_permissions, client_with_admin_permissions, \
     a_dataset, another_dataset, another_dataset_without_timezone, an_updated_dataset, a_dataset_for_another_station, \
     prepare_two_entry_database, a_dataset_with_none, a_dataset_with_a_duplicate_time_point, \
-    a_dataset_with_rain_counter_reset, a_dataset_with_missing_outside_sensor_data  # required as a fixture
-from ..utils import drop_permissions, verify_database_is_empty, zip_payload
+    a_dataset_with_rain_counter_reset, a_dataset_with_missing_outside_sensor_data, \
+    datasets_over_several_months_for_two_stations  # required as a fixture
+from ..utils import drop_permissions, verify_database_is_empty, zip_payload, wait_for_job
 
 
 @pytest.mark.usefixtures('client_with_push_user_permissions', 'a_dataset')
@@ -193,6 +195,37 @@ def test_delete_dataset_for_all_stations(client_with_admin_permissions, a_datase
     verify_database_is_empty(client_with_admin_permissions)
 
 
+@pytest.mark.usefixtures('client_with_admin_permissions', 'datasets_over_several_months_for_two_stations')
+def test_delete_dataset_over_several_months(client_with_admin_permissions,
+                                            datasets_over_several_months_for_two_stations):
+    create_result = client_with_admin_permissions.post('/api/v1/data',
+                                                       json=datasets_over_several_months_for_two_stations)
+    assert create_result.status_code == HTTPStatus.NO_CONTENT
+    delete_payload = {
+        'first_timepoint': '2016-02-01T00:00',
+        'last_timepoint': '2016-04-30T23:50',
+        'stations': ['TES']
+    }
+
+    delete_result = client_with_admin_permissions.delete('/api/v1/data', json=delete_payload)
+    assert delete_result.status_code == HTTPStatus.ACCEPTED
+
+    job = wait_for_job(client_with_admin_permissions, delete_result.headers['Location'])
+    assert job['status'] == 'FINISHED'
+    assert job['progress_in_percent'] == 100
+    assert job['num_deleted_datasets'] == 3
+
+    search_result = client_with_admin_permissions.get('/api/v1/data?first_timepoint=1900-01-01T00:00'
+                                                      '&last_timepoint=2100-01-01T00:00')
+    assert search_result.status_code == HTTPStatus.OK
+    assert [isoparse(timepoint) for timepoint in search_result.get_json()['TES']['timepoint']] == \
+           [isoparse('2016-01-31T23:50:00+01:00'), isoparse('2016-04-30T23:50:00+02:00')]
+    assert len(search_result.get_json()['TES2']['timepoint']) == 5
+
+    latest_result = client_with_admin_permissions.get('/api/v1/data/latest')
+    assert isoparse(latest_result.get_json()['TES']['timepoint']) == isoparse('2016-04-30T23:50:00+02:00')
+
+
 @pytest.mark.usefixtures('client_with_admin_permissions')
 def test_delete_not_existing_dataset(client_with_admin_permissions):
     delete_payload = {
@@ -286,6 +319,52 @@ def test_update_dataset_with_temp_humidity_sensor_mismatch(client_with_push_user
     assert update_result.status_code == HTTPStatus.NOT_FOUND
 
 
+@pytest.mark.usefixtures('client_with_push_user_permissions', 'a_dataset', 'another_dataset', 'an_updated_dataset')
+def test_update_many_datasets(client_with_push_user_permissions, a_dataset, another_dataset, an_updated_dataset):
+    create_result = client_with_push_user_permissions.post('/api/v1/data', json=a_dataset)
+    assert create_result.status_code == HTTPStatus.NO_CONTENT
+
+    updated_dataset = dict(an_updated_dataset)
+    updated_dataset['pressure'] = None
+    updated_dataset['temperature_humidity'] = an_updated_dataset['temperature_humidity'] + [{
+        'sensor_id': 'OUT1',
+        'temperature': 5.2,
+        'humidity': 60.0
+    }]
+    update_result = client_with_push_user_permissions.put('/api/v1/data/batch',
+                                                          json=[updated_dataset, another_dataset[0]])
+    assert update_result.status_code == HTTPStatus.OK
+    assert update_result.get_json()['num_updated_datasets'] == 1
+
+    not_found = update_result.get_json()['not_found']
+    assert len(not_found) == 2
+    assert isoparse(not_found[0]['timepoint']) == isoparse(another_dataset[0]['timepoint'])
+    assert 'sensor_id' not in not_found[0]
+    assert isoparse(not_found[1]['timepoint']) == isoparse(updated_dataset['timepoint'])
+    assert not_found[1]['sensor_id'] == 'OUT1'
+
+    timepoint = isoparse(a_dataset[0]['timepoint'])
+    search_result = client_with_push_user_permissions.get(_get_request_url(timepoint, timepoint))
+    assert search_result.status_code == HTTPStatus.OK
+    station_data = search_result.get_json()['TES']
+    assert station_data['pressure'][0] is None
+    assert station_data['uv'][0] == an_updated_dataset['uv']
+    assert station_data['temperature_humidity']['IN']['temperature'][0] == \
+           an_updated_dataset['temperature_humidity'][0]['temperature']
+
+
+@pytest.mark.usefixtures('client_with_push_user_permissions', 'a_dataset', 'a_dataset_for_another_station')
+def test_update_many_datasets_without_required_permissions_for_station(client_with_push_user_permissions,
+                                                                       a_dataset, a_dataset_for_another_station):
+    create_result = client_with_push_user_permissions.post('/api/v1/data', json=a_dataset)
+    assert create_result.status_code == HTTPStatus.NO_CONTENT
+
+    update_result = client_with_push_user_permissions.put('/api/v1/data/batch',
+                                                          json=a_dataset + a_dataset_for_another_station)
+    assert 'error' in update_result.get_json()
+    assert update_result.status_code == HTTPStatus.FORBIDDEN
+
+
 @pytest.mark.usefixtures('client_with_push_user_permissions', 'a_dataset')
 def test_update_dataset_with_invalid_body(client_with_push_user_permissions, a_dataset):
     invalid_dataset = list(a_dataset)
@@ -430,6 +509,206 @@ def test_get_weather_datasets_all(client_with_push_user_permissions, a_dataset,
     assert another_dataset[0]['pressure'] == search_result.get_json()[a_station_id]['pressure'][1]
 
 
+@pytest.mark.usefixtures('client_with_admin_permissions', 'datasets_over_several_months_for_two_stations')
+def test_get_weather_datasets_over_several_months_for_two_stations(client_with_admin_permissions,
+                                                                   datasets_over_several_months_for_two_stations):
+    create_result = client_with_admin_permissions.post('/api/v1/data',
+                                                       json=datasets_over_several_months_for_two_stations)
+    assert create_result.status_code == HTTPStatus.NO_CONTENT
+    client = drop_permissions(client_with_admin_permissions)
+
+    search_result = client.get(_get_request_url(isoparse('1900-01-01T00:00'), isoparse('2100-01-01T00:00')))
+    assert search_result.status_code == HTTPStatus.OK
+
+    for station_id in ['TES', 'TES2']:
+        expected_datasets = [dataset for dataset in datasets_over_several_months_for_two_stations
+                             if dataset['station_id'] == station_id]
+        got_data = search_result.get_json()[station_id]
+        assert [isoparse(timepoint) for timepoint in got_data['timepoint']] == \
+               [isoparse(dataset['timepoint']) for dataset in expected_datasets]
+        assert got_data['pressure'] == [dataset['pressure'] for dataset in expected_datasets]
+        assert got_data['temperature_humidity']['OUT1']['temperature'] == \
+               [dataset['temperature_humidity'][1]['temperature'] for dataset in expected_datasets]
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'datasets_over_several_months_for_two_stations')
+def test_get_weather_datasets_with_cursor(client_with_admin_permissions, datasets_over_several_months_for_two_stations):
+    create_result = client_with_admin_permissions.post('/api/v1/data',
+                                                       json=datasets_over_several_months_for_two_stations)
+    assert create_result.status_code == HTTPStatus.NO_CONTENT
+    client = drop_permissions(client_with_admin_permissions)
+
+    url = _get_request_url(isoparse('1900-01-01T00:00'), isoparse('2100-01-01T00:00')) + '&limit=3'
+    got_keys = []
+    num_pages = 0
+    next_cursor = None
+    while True:
+        page_url = url if not next_cursor else url + '&cursor={}'.format(next_cursor)
+        search_result = client.get(page_url)
+        assert search_result.status_code == HTTPStatus.OK
+
+        num_pages += 1
+        page_keys = []
+        for station_id, station_data in search_result.get_json()['data'].items():
+            assert len(station_data['temperature_humidity']['OUT1']['temperature']) == len(station_data['timepoint'])
+            page_keys += [(isoparse(timepoint), station_id) for timepoint in station_data['timepoint']]
+        assert len(page_keys) <= 3
+        got_keys += sorted(page_keys)
+
+        next_cursor = search_result.get_json()['next_cursor']
+        if not next_cursor:
+            break
+
+    expected_keys = sorted((isoparse(dataset['timepoint']), dataset['station_id'])
+                           for dataset in datasets_over_several_months_for_two_stations)
+    assert got_keys == expected_keys
+    assert num_pages == 4
+
+
+@pytest.mark.usefixtures('client_without_permissions')
+def test_get_weather_datasets_with_invalid_cursor(client_without_permissions):
+    url = _get_request_url(isoparse('1900-01-01T00:00'), isoparse('2100-01-01T00:00'))
+    search_result = client_without_permissions.get(url + '&limit=3&cursor=invalid')
+    assert 'error' in search_result.get_json()
+    assert search_result.status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.usefixtures('client_without_permissions')
+def test_get_weather_datasets_with_cursor_but_without_limit(client_without_permissions):
+    url = _get_request_url(isoparse('1900-01-01T00:00'), isoparse('2100-01-01T00:00'))
+    search_result = client_without_permissions.get(url + '&cursor=eyJ9')
+    assert 'error' in search_result.get_json()
+    assert search_result.status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.usefixtures('client_with_push_user_permissions', 'a_dataset', 'another_dataset')
+def test_get_latest_weather_datasets(client_with_push_user_permissions, a_dataset, another_dataset):
+    client_with_push_user_permissions.post('/api/v1/data', json=another_dataset)
+    client_with_push_user_permissions.post('/api/v1/data', json=a_dataset)  # an older dataset sent later
+    client = drop_permissions(client_with_push_user_permissions)
+
+    result = client.get('/api/v1/data/latest?stations=TES')
+    assert result.status_code == HTTPStatus.OK
+
+    latest_dataset = result.get_json()['TES']
+    assert isoparse(latest_dataset['timepoint']) == isoparse(another_dataset[0]['timepoint'])
+    assert latest_dataset['pressure'] == another_dataset[0]['pressure']
+    assert latest_dataset['temperature_humidity']['IN']['temperature'] == \
+           another_dataset[0]['temperature_humidity'][0]['temperature']
+    assert latest_dataset['temperature_humidity']['IN']['dewpoint'] == 13.4
+    assert 'TES2' not in result.get_json()
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'a_dataset', 'another_dataset')
+def test_get_latest_weather_datasets_after_delete(client_with_admin_permissions, a_dataset, another_dataset):
+    client_with_admin_permissions.post('/api/v1/data', json=a_dataset)
+    client_with_admin_permissions.post('/api/v1/data', json=another_dataset)
+    delete_payload = {
+        'first_timepoint': '2016-02-06T00:00',
+        'last_timepoint': '2016-02-07T00:00',
+        'stations': ['TES']
+    }
+    delete_result = client_with_admin_permissions.delete('/api/v1/data', json=delete_payload)
+    assert delete_result.status_code == HTTPStatus.NO_CONTENT
+
+    result = client_with_admin_permissions.get('/api/v1/data/latest')
+    assert result.status_code == HTTPStatus.OK
+    assert isoparse(result.get_json()['TES']['timepoint']) == isoparse(a_dataset[0]['timepoint'])
+
+
+@pytest.mark.usefixtures('client_without_permissions')
+def test_get_latest_weather_datasets_for_not_existing_station(client_without_permissions):
+    result = client_without_permissions.get('/api/v1/data/latest?stations=TES3')
+    assert 'error' in result.get_json()
+    assert result.status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.usefixtures('client_with_push_user_permissions', 'a_dataset', 'another_dataset')
+def test_get_changed_weather_datasets(client_with_push_user_permissions, a_dataset, another_dataset):
+    initial_result = client_with_push_user_permissions.get('/api/v1/data/changes')
+    assert initial_result.status_code == HTTPStatus.OK
+    assert initial_result.get_json()['data'] == {}
+    initial_watermark = initial_result.get_json()['watermark']
+
+    create_result = client_with_push_user_permissions.post('/api/v1/data', json=a_dataset)
+    assert create_result.status_code == HTTPStatus.NO_CONTENT
+
+    changes_result = client_with_push_user_permissions.get('/api/v1/data/changes?since={}'.format(initial_watermark))
+    assert changes_result.status_code == HTTPStatus.OK
+    a_station_id = a_dataset[0]['station_id']
+    assert changes_result.get_json()['data'][a_station_id]['timepoint'] == [a_dataset[0]['timepoint']]
+    assert changes_result.get_json()['data'][a_station_id]['pressure'] == [a_dataset[0]['pressure']]
+    watermark = changes_result.get_json()['watermark']
+    assert watermark != initial_watermark
+
+    create_result = client_with_push_user_permissions.post('/api/v1/data', json=another_dataset)
+    assert create_result.status_code == HTTPStatus.NO_CONTENT
+
+    changes_result = client_with_push_user_permissions.get('/api/v1/data/changes?since={}&sensors=pressure'
+                                                           .format(watermark))
+    assert changes_result.status_code == HTTPStatus.OK
+    got_data = changes_result.get_json()['data'][a_station_id]
+    assert [isoparse(timepoint) for timepoint in got_data['timepoint']] == [isoparse(another_dataset[0]['timepoint'])]
+    assert got_data['pressure'] == [another_dataset[0]['pressure']]
+    assert 'temperature_humidity' not in got_data
+
+    no_changes_result = client_with_push_user_permissions.get('/api/v1/data/changes?since={}'
+                                                              .format(changes_result.get_json()['watermark']))
+    assert no_changes_result.status_code == HTTPStatus.OK
+    assert no_changes_result.get_json()['data'] == {}
+
+
+@pytest.mark.usefixtures('client_with_push_user_permissions', 'a_dataset', 'an_updated_dataset')
+def test_get_changed_weather_datasets_after_update(client_with_push_user_permissions, a_dataset, an_updated_dataset):
+    create_result = client_with_push_user_permissions.post('/api/v1/data', json=a_dataset)
+    assert create_result.status_code == HTTPStatus.NO_CONTENT
+    watermark = client_with_push_user_permissions.get('/api/v1/data/changes').get_json()['watermark']
+
+    update_result = client_with_push_user_permissions.put('/api/v1/data', json=an_updated_dataset)
+    assert update_result.status_code == HTTPStatus.NO_CONTENT
+
+    changes_result = client_with_push_user_permissions.get('/api/v1/data/changes?since={}'.format(watermark))
+    assert changes_result.status_code == HTTPStatus.OK
+    got_data = changes_result.get_json()['data'][an_updated_dataset['station_id']]
+    assert got_data['pressure'] == [an_updated_dataset['pressure']]
+    assert got_data['temperature_humidity']['IN']['temperature'] == \
+           [an_updated_dataset['temperature_humidity'][0]['temperature']]
+
+
+@pytest.mark.usefixtures('client_without_permissions')
+def test_get_changed_weather_datasets_with_invalid_watermark(client_without_permissions):
+    result = client_without_permissions.get('/api/v1/data/changes?since=-1')
+    assert 'error' in result.get_json()
+    assert result.status_code == HTTPStatus.BAD_REQUEST
+
+    result = client_without_permissions.get('/api/v1/data/changes?since=12')
+    assert 'error' in result.get_json()
+    assert result.status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.usefixtures('client_with_admin_permissions', 'datasets_over_several_months_for_two_stations')
+def test_get_weather_datasets_of_a_short_time_period_with_a_single_statement(
+        client_with_admin_permissions, datasets_over_several_months_for_two_stations, mocker):
+    client_with_admin_permissions.post('/api/v1/data', json=datasets_over_several_months_for_two_stations)
+    time_period_spy = mocker.spy(query, 'get_available_time_period')
+    work_unit_spy = mocker.spy(query, 'split_into_work_units')
+
+    # the time period is crossing a month boundary
+    search_result = client_with_admin_permissions.get(_get_request_url(isoparse('2016-01-31T00:00'),
+                                                                       isoparse('2016-02-02T00:00')))
+    assert search_result.status_code == HTTPStatus.OK
+    assert len(search_result.get_json()['TES']['timepoint']) == 2
+    assert len(search_result.get_json()['TES2']['timepoint']) == 2
+    assert time_period_spy.call_count == 0
+    assert work_unit_spy.call_count == 0
+
+    search_result = client_with_admin_permissions.get(_get_request_url(isoparse('1900-01-01T00:00'),
+                                                                       isoparse('2100-01-01T00:00')))
+    assert len(search_result.get_json()['TES']['timepoint']) == 5
+    assert time_period_spy.call_count == 1
+    assert len(work_unit_spy.spy_return) == 2 * 4
+
+
 @pytest.mark.usefixtures('client_with_push_user_permissions', 'a_dataset_with_rain_counter_reset')
 def test_get_weather_datasets_with_rain_sensor_reset_inbetween(client_with_push_user_permissions,
                                                                a_dataset_with_rain_counter_reset):
@@ -460,6 +739,18 @@ def test_get_dew_point(client_with_push_user_permissions, a_dataset, another_dat
     assert 13.4 == search_result.get_json()[a_station_id]['temperature_humidity']['IN']['dewpoint'][1]
 
 
+@pytest.mark.usefixtures('client_with_push_user_permissions', 'a_dataset', 'another_dataset')
+def test_get_weather_datasets_without_temp_humidity_data(client_with_push_user_permissions, a_dataset,
+                                                         another_dataset):
+    a_station_id, client = prepare_two_entry_database(a_dataset, another_dataset, client_with_push_user_permissions)
+    search_result = client.get(_get_request_url(isoparse('1900-01-01T00:00+02:00'),
+                                                isoparse('2100-01-01T00:00+02:00'), sensors=['pressure']))
+    assert search_result.status_code == HTTPStatus.OK
+    assert set(search_result.get_json()[a_station_id].keys()) == {'timepoint', 'pressure'}
+    assert search_result.get_json()[a_station_id]['pressure'] == [a_dataset[0]['pressure'],
+                                                                  another_dataset[0]['pressure']]
+
+
 @pytest.mark.usefixtures('client_with_push_user_permissions', 'a_dataset', 'another_dataset')
 def test_get_weather_datasets_none(client_with_push_user_permissions, a_dataset, another_dataset):
     _, client = prepare_two_entry_database(a_dataset, another_dataset, client_with_push_user_permissions)
@@ -17,14 +17,19 @@
 import gzip
 import json
 import logging
+import os
+import time
+import tracemalloc
+from dataclasses import dataclass
 from datetime import datetime
 from http import HTTPStatus
 from io import BytesIO
 from json import JSONEncoder
-from typing import List, Dict
+from typing import List, Dict, Callable
 
 import pytest
 from flask_jwt_extended import create_access_token
+from sqlalchemy import event
 
 from backend_app import create_app
 from backend_config.settings import TestConfig
@@ -32,6 +37,8 @@ from backend_src.extensions import db
 from backend_src.models import WeatherStation, create_temp_humidity_sensors, create_sensors
 from backend_src.utils import Role
 
+REQUEST_BUDGETS_PATH = os.path.join(os.path.dirname(__file__), 'unit_tests', 'request_budgets.json')
+
 
 @pytest.fixture
 def a_dataset() -> List[Dict]:
@@ -339,6 +346,39 @@ def a_dataset_with_missing_outside_sensor_data() -> List[Dict]:
     }]
 
 
+@pytest.fixture
+def datasets_over_several_months_for_two_stations() -> List[Dict]:
+    datasets = []
+    for station_id, offset in [('TES', 0.0), ('TES2', 5.0)]:
+        for timepoint in ['2016-01-31T23:50:00+01:00', '2016-02-01T00:00:00+01:00', '2016-02-15T12:00:00+01:00',
+                          '2016-03-01T00:10:00+01:00', '2016-04-30T23:50:00+02:00']:
+            datasets.append({
+                'timepoint': timepoint,
+                'station_id': station_id,
+                'pressure': 1000.0 + offset + len(datasets),
+                'uv': 2.4,
+                'rain_counter': 980.5 + len(datasets),
+                'direction': 350.2,
+                'speed': 95.2,
+                'wind_temperature': 9.8,
+                'gusts': 120.5,
+                'temperature_humidity': [
+                    {
+                        'sensor_id': 'IN',
+                        'temperature': 20.0 + offset + len(datasets),
+                        'humidity': 53.0
+                    },
+                    {
+                        'sensor_id': 'OUT1',
+                        'temperature': -10.0 + offset + len(datasets),
+                        'humidity': 73.0
+                    }
+                ]
+            })
+
+    yield datasets
+
+
 @pytest.fixture
 def a_user() -> dict:
     yield {
@@ -519,6 +559,18 @@ def verify_database_is_empty(client_with_admin_permissions):
     assert not check_result.get_json()['last_timepoint']
 
 
+def wait_for_job(client_with_admin_permissions, job_location, timeout_in_sec=30):
+    start_time = time.time()
+    while True:
+        job_result = client_with_admin_permissions.get(job_location)
+        assert job_result.status_code == HTTPStatus.OK
+        if job_result.get_json()['status'] != 'RUNNING':
+            return job_result.get_json()
+
+        assert time.time() - start_time < timeout_in_sec
+        time.sleep(0.05)
+
+
 class IsoDateTimeJSONEncoder(JSONEncoder):
     def default(self, o):
         if isinstance(o, datetime):
@@ -546,3 +598,71 @@ def prepare_two_entry_database(first_dataset, second_dataset, client_with_push_u
     client = drop_permissions(client_with_push_user_permissions)
 
     return a_station_id, client
+
+
+@dataclass
+class RequestMeasurement:
+    response: object
+    num_statements: int
+    peak_allocation_in_bytes: int
+
+
+def measure_request(client, send_request: Callable) -> RequestMeasurement:
+    """
+    Counts the SQL statements on all databases of the app and the peak of the Python allocations during the request
+    """
+    app = client.application
+    with app.app_context():
+        engines = list(db.engines.values())
+    engines += [replica.engine for replica in app.extensions['read_replicas'].replicas]
+    engines += app.extensions['weather_data_shards']
+
+    num_statements = 0
+
+    def count_statement(*_):
+        nonlocal num_statements
+        num_statements += 1
+
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', count_statement)
+    is_tracing = tracemalloc.is_tracing()
+    if not is_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    start_allocation, _ = tracemalloc.get_traced_memory()
+    try:
+        response = send_request()
+        _, peak_allocation = tracemalloc.get_traced_memory()
+    finally:
+        if not is_tracing:
+            tracemalloc.stop()
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', count_statement)
+
+    return RequestMeasurement(response, num_statements, peak_allocation - start_allocation)
+
+
+@pytest.fixture
+def request_budgets() -> Dict[str, Dict]:
+    with open(REQUEST_BUDGETS_PATH) as budgets_file:
+        yield json.load(budgets_file)
+
+
+@pytest.fixture
+def verify_request_budget(request_budgets):
+    """
+    Sends a request and fails if it exceeds the committed budget of SQL statements or the peak of the allocations
+    """
+
+    def verify(budget_name: str, client, send_request: Callable):
+        budget = request_budgets[budget_name]
+        measurement = measure_request(client, send_request)
+        assert measurement.num_statements <= budget['max_statements'], \
+            '{} required {} SQL statements (budget {})'.format(budget_name, measurement.num_statements,
+                                                               budget['max_statements'])
+        assert measurement.peak_allocation_in_bytes <= budget['max_peak_allocation_in_bytes'], \
+            '{} allocated up to {} bytes (budget {})'.format(budget_name, measurement.peak_allocation_in_bytes,
+                                                             budget['max_peak_allocation_in_bytes'])
+        return measurement.response
+
+    yield verify
@@ -17,6 +17,7 @@ import gzip
 import json
 import logging
 import os
+import random
 import time
 from datetime import datetime
 from io import BytesIO
@@ -25,6 +26,12 @@ import requests
 
 from .utils import IsoDateTimeJSONEncoder
 
+# the upload is retried if the backend is overloaded, the whole waiting time stays well below the read period
+MAX_NUM_UPLOAD_ATTEMPTS = 4
+MAX_RETRY_WAIT_IN_SEC = 60
+# used if the backend does not propose a waiting time
+DEFAULT_RETRY_WAIT_IN_SEC = 5
+
 
 class ServerProxy(object):
     def __init__(self, config):
@@ -46,6 +53,7 @@ class ServerProxy(object):
         self._server_write_timeout_in_s = 60 * config['timeouts_in_min']['server_write_timeout']
 
         self._token = None
+        self._refresh_token = None
         self._last_login_time = datetime.min
 
     def send_data(self, json_data, station_id: str):
@@ -53,14 +61,24 @@ class ServerProxy(object):
         first_date, last_date = self._get_first_and_last_date(json_data)
 
         if len(json_data) > 0:
-            jwt_token = self._perform_login()
             zipped_json = self._zip_payload(json_data)
-            start_time = time.time()
-            r = requests.post('{}://{}:{}/api/v1/data'.format(self._protocol, self.url, self.port),
-                              data=zipped_json,
-                              headers=self._get_headers(jwt_token),
-                              timeout=self._get_timeouts())
-            end_time = time.time()
+            for attempt in range(MAX_NUM_UPLOAD_ATTEMPTS):
+                # the login might have expired while waiting
+                jwt_token = self._perform_login()
+                start_time = time.time()
+                r = requests.post('{}://{}:{}/api/v1/data'.format(self._protocol, self.url, self.port),
+                                  data=zipped_json,
+                                  headers=self._get_headers(jwt_token),
+                                  timeout=self._get_timeouts())
+                end_time = time.time()
+                if r.status_code != requests.codes.service_unavailable or attempt == MAX_NUM_UPLOAD_ATTEMPTS - 1:
+                    break
+
+                retry_wait_in_sec = self._get_retry_wait_in_sec(r)
+                logging.warning(f'The backend is overloaded, retrying the upload for station {station_id} in '
+                                f'{retry_wait_in_sec:.1f} s')
+                time.sleep(retry_wait_in_sec)
+
             r.raise_for_status()
             logging.debug(f'Upload for station {station_id} in time period {first_date} - {last_date} '
                           f'took {(end_time - start_time) * 1000} ms, status code {r.status_code}')
@@ -76,6 +94,17 @@ class ServerProxy(object):
 
         return first_date, last_date
 
+    @staticmethod
+    def _get_retry_wait_in_sec(response):
+        try:
+            retry_wait_in_sec = float(response.headers.get('Retry-After', DEFAULT_RETRY_WAIT_IN_SEC))
+        except ValueError:
+            # the header can also contain a date
+            retry_wait_in_sec = DEFAULT_RETRY_WAIT_IN_SEC
+
+        # the jitter is spreading the retries of the stations rejected at the same time
+        return min(retry_wait_in_sec, MAX_RETRY_WAIT_IN_SEC) * random.uniform(1.0, 1.5)
+
     @staticmethod
     def _get_headers(jwt_token=None):
         headers = {
@@ -99,17 +128,37 @@ class ServerProxy(object):
 
     def _perform_login(self):
         if (datetime.utcnow() - self._last_login_time).total_seconds() > self._relogin_time_in_sec:
-            logging.debug('Logging into the backend')
-            r = requests.post('{}://{}:{}/api/v1/login'.format(self._protocol, self.url, self.port),
-                              json={'name': self._user_name, 'password': self._password},
-                              headers=self._get_headers(),
-                              timeout=self._get_timeouts())
-            r.raise_for_status()
-            self._token = r.json()['token']
+            # the refresh is much cheaper for the backend than checking the password
+            if not self._refresh_token or not self._refresh_login():
+                self._password_login()
             self._last_login_time = datetime.utcnow()
-            return self._token
-        else:
-            return self._token
+
+        return self._token
+
+    def _password_login(self):
+        logging.debug('Logging into the backend')
+        r = requests.post('{}://{}:{}/api/v1/login'.format(self._protocol, self.url, self.port),
+                          json={'name': self._user_name, 'password': self._password},
+                          headers=self._get_headers(),
+                          timeout=self._get_timeouts())
+        r.raise_for_status()
+        self._token = r.json()['token']
+        # older backends are not issuing refresh tokens
+        self._refresh_token = r.json().get('refresh_token')
+
+    def _refresh_login(self) -> bool:
+        logging.debug('Refreshing the login to the backend')
+        r = requests.post('{}://{}:{}/api/v1/refresh'.format(self._protocol, self.url, self.port),
+                          headers=self._get_headers(self._refresh_token),
+                          timeout=self._get_timeouts())
+        if r.status_code == requests.codes.unauthorized:
+            logging.debug('The refresh token has expired or has been revoked')
+            self._refresh_token = None
+            return False
+
+        r.raise_for_status()
+        self._token = r.json()['token']
+        return True
 
     def _get_timeouts(self):
         return self._server_connect_timeout_in_s, self._server_write_timeout_in_s
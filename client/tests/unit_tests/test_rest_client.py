@@ -23,12 +23,14 @@ import pytest
 import requests
 import requests_mock
 
-from client_src.rest_client import ServerProxy
+from client_src.rest_client import ServerProxy, MAX_NUM_UPLOAD_ATTEMPTS
 from client_src.utils import IsoDateTimeJSONDecoder
 from .common import CONNECT_TIMEOUT_IN_MIN, WRITE_TIMEOUT_IN_MIN, CONFIG
 from ..common import USER_NAME, URL, PORT, PASSWORD, TOKEN, LOGIN_RESPONSE
 
 STATION_ID = 'TES'
+REFRESH_TOKEN = 'a_refresh_token'
+REFRESHED_TOKEN = 'a_refreshed_token'
 
 JSON_DATA = [
     {
@@ -148,3 +150,69 @@ def test_send_data_with_connection_error_on_data_post(client_env_variables):
 
         assert login_post.called_once
         assert data_post.called_once
+
+
+def test_send_data_with_refresh_of_login(client_env_variables):
+    with requests_mock.Mocker() as m:
+        login_post = m.post('https://{}:{}/api/v1/login'.format(URL, PORT),
+                            json=dict(LOGIN_RESPONSE, refresh_token=REFRESH_TOKEN))
+        refresh_post = m.post('https://{}:{}/api/v1/refresh'.format(URL, PORT), json={'token': REFRESHED_TOKEN})
+        data_post = m.post('https://{}:{}/api/v1/data'.format(URL, PORT))
+
+        config = dict(CONFIG)
+        config['relogin_time_in_sec'] = -1
+
+        proxy = ServerProxy(config)
+        proxy.send_data(JSON_DATA, STATION_ID)
+        proxy.send_data(JSON_DATA, STATION_ID)  # requires a new login, the password is not sent again
+
+        assert login_post.call_count == 1
+        assert refresh_post.call_count == 1
+        assert refresh_post.last_request.headers['Authorization'] == f'Bearer {REFRESH_TOKEN}'
+        assert data_post.last_request.headers['Authorization'] == f'Bearer {REFRESHED_TOKEN}'
+
+
+def test_send_data_with_revoked_refresh_token(client_env_variables):
+    with requests_mock.Mocker() as m:
+        login_post = m.post('https://{}:{}/api/v1/login'.format(URL, PORT),
+                            json=dict(LOGIN_RESPONSE, refresh_token=REFRESH_TOKEN))
+        refresh_post = m.post('https://{}:{}/api/v1/refresh'.format(URL, PORT), status_code=401)
+        data_post = m.post('https://{}:{}/api/v1/data'.format(URL, PORT))
+
+        config = dict(CONFIG)
+        config['relogin_time_in_sec'] = -1
+
+        proxy = ServerProxy(config)
+        proxy.send_data(JSON_DATA, STATION_ID)
+        proxy.send_data(JSON_DATA, STATION_ID)  # falls back to the login with the password
+
+        assert login_post.call_count == 2
+        assert refresh_post.call_count == 1
+        assert data_post.last_request.headers['Authorization'] == f'Bearer {TOKEN}'
+
+
+def test_send_data_with_overloaded_backend(client_env_variables):
+    with requests_mock.Mocker() as m, mock.patch('client_src.rest_client.time.sleep') as sleep_mock:
+        m.post('https://{}:{}/api/v1/login'.format(URL, PORT), json=LOGIN_RESPONSE)
+        data_post = m.post('https://{}:{}/api/v1/data'.format(URL, PORT),
+                           [{'status_code': 503, 'headers': {'Retry-After': '30'}}, {'status_code': 204}])
+
+        proxy = ServerProxy(CONFIG)
+        proxy.send_data(JSON_DATA, STATION_ID)
+
+        assert data_post.call_count == 2
+        assert sleep_mock.call_count == 1
+        assert 30 <= sleep_mock.call_args[0][0] <= 45
+
+
+def test_send_data_with_permanently_overloaded_backend(client_env_variables):
+    with requests_mock.Mocker() as m, mock.patch('client_src.rest_client.time.sleep') as sleep_mock:
+        m.post('https://{}:{}/api/v1/login'.format(URL, PORT), json=LOGIN_RESPONSE)
+        data_post = m.post('https://{}:{}/api/v1/data'.format(URL, PORT), status_code=503)
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            proxy = ServerProxy(CONFIG)
+            proxy.send_data(JSON_DATA, STATION_ID)
+
+        assert data_post.call_count == MAX_NUM_UPLOAD_ATTEMPTS
+        assert sleep_mock.call_count == MAX_NUM_UPLOAD_ATTEMPTS - 1